@@ -0,0 +1,764 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP layer for ArcGIS REST calls.
+Keeps a keep-alive connection pool per host and rate-limits each host with its own token bucket,
+so a slow or strictly throttled host never holds back requests to the others.
+
+Transient failures (connection errors, timeouts, 429 and 5xx gateway errors) are retried with
+jittered exponential backoff, waiting for Retry-After when the server sends one. A per-host circuit
+breaker fails requests fast once a host has failed several times in a row, and lets a single trial
+request through after a cooldown.
+
+Given a HostLatency (host_latency.py), sessions record every response time and, unless the caller
+passes an explicit timeout, wait for each host about as long as its learned p99 instead of a fixed
+30 seconds. With a HedgePolicy as well, a request still unanswered at its host's p95 is sent a second
+time and whichever copy answers first is used, within a small budget of extra requests.
+
+Every response is timed by phase (DNS, connect, TLS, time to first byte, download) with its size. The
+totals are kept per host in the session's RequestTimings, and collect_timings() captures the entries
+for the calls made inside it. aiohttp reports DNS and connect (TCP and TLS together). requests
+only exposes time to first byte, with connection setup included, and download.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # only needed by AsyncArcGISSession
+    aiohttp = None
+
+from host_latency import HostLatency
+from response_cache import CacheEntry, ResponseCache, cache_key
+
+USER_AGENT = 'FEMA Layer Tester/1.0'
+
+# (requests per second, burst size) per host. Lookups fall back to parent domains,
+# so 'arcgis.com' covers every services*.arcgis.com shard not listed explicitly.
+DEFAULT_HOST_RATES: Dict[str, Tuple[float, int]] = {
+    'arcgis.com': (10.0, 20),
+    'services.arcgis.com': (10.0, 20),
+    'services1.arcgis.com': (10.0, 20),
+    'services2.arcgis.com': (10.0, 20),
+    'carto.nationalmap.gov': (4.0, 8),
+}
+DEFAULT_RATE: Tuple[float, int] = (5.0, 10)
+# HTTP statuses worth retrying, and those that also count against a host's circuit breaker
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+BREAKER_STATUSES = {502, 503, 504}
+# Dead hosts usually fail at connect time; don't give them the whole read timeout
+CONNECT_TIMEOUT = 10.0
+# Point at a mock_arcgis.py server (e.g. http://127.0.0.1:8765) to send every request there instead
+MOCK_URL_ENV = 'ARCGIS_MOCK_URL'
+
+
+class TokenBucket:
+    """Thread-safe token bucket; callers reserve a token and sleep for the returned delay."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Going negative queues the caller behind earlier reservations
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def try_acquire(self) -> float:
+        """Take a token only if one is available; returns 0, or the seconds until one will be."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class HostRateLimiter:
+    """Hands out one TokenBucket per host, configured from a host -> (rate, burst) table."""
+
+    def __init__(self, host_rates: Optional[Dict[str, Tuple[float, int]]] = None,
+                 default_rate: Tuple[float, int] = DEFAULT_RATE):
+        self.host_rates = dict(DEFAULT_HOST_RATES if host_rates is None else host_rates)
+        self.default_rate = default_rate
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def rate_for(self, host: str) -> Tuple[float, int]:
+        parts = host.split('.')
+        for i in range(len(parts) - 1):
+            candidate = '.'.join(parts[i:])
+            if candidate in self.host_rates:
+                return self.host_rates[candidate]
+        return self.default_rate
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                rate, burst = self.rate_for(host)
+                self._buckets[host] = TokenBucket(rate, burst)
+            return self._buckets[host]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """How many times, and after how long, a transient failure is retried."""
+
+    def __init__(self, retries: int = 3, base: float = 0.5, cap: float = 30.0, max_retry_after: float = 120.0):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.max_retry_after = max_retry_after
+        self.retried = 0
+
+    def gives_up(self, attempt: int, retry_after: Optional[float] = None) -> bool:
+        """Whether delay() would return None, without counting a retry."""
+        return attempt >= self.retries or (retry_after or 0) > self.max_retry_after
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to wait after failed attempt number attempt (0-based), or None to give up."""
+        if self.gives_up(attempt, retry_after):
+            return None
+        self.retried += 1
+        if retry_after is not None:
+            # A little jitter so throttled callers don't all come back in the same instant
+            return retry_after + random.uniform(0, self.base)
+        # "Full jitter": spreads retries from many callers over the whole backoff window
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class HostUnavailable(requests.ConnectionError):
+    """Raised without a request while a host's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after threshold consecutive failures; after cooldown one trial request decides."""
+
+    def __init__(self, host: str, threshold: int = 5, cooldown: float = 60.0):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self.trial:
+                self.rejected += 1
+                raise HostUnavailable(f"{self.host} is failing; not retrying for {max(remaining, 0):.0f}s")
+            self.trial = True  # half-open: this request decides
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial:
+                # The trial request failed too: stay open for another cooldown
+                self.opened_at = time.monotonic()
+            elif self.threshold and self.failures >= self.threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+            self.trial = False
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per host, shared by every session given the same instance."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.threshold, self.cooldown)
+            return self._breakers[host]
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        breakers = list(self._breakers.values())
+        return {'opened': sorted(b.host for b in breakers if b.times_opened),
+                'rejected': sum(b.rejected for b in breakers)}
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgePolicy:
+    """Budget and bookkeeping for hedged requests, shared by every session given the same instance.
+
+    Every request earns ratio of a token (up to burst) and each duplicate spends one, so hedging
+    never adds more than about ratio extra requests however slow the hosts get.
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        # Latency of each hedgeable request as answered, and as its first copy alone answered
+        # (for requests won by the duplicate, a lower bound if the first copy never finished)
+        self.answered: List[float] = []
+        self.unhedged: List[float] = []
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def admit(self):
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def observe(self, answered: float, hedge_won: bool = False) -> int:
+        with self._lock:
+            self.won += hedge_won
+            self.answered.append(answered)
+            self.unhedged.append(answered)
+            return len(self.unhedged) - 1
+
+    def first_copy_done(self, index: int, seconds: float):
+        with self._lock:
+            self.unhedged[index] = max(self.unhedged[index], seconds)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            answered, unhedged = list(self.answered), list(self.unhedged)
+        return {'requests': self.requests, 'hedged': self.hedged, 'won': self.won,
+                **{f'p{q}': _percentile(answered, q / 100) for q in (50, 95, 99)},
+                **{f'p{q}_unhedged': _percentile(unhedged, q / 100) for q in (50, 95, 99)}}
+
+
+TIMING_PHASES = ('dns', 'connect', 'tls', 'ttfb', 'download')
+
+_timing_log: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar('arcgis_timing_log', default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[List[Dict[str, Any]]]:
+    """Collect the timing entry of every request made inside the block (including async tasks it starts)."""
+    log: List[Dict[str, Any]] = []
+    token = _timing_log.set(log)
+    try:
+        yield log
+    finally:
+        _timing_log.reset(token)
+
+
+class RequestTimings:
+    """Per-host totals of request phases and bytes, shared by every session given the same instance."""
+
+    def __init__(self):
+        self.hosts: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, timing: Dict[str, Any]):
+        log = _timing_log.get()
+        if log is not None:
+            log.append(timing)
+        with self._lock:
+            totals = self.hosts.get(timing['host'])
+            if totals is None:
+                totals = self.hosts[timing['host']] = {'requests': 0, 'bytes': 0}
+            totals['requests'] += 1
+            totals['bytes'] += timing['bytes']
+            for phase in TIMING_PHASES:
+                if timing[phase] is not None:
+                    totals[phase] = totals.get(phase, 0.0) + timing[phase]
+                    totals[f'{phase}_count'] = totals.get(f'{phase}_count', 0) + 1
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Mean seconds per phase (None where never measured) and bytes per host, busiest first."""
+        with self._lock:
+            rows = []
+            for host, totals in self.hosts.items():
+                row = {'host': host, 'requests': totals['requests'], 'bytes': totals['bytes'],
+                       'mean_bytes': totals['bytes'] / totals['requests']}
+                for phase in TIMING_PHASES:
+                    count = totals.get(f'{phase}_count')
+                    row[phase] = totals[phase] / count if count else None
+                rows.append(row)
+        return sorted(rows, key=lambda row: -row['requests'])
+
+
+def _timing(host: str, url: str, status: int, size: int, total: float, ttfb: float, download: float,
+            dns: Optional[float] = None, connect: Optional[float] = None, tls: Optional[float] = None) -> Dict[str, Any]:
+    return {'host': host, 'url': url, 'status': status, 'bytes': size, 'dns': dns, 'connect': connect,
+            'tls': tls, 'ttfb': ttfb, 'download': download, 'total': total}
+
+
+def _trace_config() -> 'aiohttp.TraceConfig':
+    """aiohttp hooks that fill the dict passed as trace_request_ctx with phase timestamps."""
+    trace = aiohttp.TraceConfig()
+
+    def mark(name: str):
+        async def handler(session, context, params):
+            context.trace_request_ctx[name] = time.perf_counter()
+        return handler
+
+    trace.on_request_start.append(mark('start'))
+    trace.on_dns_resolvehost_start.append(mark('dns_start'))
+    trace.on_dns_resolvehost_end.append(mark('dns_end'))
+    trace.on_connection_create_start.append(mark('connect_start'))
+    trace.on_connection_create_end.append(mark('connect_end'))
+    trace.on_request_end.append(mark('headers'))
+    return trace
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def redirect_to(base_url: str) -> Callable[[str], str]:
+    """URL rewrite sending https://host/path?query to <base_url>/host/path?query."""
+    base = base_url.rstrip('/')
+
+    def rewrite(url: str) -> str:
+        parsed = urlparse(url)
+        target = f"{base}/{parsed.netloc.lower()}{parsed.path}"
+        return f"{target}?{parsed.query}" if parsed.query else target
+    return rewrite
+
+
+def default_rewrite() -> Optional[Callable[[str], str]]:
+    base_url = os.environ.get(MOCK_URL_ENV)
+    return redirect_to(base_url) if base_url else None
+
+
+def _cached_json(cache: ResponseCache, key: str, url: str, entry: Optional[CacheEntry],
+                 status: int, body: bytes, headers) -> Dict[str, Any]:
+    """Resolve a (possibly conditional) response against the cache and return its JSON."""
+    if status == 304 and entry is not None:
+        cache.stats['revalidated'] += 1
+        cache.refresh(key)
+        return json.loads(entry.body)
+
+    cache.stats['misses'] += 1
+    data = json.loads(body)
+    # ArcGIS reports many failures as HTTP 200 with an error document; never cache those
+    if not (isinstance(data, dict) and 'error' in data):
+        cache.store(key, url, body, headers.get('ETag'), headers.get('Last-Modified'))
+    return data
+
+
+def _hedge_after(hedge: Optional[HedgePolicy], latency: Optional[HostLatency], host: str) -> Optional[float]:
+    """Seconds after which a request to host is duplicated, or None when it won't be."""
+    if hedge is None or latency is None:
+        return None
+    percentiles = latency.percentiles(host)
+    if percentiles is None:
+        return None
+    hedge.admit()
+    return percentiles['p95']
+
+
+class ArcGISSession:
+    """Blocking client: one requests.Session with a dedicated HTTPAdapter pool per host."""
+
+    def __init__(self, limiter: Optional[HostRateLimiter] = None, pool_maxsize: int = 8,
+                 timeout: float = 30, cache: Optional[ResponseCache] = None,
+                 rewrite: Optional[Callable[[str], str]] = None, retry: Optional[RetryPolicy] = None,
+                 breakers: Optional[CircuitBreakers] = None, latency: Optional[HostLatency] = None,
+                 hedge: Optional[HedgePolicy] = None, timings: Optional[RequestTimings] = None):
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': USER_AGENT
+        })
+        self.limiter = limiter or HostRateLimiter()
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.cache = cache
+        self.rewrite = rewrite or default_rewrite()
+        self.retry = retry or RetryPolicy()
+        self.breakers = breakers or CircuitBreakers()
+        self.latency = latency
+        self.hedge = hedge
+        self.timings = timings or RequestTimings()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._mounted = set()
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self, url: str):
+        # The default adapter only caches 10 host pools, which the crosswalk's ~20 hosts
+        # keep evicting; mounting an adapter per host keeps every connection alive.
+        parsed = urlparse(url)
+        prefix = f"{parsed.scheme}://{parsed.netloc.lower()}/"
+        if prefix in self._mounted:
+            return
+        with self._lock:
+            if prefix not in self._mounted:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                self.session.mount(prefix, adapter)
+                self._mounted.add(prefix)
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+            timeout: Optional[float] = None, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        host = host_of(url)
+        breaker = self.breakers.breaker(host)
+        timeout = timeout or (self.latency.timeout(host, self.timeout) if self.latency else self.timeout)
+        # Rate limits follow the original host even when requests are redirected to a mock
+        target = self.rewrite(url) if self.rewrite else url
+        self._ensure_pool(target)
+        attempt = 0
+        while True:
+            breaker.before_request()
+            self.limiter.bucket(host).acquire()
+            start_time = time.perf_counter()
+            try:
+                response = self._send(host, target, params, (min(CONNECT_TIMEOUT, timeout), timeout), headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.latency and isinstance(e, requests.ReadTimeout):
+                    self.latency.record_timeout(host, time.perf_counter() - start_time)
+                breaker.record_failure()
+                delay = self.retry.delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                elapsed = time.perf_counter() - start_time
+                if self.latency:
+                    self.latency.record(host, elapsed)
+                # requests only tells us when the headers arrived (connection setup included)
+                ttfb = min(response.elapsed.total_seconds(), elapsed)
+                self.timings.add(_timing(host, url, response.status_code, len(response.content), elapsed, ttfb,
+                                         elapsed - ttfb))
+                if response.status_code in BREAKER_STATUSES:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                delay = None
+                if response.status_code in RETRYABLE_STATUSES:
+                    delay = self.retry.delay(attempt, parse_retry_after(response.headers.get('Retry-After')))
+                if delay is None:
+                    response.raise_for_status()
+                    return response
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, host: str, url: str, params: Optional[Dict[str, Any]], timeout: Tuple[float, float],
+              headers: Optional[Dict[str, str]]) -> requests.Response:
+        hedge_after = _hedge_after(self.hedge, self.latency, host)
+        if hedge_after is None:
+            return self.session.get(url, params=params, timeout=timeout, headers=headers)
+
+        def send(duplicate: bool = False) -> requests.Response:
+            if duplicate:
+                self.limiter.bucket(host).acquire()
+            return self.session.get(url, params=params, timeout=timeout, headers=headers)
+
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=2 * self.pool_maxsize,
+                                                      thread_name_prefix='arcgis-hedge')
+        start_time = time.perf_counter()
+        first = self._hedge_pool.submit(send)
+        done, _ = wait([first], timeout=hedge_after)
+        if done or not self.hedge.try_hedge():
+            response = first.result()
+            self.hedge.observe(time.perf_counter() - start_time)
+            return response
+
+        second = self._hedge_pool.submit(send, True)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            answered = [future for future in done if future.exception() is None]
+            if answered:
+                winner = answered[0]
+                index = self.hedge.observe(time.perf_counter() - start_time, winner is second)
+                if winner is second:
+                    # Keep timing the first copy to report what hedging saved
+                    first.add_done_callback(
+                        lambda _, index=index: self.hedge.first_copy_done(index, time.perf_counter() - start_time))
+                return winner.result()
+        # Both copies failed: the first copy's error or retryable status, as without hedging
+        return first.result()
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None, cache: bool = False) -> Dict[str, Any]:
+        """GET and decode JSON; with cache=True the response cache is consulted first."""
+        if not (cache and self.cache):
+            return self.get(url, params=params, timeout=timeout).json()
+
+        key = cache_key(url, params)
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            self.cache.stats['hits'] += 1
+            return json.loads(entry.body)
+
+        headers = entry.conditional_headers() if entry is not None else None
+        response = self.get(url, params=params, timeout=timeout, headers=headers)
+        return _cached_json(self.cache, key, url, entry, response.status_code,
+                            response.content, response.headers)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncArcGISSession:
+    """aiohttp client sharing the same per-host buckets; use as an async context manager."""
+
+    def __init__(self, limiter: Optional[HostRateLimiter] = None, concurrency: int = 32,
+                 per_host: int = 6, timeout: float = 30, headers: Optional[Dict[str, str]] = None,
+                 cache: Optional[ResponseCache] = None, rewrite: Optional[Callable[[str], str]] = None,
+                 retry: Optional[RetryPolicy] = None, breakers: Optional[CircuitBreakers] = None,
+                 latency: Optional[HostLatency] = None, hedge: Optional[HedgePolicy] = None,
+                 timings: Optional[RequestTimings] = None):
+        if aiohttp is None:
+            raise RuntimeError("AsyncArcGISSession requires aiohttp (pip install aiohttp)")
+        self.limiter = limiter or HostRateLimiter()
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.headers = headers or {'User-Agent': USER_AGENT}
+        self.cache = cache
+        self.rewrite = rewrite or default_rewrite()
+        self.retry = retry or RetryPolicy()
+        self.breakers = breakers or CircuitBreakers()
+        self.latency = latency
+        self.hedge = hedge
+        self.timings = timings or RequestTimings()
+        self.session = None
+        self._request_slots = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._stragglers = set()
+
+    async def __aenter__(self):
+        self._request_slots = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=CONNECT_TIMEOUT),
+            headers=self.headers,
+            trace_configs=[_trace_config()]
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # First copies of hedged requests that are still running are no longer needed
+        for task in list(self._stragglers):
+            task.cancel()
+        if self._stragglers:
+            await asyncio.wait(self._stragglers)
+        await self.session.close()
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                       cache: bool = False) -> Dict[str, Any]:
+        """GET and decode JSON; with cache=True the response cache is consulted first."""
+        if not (cache and self.cache):
+            return await self._fetch(url, params)
+
+        key = cache_key(url, params)
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh:
+            self.cache.stats['hits'] += 1
+            return json.loads(entry.body)
+
+        headers = entry.conditional_headers() if entry is not None else None
+        status, body, response_headers = await self._fetch(url, params, headers=headers, raw=True)
+        return _cached_json(self.cache, key, url, entry, status, body, response_headers)
+
+    async def _fetch(self, url: str, params: Optional[Dict[str, Any]] = None,
+                     headers: Optional[Dict[str, str]] = None, raw: bool = False):
+        host = host_of(url)
+        breaker = self.breakers.breaker(host)
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        target = self.rewrite(url) if self.rewrite else url
+
+        attempt = 0
+        while True:
+            breaker.before_request()
+            try:
+                done, result = await self._attempt(host, target, params, headers, raw, attempt, breaker)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                breaker.record_failure()
+                delay = self.retry.delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                if done:
+                    return result
+                # Charged here, once per attempt, even if both hedged copies were turned away
+                delay = self.retry.delay(attempt, result)
+            # Back off without holding a host or request slot
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _attempt(self, host: str, url: str, params: Optional[Dict[str, Any]],
+                       headers: Optional[Dict[str, str]], raw: bool, attempt: int, breaker: CircuitBreaker):
+        """(True, result) on success, or (False, Retry-After seconds or None) for a retryable status."""
+        # Host slot and token first, global slot last: requests queued behind a slow
+        # host wait without occupying capacity that other hosts could use.
+        async with self._host_slots[host]:
+            await self.limiter.bucket(host).acquire_async()
+            async with self._request_slots:
+                start_time = time.perf_counter()
+                try:
+                    timeout = self.latency.timeout(host, self.timeout) if self.latency else None
+                    result = await self._hedged(host, lambda: self._request(host, url, params, headers, raw,
+                                                                            attempt, breaker, timeout))
+                except asyncio.TimeoutError:
+                    if self.latency:
+                        self.latency.record_timeout(host, time.perf_counter() - start_time)
+                    raise
+                except aiohttp.ClientResponseError:
+                    # Error statuses are answers too
+                    if self.latency:
+                        self.latency.record(host, time.perf_counter() - start_time)
+                    raise
+                if self.latency:
+                    self.latency.record(host, time.perf_counter() - start_time)
+                return result
+
+    async def _hedged(self, host: str, request: Callable[[], Any]):
+        hedge_after = _hedge_after(self.hedge, self.latency, host)
+        if hedge_after is None:
+            return await request()
+
+        async def duplicate():
+            await self.limiter.bucket(host).acquire_async()
+            return await request()
+
+        start_time = time.perf_counter()
+        first = asyncio.ensure_future(request())
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done or not self.hedge.try_hedge():
+            result = await first
+            self.hedge.observe(time.perf_counter() - start_time)
+            return result
+
+        second = asyncio.ensure_future(duplicate())
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # A retryable status is a failure here too: the other copy may still succeed
+            answered = [task for task in done if task.exception() is None and task.result()[0]]
+            if answered:
+                winner = answered[0]
+                index = self.hedge.observe(time.perf_counter() - start_time, winner is second)
+                if winner is second and first in pending:
+                    # Let the first copy finish in the background to report what hedging saved
+                    self._stragglers.add(first)
+                    first.add_done_callback(lambda task, index=index: self._straggler_done(task, index, start_time))
+                elif second in pending:
+                    second.cancel()
+                return winner.result()
+        # Both copies failed: the first copy's error or retryable status, as without hedging
+        return first.result()
+
+    def _straggler_done(self, task: asyncio.Future, index: int, start_time: float):
+        self._stragglers.discard(task)
+        if not task.cancelled():
+            task.exception()  # retrieved, so asyncio doesn't log it
+        self.hedge.first_copy_done(index, time.perf_counter() - start_time)
+
+    async def _request(self, host: str, url: str, params: Optional[Dict[str, Any]],
+                       headers: Optional[Dict[str, str]], raw: bool, attempt: int, breaker: CircuitBreaker,
+                       timeout: Optional[float]):
+        # Without a learned timeout the session-wide ClientTimeout applies
+        options = {'timeout': aiohttp.ClientTimeout(total=timeout, sock_connect=CONNECT_TIMEOUT)} if timeout else {}
+        marks: Dict[str, float] = {}
+        async with self.session.get(url, params=params, headers=headers, trace_request_ctx=marks,
+                                    **options) as response:
+            body = await response.read()
+            self.timings.add(self._timing(host, url, response.status, len(body), marks))
+            if response.status in BREAKER_STATUSES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if response.status in RETRYABLE_STATUSES:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if not self.retry.gives_up(attempt, retry_after):
+                    return False, retry_after
+            response.raise_for_status()
+            if raw:
+                return True, (response.status, body, response.headers)
+            # ArcGIS often answers f=json with text/plain, so skip the content-type check
+            return True, await response.json(content_type=None)
+
+    def _timing(self, host: str, url: str, status: int, size: int, marks: Dict[str, float]) -> Dict[str, Any]:
+        end = time.perf_counter()
+        start = marks.get('start', end)
+        headers_at = marks.get('headers', end)
+        # Reused connections (and cached DNS) skip these phases. aiohttp resolves the host inside
+        # connection creation, and its connection hooks cover TCP and TLS together, so tls stays None.
+        dns = marks['dns_end'] - marks['dns_start'] if 'dns_end' in marks else 0.0
+        connect = marks['connect_end'] - marks['connect_start'] - dns if 'connect_end' in marks else 0.0
+        return _timing(host, url, status, size, end - start, headers_at - start - dns - connect, end - headers_at,
+                       dns, connect)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Binary Catalog Snapshot
+Compiles the crosswalk, its categories and the latest layer test status into one versioned file
+that is opened with mmap instead of parsing CSV/JSON on every start.
+
+Layout (little-endian, every section 8-byte aligned):
+    header        magic, format version, column count, row count, string count, source checksum
+    string table  uint32 offsets[string_count + 1] followed by the UTF-8 blob; string 0 means "empty"
+    columns       one uint32[row_count] array of string ids per SNAPSHOT_COLUMNS entry
+    flags         uint8[row_count] FLAG_* bits
+
+The checksum is a SHA-256 of the CSV and layer-test-results.json the snapshot was built from, so a
+snapshot whose sources changed is detected as stale and ignored by load_catalog().
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, List, Optional
+
+from hifld_catalog import (COLUMN_ATTRS, CROSSWALK_CSV, REPO_DIR, TEST_RESULTS_JSON, Catalog, CatalogLayer,
+                           load_crosswalk)
+
+SNAPSHOT_PATH = os.path.join(REPO_DIR, '.cache', 'hifld-catalog.snapshot')
+MAGIC = b'HIFLDSNP'
+FORMAT_VERSION = 1
+
+# Stored string columns, in file order; bump FORMAT_VERSION when this changes
+SNAPSHOT_COLUMNS = tuple(COLUMN_ATTRS.values()) + ('test_status', 'last_tested')
+
+HEADER = struct.Struct('<8sHHII32s')
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def source_checksum(csv_path: str = CROSSWALK_CSV, results_path: str = TEST_RESULTS_JSON) -> bytes:
+    digest = hashlib.sha256()
+    for path in (csv_path, results_path):
+        digest.update(path.encode('utf-8') + b'\0')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def build_snapshot(output: str = SNAPSHOT_PATH, csv_path: str = CROSSWALK_CSV,
+                   results_path: str = TEST_RESULTS_JSON) -> str:
+    """Compile the catalog sources into a snapshot file and return its path."""
+    if sys.byteorder != 'little':
+        raise RuntimeError("Snapshots are written in little-endian order and mapped natively")
+
+    layers = [CatalogLayer(i + 1, row) for i, row in enumerate(load_crosswalk(csv_path))]
+    statuses: Dict[str, Dict[str, object]] = {}
+    if os.path.exists(results_path):
+        with open(results_path, encoding='utf-8') as f:
+            statuses = {layer['name'].strip(): layer for layer in json.load(f).get('results', [])}
+    for layer in layers:
+        result = statuses.get(layer.name)
+        if result is not None:
+            layer.test_status = result.get('testStatus')
+            layer.last_tested = result.get('lastTested')
+
+    strings: List[str] = ['']
+    string_ids: Dict[str, int] = {'': 0}
+    columns = []
+    for attr in SNAPSHOT_COLUMNS:
+        ids = []
+        for layer in layers:
+            value = getattr(layer, attr) or ''
+            if value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+            ids.append(string_ids[value])
+        columns.append(ids)
+
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = [0]
+    for blob in encoded:
+        offsets.append(offsets[-1] + len(blob))
+
+    rows = len(layers)
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, len(SNAPSHOT_COLUMNS), rows, len(strings),
+                         source_checksum(csv_path, results_path))]
+    parts.append(struct.pack(f'<{len(offsets)}I', *offsets))
+    parts.append(b''.join(encoded))
+    for ids in columns:
+        parts.append(struct.pack(f'<{rows}I', *ids))
+    parts.append(bytes(layer.flags for layer in layers))
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    tmp_path = output + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for part in parts:
+            f.write(part)
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+    os.replace(tmp_path, output)
+    return output
+
+
+class CatalogSnapshot:
+    """Read-only, memory-mapped view of a snapshot; columns are memoryviews into the file."""
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+
+        magic, version, column_count, rows, string_count, checksum = HEADER.unpack_from(view)
+        if magic != MAGIC or version != FORMAT_VERSION or column_count != len(SNAPSHOT_COLUMNS):
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} catalog snapshot")
+        self.rows = rows
+        self.checksum = checksum
+
+        offset = _align(HEADER.size)
+        self._string_offsets = view[offset:offset + 4 * (string_count + 1)].cast('I')
+        offset = _align(offset + 4 * (string_count + 1))
+        blob_size = self._string_offsets[string_count]
+        self._blob = view[offset:offset + blob_size]
+        offset = _align(offset + blob_size)
+
+        self.columns = {}
+        for attr in SNAPSHOT_COLUMNS:
+            self.columns[attr] = view[offset:offset + 4 * rows].cast('I')
+            offset = _align(offset + 4 * rows)
+        self.flags = view[offset:offset + rows]
+        self._strings: Dict[int, Optional[str]] = {0: None}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def string(self, string_id: int) -> Optional[str]:
+        if string_id not in self._strings:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            # Decoded once per distinct string, so repeated agencies/statuses share one object
+            self._strings[string_id] = str(self._blob[start:end], 'utf-8')
+        return self._strings[string_id]
+
+    def value(self, row: int, attr: str) -> Optional[str]:
+        return self.string(self.columns[attr][row])
+
+    def is_stale(self, csv_path: str = CROSSWALK_CSV, results_path: str = TEST_RESULTS_JSON) -> bool:
+        return self.checksum != source_checksum(csv_path, results_path)
+
+    def to_catalog(self) -> Catalog:
+        columns = {attr: self.columns[attr].tolist() for attr in SNAPSHOT_COLUMNS}
+        string = self.string
+        layers = []
+        for row, flags in enumerate(self.flags):
+            values = {attr: string(ids[row]) for attr, ids in columns.items()}
+            layers.append(CatalogLayer.from_values(
+                row + 1, values, flags, values.pop('test_status'), values.pop('last_tested')
+            ))
+        return Catalog(layers)
+
+    def close(self):
+        # Release exported memoryviews before closing the map
+        for name in ('_string_offsets', '_blob', 'flags'):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        for view in self.__dict__.pop('columns', {}).values():
+            view.release()
+        self._map.close()
+
+
+def load_fresh_snapshot(path: str = SNAPSHOT_PATH) -> Optional[CatalogSnapshot]:
+    """Open the snapshot if it exists, is readable and matches the current sources."""
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = CatalogSnapshot(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if snapshot.is_stale():
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the binary HIFLD catalog snapshot")
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--output', default=SNAPSHOT_PATH, help="snapshot file to write or read")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        path = build_snapshot(args.output)
+        print(f"Snapshot written to: {path} ({os.path.getsize(path)} bytes)")
+        return
+
+    snapshot = CatalogSnapshot(args.output)
+    print(f"Snapshot: {args.output}")
+    print(f"Layers: {len(snapshot)}")
+    print(f"Status: {'STALE - rebuild with: python3 catalog_snapshot.py build' if snapshot.is_stale() else 'fresh'}")
+    snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Esri JSON Geometry Conversion
+Converts the geometries returned by ArcGIS /query (f=json) to and from OGC Well-Known Binary,
+the encoding the local feature store keeps, and to GeoJSON geometry objects (rings reoriented
+per RFC 7946).
+
+Only x/y are kept; z and m values are dropped. Polygon rings follow the Esri convention: a
+clockwise ring starts a new polygon and the counter-clockwise rings after it are its holes.
+"""
+
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOINT = 4
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+
+# ArcGIS geometryType -> WKB type names, for GeoParquet metadata
+GEOMETRY_TYPE_NAMES = {
+    'esriGeometryPoint': ['Point'],
+    'esriGeometryMultipoint': ['MultiPoint'],
+    'esriGeometryPolyline': ['LineString', 'MultiLineString'],
+    'esriGeometryPolygon': ['Polygon', 'MultiPolygon']
+}
+
+_HEADER = struct.Struct('<BI')
+_COUNT = struct.Struct('<I')
+_XY = struct.Struct('<2d')
+
+
+def ring_area(ring: Sequence[Sequence[float]]) -> float:
+    """Signed shoelace area; negative for clockwise rings (Esri outer rings)."""
+    area = 0.0
+    for (x1, y1, *_), (x2, y2, *_) in zip(ring, ring[1:]):
+        area += x1 * y2 - x2 * y1
+    return area / 2
+
+
+def group_rings(rings: Sequence[Sequence[Sequence[float]]]) -> List[List[Sequence[Sequence[float]]]]:
+    """Split Esri polygon rings into polygons of [outer, *holes]."""
+    polygons: List[List[Sequence[Sequence[float]]]] = []
+    for ring in rings:
+        if len(ring) < 4:
+            continue
+        if ring_area(ring) < 0 or not polygons:
+            polygons.append([ring])
+        else:
+            polygons[-1].append(ring)
+    return polygons
+
+
+def _points(coords: Sequence[Sequence[float]]) -> bytes:
+    return _COUNT.pack(len(coords)) + b''.join(_XY.pack(c[0], c[1]) for c in coords)
+
+
+def _polygon(rings: Sequence[Sequence[Sequence[float]]]) -> bytes:
+    return _COUNT.pack(len(rings)) + b''.join(_points(ring) for ring in rings)
+
+
+def to_wkb(geometry: Optional[Dict[str, Any]]) -> Optional[bytes]:
+    """Little-endian WKB for an Esri JSON geometry, or None for a null/empty one."""
+    if not geometry:
+        return None
+    if 'x' in geometry:
+        if geometry['x'] is None or geometry.get('y') is None:
+            return None
+        return _HEADER.pack(1, WKB_POINT) + _XY.pack(geometry['x'], geometry['y'])
+    if geometry.get('points'):
+        parts = [_HEADER.pack(1, WKB_POINT) + _XY.pack(p[0], p[1]) for p in geometry['points']]
+        return _HEADER.pack(1, WKB_MULTIPOINT) + _COUNT.pack(len(parts)) + b''.join(parts)
+    if geometry.get('paths'):
+        paths = geometry['paths']
+        if len(paths) == 1:
+            return _HEADER.pack(1, WKB_LINESTRING) + _points(paths[0])
+        parts = [_HEADER.pack(1, WKB_LINESTRING) + _points(path) for path in paths]
+        return _HEADER.pack(1, WKB_MULTILINESTRING) + _COUNT.pack(len(parts)) + b''.join(parts)
+    if geometry.get('rings'):
+        polygons = group_rings(geometry['rings'])
+        if not polygons:
+            return None
+        if len(polygons) == 1:
+            return _HEADER.pack(1, WKB_POLYGON) + _polygon(polygons[0])
+        parts = [_HEADER.pack(1, WKB_POLYGON) + _polygon(rings) for rings in polygons]
+        return _HEADER.pack(1, WKB_MULTIPOLYGON) + _COUNT.pack(len(parts)) + b''.join(parts)
+    return None
+
+
+def _read_points(data: memoryview, offset: int) -> Tuple[List[List[float]], int]:
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    coords = np.frombuffer(data, dtype='<f8', count=count * 2, offset=offset).reshape(count, 2).tolist()
+    return coords, offset + count * _XY.size
+
+
+def _read_geometry(data: memoryview, offset: int) -> Tuple[Dict[str, Any], int]:
+    byte_order, wkb_type = _HEADER.unpack_from(data, offset)
+    if byte_order != 1:
+        raise ValueError("Only little-endian WKB is supported")
+    offset += _HEADER.size
+    if wkb_type == WKB_POINT:
+        return {'type': 'Point', 'coordinates': list(_XY.unpack_from(data, offset))}, offset + _XY.size
+    if wkb_type == WKB_LINESTRING:
+        coords, offset = _read_points(data, offset)
+        return {'type': 'LineString', 'coordinates': coords}, offset
+    if wkb_type == WKB_POLYGON:
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        rings = []
+        for _ in range(count):
+            ring, offset = _read_points(data, offset)
+            rings.append(ring)
+        return {'type': 'Polygon', 'coordinates': rings}, offset
+    if wkb_type in (WKB_MULTIPOINT, WKB_MULTILINESTRING, WKB_MULTIPOLYGON):
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        parts = []
+        for _ in range(count):
+            part, offset = _read_geometry(data, offset)
+            parts.append(part['coordinates'])
+        name = {WKB_MULTIPOINT: 'MultiPoint', WKB_MULTILINESTRING: 'MultiLineString',
+                WKB_MULTIPOLYGON: 'MultiPolygon'}[wkb_type]
+        return {'type': name, 'coordinates': parts}, offset
+    raise ValueError(f"Unsupported WKB geometry type {wkb_type}")
+
+
+def _rfc7946_rings(rings: List[List[List[float]]]) -> List[List[List[float]]]:
+    """Outer ring counter-clockwise, holes clockwise, as RFC 7946 requires (Esri has it the other way)."""
+    return [ring[::-1] if (ring_area(ring) < 0) == (i == 0) else ring for i, ring in enumerate(rings)]
+
+
+def wkb_to_geojson(wkb: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    """GeoJSON geometry object for WKB written by to_wkb(), with RFC 7946 ring orientation."""
+    if wkb is None:
+        return None
+    geometry, _ = _read_geometry(memoryview(wkb), 0)
+    if geometry['type'] == 'Polygon':
+        geometry['coordinates'] = _rfc7946_rings(geometry['coordinates'])
+    elif geometry['type'] == 'MultiPolygon':
+        geometry['coordinates'] = [_rfc7946_rings(rings) for rings in geometry['coordinates']]
+    return geometry
+
+
+def wkb_to_esri(wkb: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    """Esri JSON geometry for WKB written by to_wkb() (rings keep their Esri orientation)."""
+    if wkb is None:
+        return None
+    geometry, _ = _read_geometry(memoryview(wkb), 0)
+    kind, coords = geometry['type'], geometry['coordinates']
+    if kind == 'Point':
+        return {'x': coords[0], 'y': coords[1]}
+    if kind == 'MultiPoint':
+        return {'points': coords}
+    if kind == 'LineString':
+        return {'paths': [coords]}
+    if kind == 'MultiLineString':
+        return {'paths': coords}
+    if kind == 'Polygon':
+        return {'rings': coords}
+    return {'rings': [ring for polygon in coords for ring in polygon]}
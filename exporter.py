@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Streaming Feature Exporter
+Writes a stored layer (feature_store.py) or a live layer (feature_extractor.py) to GeoJSON,
+newline-delimited GeoJSON or FlatGeobuf one batch at a time, so memory stays flat however large
+the layer is.
+
+    python3 exporter.py <open_id> hospitals.geojson
+    python3 exporter.py https://services.arcgis.com/.../FeatureServer/0 towers.ndjson --bbox -95,29,-94,30
+    python3 exporter.py <open_id> hospitals.fgb        # requires GDAL's Python bindings (osgeo)
+
+Stored layers are read record batch by record batch from the memory-mapped Arrow file; live layers
+are written as each page arrives. Files are written under a temporary name and renamed when done.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+
+from esri_geometry import to_wkb, wkb_to_geojson
+from feature_extractor import (LayerExtractor, add_generalization_arguments, generalization_from_args,
+                               spatial_filter_from_args)
+from feature_store import FEATURE_STORE_DIR, GEOMETRY_COLUMN, FeatureStore
+
+FORMATS = {
+    '.geojson': 'geojson',
+    '.json': 'geojson',
+    '.ndjson': 'ndjson',
+    '.geojsonl': 'ndjson',
+    '.geojsons': 'ndjson',
+    '.fgb': 'flatgeobuf'
+}
+
+# FeatureStore geometry_type metadata -> OGR geometry type names
+OGR_GEOMETRY_TYPES = {
+    'esriGeometryPoint': 'wkbPoint',
+    'esriGeometryMultipoint': 'wkbMultiPoint',
+    'esriGeometryPolyline': 'wkbMultiLineString',
+    'esriGeometryPolygon': 'wkbMultiPolygon'
+}
+
+# ArcGIS field types -> the kinds write_flatgeobuf declares; anything else is written as a string
+ESRI_FIELD_KINDS = {
+    'esriFieldTypeOID': 'integer',
+    'esriFieldTypeSmallInteger': 'integer',
+    'esriFieldTypeInteger': 'integer',
+    'esriFieldTypeBigInteger': 'integer',
+    'esriFieldTypeSingle': 'real',
+    'esriFieldTypeDouble': 'real'
+}
+
+Row = Tuple[Dict[str, Any], Optional[bytes]]
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def schema_fields(schema: pa.Schema) -> List[Dict[str, str]]:
+    """{'name', 'kind'} for each attribute column of a stored layer, from its Arrow types."""
+    fields = []
+    for field in schema:
+        if field.name == GEOMETRY_COLUMN:
+            continue
+        if pa.types.is_integer(field.type) or pa.types.is_boolean(field.type):
+            kind = 'integer'
+        elif pa.types.is_floating(field.type) or pa.types.is_decimal(field.type):
+            kind = 'real'
+        else:
+            kind = 'string'
+        fields.append({'name': field.name, 'kind': kind})
+    return fields
+
+
+def layer_fields(layer_info: Dict[str, Any]) -> List[Dict[str, str]]:
+    """{'name', 'kind'} for each field of a live layer, from its ?f=json field types."""
+    return [{'name': field['name'], 'kind': ESRI_FIELD_KINDS.get(field.get('type'), 'string')}
+            for field in layer_info.get('fields') or [] if field.get('type') != 'esriFieldTypeGeometry']
+
+
+def store_rows(store: FeatureStore, open_id: str) -> Iterator[List[Row]]:
+    """(properties, WKB) rows of a stored layer, one record batch at a time."""
+    reader = pa.ipc.open_file(pa.memory_map(store.path(open_id), 'r'))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        columns = {name: batch.column(name).to_pylist() for name in batch.schema.names if name != GEOMETRY_COLUMN}
+        geometries = batch.column(GEOMETRY_COLUMN).to_pylist()
+        yield [({name: values[row] for name, values in columns.items()}, geometries[row])
+               for row in range(batch.num_rows)]
+
+
+def extractor_rows(extractor: LayerExtractor) -> Iterator[List[Row]]:
+    """(properties, WKB) rows of a live layer, one page at a time."""
+    generalization = extractor.generalization
+    for batch in extractor.iter_batches():
+        rows = []
+        for feature in batch:
+            geometry = feature.get('geometry')
+            if generalization:
+                geometry = generalization.apply(geometry)
+            rows.append((feature.get('attributes') or {}, to_wkb(geometry)))
+        yield rows
+
+
+def geojson_feature(properties: Dict[str, Any], wkb: Optional[bytes]) -> str:
+    return json.dumps({'type': 'Feature', 'geometry': wkb_to_geojson(wkb), 'properties': properties},
+                      separators=(',', ':'), ensure_ascii=False, default=_json_default)
+
+
+def write_geojson(batches: Iterator[List[Row]], f, metadata: Dict[str, Any]) -> int:
+    f.write('{"type":"FeatureCollection",')
+    if metadata.get('name'):
+        f.write(f'"name":{json.dumps(metadata["name"])},')
+    f.write('"features":[\n')
+    count = 0
+    for rows in batches:
+        for properties, wkb in rows:
+            if count:
+                f.write(',\n')
+            f.write(geojson_feature(properties, wkb))
+            count += 1
+    f.write('\n]}\n')
+    return count
+
+
+def write_ndjson(batches: Iterator[List[Row]], f, metadata: Dict[str, Any]) -> int:
+    count = 0
+    for rows in batches:
+        f.write(''.join(geojson_feature(properties, wkb) + '\n' for properties, wkb in rows))
+        count += len(rows)
+    return count
+
+
+def write_flatgeobuf(batches: Iterator[List[Row]], path: str, metadata: Dict[str, Any]) -> int:
+    """FlatGeobuf through GDAL/OGR, without the spatial index so features stream straight to disk.
+
+    Field types come from metadata['fields'] ({'name', 'kind'}, see schema_fields / layer_fields); without
+    them they are guessed from the first row.
+    """
+    try:
+        from osgeo import ogr, osr
+    except ImportError:
+        raise RuntimeError("FlatGeobuf export requires GDAL's Python bindings (pip install gdal)")
+    ogr.UseExceptions()
+
+    spatial_reference = osr.SpatialReference()
+    spatial_reference.ImportFromEPSG(4326)
+    spatial_reference.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    datasource = ogr.GetDriverByName('FlatGeobuf').CreateDataSource(path)
+    geometry_type = getattr(ogr, OGR_GEOMETRY_TYPES.get(metadata.get('geometry_type'), 'wkbUnknown'))
+    layer = datasource.CreateLayer(metadata.get('name') or 'features', spatial_reference, geometry_type,
+                                   ['SPATIAL_INDEX=NO'])
+    field_types = {'integer': ogr.OFTInteger64, 'real': ogr.OFTReal, 'string': ogr.OFTString}
+    value_kinds = {int: 'integer', float: 'real'}
+    fields: Optional[List[str]] = None
+
+    count = 0
+    for rows in batches:
+        for properties, wkb in rows:
+            if fields is None:
+                # Field definitions have to exist before the first feature is written
+                kinds = {field['name']: field['kind'] for field in metadata.get('fields') or []} or {
+                    name: value_kinds.get(type(value), 'string') for name, value in properties.items()}
+                fields = list(kinds)
+                for name, kind in kinds.items():
+                    layer.CreateField(ogr.FieldDefn(name, field_types[kind]))
+                definition = layer.GetLayerDefn()
+            feature = ogr.Feature(definition)
+            for name in fields:
+                value = properties.get(name)
+                if value is None:
+                    continue
+                if isinstance(value, (datetime, date)):
+                    value = value.isoformat()
+                if isinstance(value, bool):
+                    value = int(value)
+                feature.SetField(name, value if isinstance(value, (int, float, str)) else str(value))
+            if wkb is not None:
+                geometry = ogr.CreateGeometryFromWkb(wkb)
+                if geometry_type != ogr.wkbUnknown and geometry.GetGeometryType() != geometry_type:
+                    geometry = ogr.ForceTo(geometry, geometry_type)
+                feature.SetGeometry(geometry)
+            layer.CreateFeature(feature)
+            count += 1
+    datasource = None  # flushes and closes the file
+    return count
+
+
+def export(batches: Iterator[List[Row]], output: str, metadata: Optional[Dict[str, Any]] = None,
+           output_format: Optional[str] = None) -> int:
+    """Write rows to output in the format named (or implied by its extension); returns the feature count."""
+    metadata = metadata or {}
+    output_format = output_format or FORMATS.get(os.path.splitext(output)[1].lower(), 'geojson')
+    # GDAL's FlatGeobuf driver writes a directory unless the name ends in .fgb
+    tmp_path = output + ('.tmp.fgb' if output_format == 'flatgeobuf' else '.tmp')
+    try:
+        if output_format == 'flatgeobuf':
+            count = write_flatgeobuf(batches, tmp_path, metadata)
+        else:
+            writer = write_ndjson if output_format == 'ndjson' else write_geojson
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                count = writer(batches, f, metadata)
+    except BaseException:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a stored or live layer to GeoJSON, NDJSON or FlatGeobuf")
+    parser.add_argument('source', help="Open ID of a stored layer, or a layer URL to download from")
+    parser.add_argument('output', help="file to write; .geojson, .ndjson/.geojsonl or .fgb")
+    parser.add_argument('--format', choices=sorted(set(FORMATS.values())), default=None)
+    parser.add_argument('--store', default=FEATURE_STORE_DIR, help="feature store directory")
+    parser.add_argument('--where', default='1=1', help="attribute filter (live layers)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--bbox', default=None, metavar='XMIN,YMIN,XMAX,YMAX')
+    parser.add_argument('--polygon', default=None, metavar='GEOJSON')
+    add_generalization_arguments(parser)
+    args = parser.parse_args()
+
+    live = args.source.startswith(('http://', 'https://'))
+    live_only = [option for option, used in (('--where', args.where != '1=1'), ('--bbox', args.bbox),
+                                             ('--polygon', args.polygon), ('--generalize', args.generalize),
+                                             ('--zoom', args.zoom is not None),
+                                             ('--tolerance', args.tolerance is not None),
+                                             ('--precision', args.precision is not None)) if used]
+    if live_only and not live:
+        parser.error(f"{', '.join(live_only)} can only be used with a layer URL; stored layers are exported whole")
+
+    start_time = time.time()
+    if live:
+        extractor = LayerExtractor(args.source, where=args.where, workers=args.workers,
+                                   spatial_filter=spatial_filter_from_args(args.bbox, args.polygon),
+                                   generalization=generalization_from_args(args.generalize, args.zoom,
+                                                                           args.tolerance, args.precision))
+        info = extractor.layer_info()
+        metadata = {'name': info.get('name'), 'geometry_type': info.get('geometryType'), 'fields': layer_fields(info)}
+        batches = extractor_rows(extractor)
+    else:
+        store = FeatureStore(args.store)
+        metadata = store.metadata(args.source)
+        metadata['fields'] = schema_fields(pa.ipc.open_file(pa.memory_map(store.path(args.source), 'r')).schema)
+        batches = store_rows(store, args.source)
+
+    try:
+        count = export(batches, args.output, metadata, args.format)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+    print(f"Exported {count} features to {args.output} in {time.time() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
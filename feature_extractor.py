@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+ArcGIS Feature Extractor
+Streams every feature of a FeatureServer/MapServer layer through /query in bounded batches.
+
+Layers that advertise supportsPagination are paged with resultOffset/resultRecordCount, with up to
+`workers` pages in flight at once; other layers fall back to walking sorted object-ID ranges.
+Either way at most a window of pages is held in memory, so national layers can be streamed into
+a file or store without loading them whole.
+
+For very large layers iter_partitions() avoids offset paging altogether (which gets slower with every
+page on the server): it splits the returnIdsOnly result into fixed-size OBJECTID BETWEEN ranges,
+fetches them in parallel and retries each failed range on its own.
+
+A SpatialFilter (bbox or polygon) restricts every query to an area. Filters too large or detailed
+for one request are split into tiles that are extracted concurrently and deduplicated by object ID.
+"""
+
+import argparse
+import itertools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+from arcgis_http import ArcGISSession
+from generalize import PROFILES, Generalization
+from spatial_filter import SpatialFilter
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_WORKERS = 4
+CHUNK_RETRIES = 3
+RETRY_BACKOFF = 1.0
+# Marks the end of one tile's pages on the queue shared by tile workers
+TILE_DONE = object()
+
+
+class ArcGISError(RuntimeError):
+    """An ArcGIS REST error document returned with HTTP 200."""
+
+
+def check_response(data: Dict[str, Any]) -> Dict[str, Any]:
+    if isinstance(data, dict) and isinstance(data.get('error'), dict):
+        error = data['error']
+        raise ArcGISError(f"{error.get('code')}: {error.get('message')} {error.get('details') or ''}".strip())
+    return data
+
+
+def object_id_field(layer_info: Dict[str, Any]) -> str:
+    """The layer's object-ID field: objectIdField, else its esriFieldTypeOID field, else OBJECTID."""
+    if layer_info.get('objectIdField'):
+        return layer_info['objectIdField']
+    for field in layer_info.get('fields') or []:
+        if field.get('type') == 'esriFieldTypeOID':
+            return field['name']
+    return 'OBJECTID'
+
+
+def _put_unless_stopped(pages: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """Block until item is queued; False if stop is set first."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class LayerExtractor:
+    """Pulls features from one layer URL (e.g. .../FeatureServer/0)."""
+
+    def __init__(self, layer_url: str, http: Optional[ArcGISSession] = None, where: str = '1=1',
+                 out_fields: str = '*', return_geometry: bool = True, out_sr: Optional[int] = 4326,
+                 page_size: Optional[int] = None, workers: int = DEFAULT_WORKERS,
+                 layer_info: Optional[Dict[str, Any]] = None, spatial_filter: Optional[SpatialFilter] = None,
+                 generalization: Optional[Generalization] = None):
+        self.layer_url = layer_url.rstrip('/')
+        self.http = http or ArcGISSession()
+        self.where = where
+        self.out_fields = out_fields
+        self.return_geometry = return_geometry
+        self.out_sr = out_sr
+        self.page_size = page_size
+        self.workers = max(1, workers)
+        self.spatial_filter = spatial_filter
+        # Only the server-side half (maxAllowableOffset / geometryPrecision) applies here
+        self.generalization = generalization
+        # A ?f=json document already fetched elsewhere (e.g. by the layer tester) can be reused
+        self._info = layer_info
+
+    @property
+    def query_url(self) -> str:
+        return f"{self.layer_url}/query"
+
+    def layer_info(self) -> Dict[str, Any]:
+        """The layer's ?f=json document (fields, geometryType, maxRecordCount, capabilities)."""
+        if self._info is None:
+            self._info = check_response(self.http.get_json(f"{self.layer_url}?f=json", cache=True))
+        return self._info
+
+    @property
+    def object_id_field(self) -> str:
+        return object_id_field(self.layer_info())
+
+    @property
+    def supports_pagination(self) -> bool:
+        capabilities = self.layer_info().get('advancedQueryCapabilities') or {}
+        return bool(capabilities.get('supportsPagination'))
+
+    @property
+    def batch_size(self) -> int:
+        server_max = self.layer_info().get('maxRecordCount') or DEFAULT_PAGE_SIZE
+        return min(self.page_size or server_max, server_max)
+
+    def base_params(self) -> Dict[str, Any]:
+        params = {
+            'where': self.where,
+            'outFields': self.out_fields,
+            'returnGeometry': 'true' if self.return_geometry else 'false',
+            'f': 'json'
+        }
+        if self.out_sr is not None:
+            params['outSR'] = self.out_sr
+        if self.spatial_filter is not None:
+            params.update(self.spatial_filter.params())
+        if self.generalization:
+            params.update(self.generalization.query_params())
+        return params
+
+    def query(self, **extra: Any) -> Dict[str, Any]:
+        params = self.base_params()
+        params.update(extra)
+        return check_response(self.http.get_json(self.query_url, params=params))
+
+    def count(self) -> int:
+        return int(self.query(returnCountOnly='true', returnGeometry='false').get('count', 0))
+
+    def object_ids(self) -> List[int]:
+        result = self.query(returnIdsOnly='true', returnGeometry='false')
+        return sorted(result.get('objectIds') or [])
+
+    def features_by_ids(self, ids: Sequence[int], chunk_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the features with the given object IDs, chunk_size IDs per request."""
+        ids = sorted(ids)
+        size = min(chunk_size, self.batch_size)
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            yield self.query(objectIds=','.join(map(str, chunk))).get('features', [])
+
+    def iter_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """Yield lists of Esri JSON features, at most batch_size each."""
+        if self.spatial_filter is not None and self.spatial_filter.should_tile():
+            yield from self._iter_tiles()
+        elif self.supports_pagination:
+            yield from self._iter_offset_pages()
+        else:
+            yield from self._iter_oid_ranges()
+
+    def iter_features(self) -> Iterator[Dict[str, Any]]:
+        for batch in self.iter_batches():
+            yield from batch
+
+    def _fetch_page(self, offset: int, size: int) -> List[Dict[str, Any]]:
+        result = self.query(resultOffset=offset, resultRecordCount=size,
+                            orderByFields=self.object_id_field)
+        return result.get('features', [])
+
+    def _iter_offset_pages(self) -> Iterator[List[Dict[str, Any]]]:
+        size = self.batch_size
+        total = self.count()
+        offsets = range(0, total, size)
+        if self.workers == 1:
+            for offset in offsets:
+                yield self._fetch_page(offset, size)
+            return
+
+        # Keep a sliding window of `workers` pages in flight and yield them in order
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = []
+            for offset in offsets:
+                pending.append(pool.submit(self._fetch_page, offset, size))
+                if len(pending) >= self.workers:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+
+    def oid_ranges(self, chunk_size: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(first, last) object IDs of consecutive chunk_size slices of the sorted ID list."""
+        ids = self.object_ids()
+        size = min(chunk_size or self.batch_size, self.batch_size)
+        return [(ids[start], ids[min(start + size, len(ids)) - 1]) for start in range(0, len(ids), size)]
+
+    def _fetch_range(self, first: int, last: int) -> List[Dict[str, Any]]:
+        where = f"({self.where}) AND {self.object_id_field} BETWEEN {first} AND {last}"
+        return self.query(where=where).get('features', [])
+
+    def _fetch_range_with_retries(self, first: int, last: int, retries: int) -> List[Dict[str, Any]]:
+        for attempt in range(retries + 1):
+            try:
+                return self._fetch_range(first, last)
+            except (requests.RequestException, ArcGISError, ValueError):
+                if attempt == retries:
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    def _iter_oid_ranges(self) -> Iterator[List[Dict[str, Any]]]:
+        for first, last in self.oid_ranges():
+            yield self._fetch_range(first, last)
+
+    def _stream_tile(self, tile: SpatialFilter, out_fields: str, pages: queue.Queue, stop: threading.Event):
+        """Put the tile's pages on pages as they arrive, then TILE_DONE (or the exception raised)."""
+        extractor = LayerExtractor(self.layer_url, http=self.http, where=self.where, out_fields=out_fields,
+                                   return_geometry=self.return_geometry, out_sr=self.out_sr,
+                                   page_size=self.page_size, workers=1, layer_info=self.layer_info(),
+                                   spatial_filter=tile, generalization=self.generalization)
+        try:
+            for batch in extractor.iter_batches():
+                if not _put_unless_stopped(pages, batch, stop):
+                    return
+        except Exception as e:
+            _put_unless_stopped(pages, e, stop)
+            return
+        _put_unless_stopped(pages, TILE_DONE, stop)
+
+    def _iter_tiles(self) -> Iterator[List[Dict[str, Any]]]:
+        # A feature crossing a tile edge is returned by both tiles; keep the first copy
+        oid_field = self.object_id_field
+        # The object ID is needed for that even when out_fields leaves it out
+        out_fields = self.out_fields
+        requested = {name.strip().lower() for name in out_fields.split(',')}
+        if '*' not in requested and oid_field.lower() not in requested:
+            out_fields = f"{out_fields},{oid_field}"
+        seen = set()
+        tiles = iter(self.spatial_filter.tiles())
+        # Workers hand over one page at a time, so memory stays near a page per tile in flight
+        pages = queue.Queue(maxsize=self.workers)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                running = 0
+                for tile in itertools.islice(tiles, self.workers):
+                    pool.submit(self._stream_tile, tile, out_fields, pages, stop)
+                    running += 1
+                while running:
+                    batch = pages.get()
+                    if batch is TILE_DONE:
+                        running -= 1
+                        next_tile = next(tiles, None)
+                        if next_tile is not None:
+                            pool.submit(self._stream_tile, next_tile, out_fields, pages, stop)
+                            running += 1
+                        continue
+                    if isinstance(batch, Exception):
+                        raise batch
+                    fresh = []
+                    for feature in batch:
+                        object_id = (feature.get('attributes') or {}).get(oid_field)
+                        if object_id is None:
+                            # Deduplicating on None would drop every feature after the first
+                            raise ArcGISError(f"Tiled query returned a feature without {oid_field}")
+                        if object_id not in seen:
+                            seen.add(object_id)
+                            fresh.append(feature)
+                    if fresh:
+                        yield fresh
+            finally:
+                # Unblocks workers waiting to hand over a page if the caller stops early or a tile failed
+                stop.set()
+
+    def iter_partitions(self, chunk_size: Optional[int] = None,
+                        retries: int = CHUNK_RETRIES) -> Iterator[List[Dict[str, Any]]]:
+        """Yield features by object-ID range, `workers` ranges in parallel, in completion order.
+
+        Each range is retried on its own up to `retries` times; a range that still fails raises.
+        """
+        ranges = iter(self.oid_ranges(chunk_size))
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            for first, last in ranges:
+                pending.add(pool.submit(self._fetch_range_with_retries, first, last, retries))
+                if len(pending) >= self.workers:
+                    break
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                    next_range = next(ranges, None)
+                    if next_range is not None:
+                        pending.add(pool.submit(self._fetch_range_with_retries, *next_range, retries))
+
+
+def resolve_layer_url(url: str, http: Optional[ArcGISSession] = None) -> str:
+    """Layer URL for a crosswalk service URL; a bare FeatureServer/MapServer resolves to its first layer."""
+    url = url.rstrip('/')
+    if url.rsplit('/', 1)[-1].isdigit():
+        return url
+    http = http or ArcGISSession()
+    layers = check_response(http.get_json(f"{url}?f=json", cache=True)).get('layers') or []
+    if not layers:
+        raise ArcGISError(f"{url} has no layers")
+    return f"{url}/{layers[0]['id']}"
+
+
+def spatial_filter_from_args(bbox: Optional[str], polygon: Optional[str]) -> Optional[SpatialFilter]:
+    """SpatialFilter for the --bbox / --polygon command-line options, if either is given."""
+    if bbox:
+        return SpatialFilter.from_bbox(*(float(value) for value in bbox.split(',')))
+    if polygon:
+        with open(polygon, encoding='utf-8') as f:
+            return SpatialFilter.from_geojson(json.load(f))
+    return None
+
+
+def generalization_from_args(profile: Optional[str], zoom: Optional[float], tolerance: Optional[float],
+                             precision: Optional[int]) -> Optional[Generalization]:
+    """Generalization for the --generalize / --zoom / --tolerance / --precision options."""
+    generalization = Generalization.profile(profile) if profile else (
+        Generalization.for_zoom(zoom) if zoom is not None else Generalization())
+    if tolerance is not None:
+        generalization.tolerance = tolerance
+    if precision is not None:
+        generalization.precision = precision
+    return generalization or None
+
+
+def add_generalization_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--generalize', choices=sorted(PROFILES), default=None,
+                        help="simplification profile")
+    parser.add_argument('--zoom', type=float, default=None, help="simplify to one pixel at this web map zoom")
+    parser.add_argument('--tolerance', type=float, default=None, help="Douglas-Peucker tolerance in degrees")
+    parser.add_argument('--precision', type=int, default=None, help="decimal places kept in coordinates")
+
+
+def extract_features(layer_url: str, **options: Any) -> Iterator[Dict[str, Any]]:
+    """Stream every feature of layer_url; options are passed to LayerExtractor."""
+    return LayerExtractor(layer_url, **options).iter_features()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream all features from an ArcGIS layer")
+    parser.add_argument('layer_url', help="layer URL, e.g. .../FeatureServer/0")
+    parser.add_argument('--where', default='1=1')
+    parser.add_argument('--page-size', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--partitioned', action='store_true',
+                        help="fetch object-ID ranges in parallel instead of paging by offset")
+    parser.add_argument('--bbox', default=None, metavar='XMIN,YMIN,XMAX,YMAX',
+                        help="only features intersecting this WGS84 box")
+    parser.add_argument('--polygon', default=None, metavar='GEOJSON',
+                        help="only features intersecting the polygon(s) in this GeoJSON file")
+    add_generalization_arguments(parser)
+    args = parser.parse_args()
+
+    extractor = LayerExtractor(args.layer_url, where=args.where, page_size=args.page_size, workers=args.workers,
+                               spatial_filter=spatial_filter_from_args(args.bbox, args.polygon),
+                               generalization=generalization_from_args(args.generalize, args.zoom,
+                                                                       args.tolerance, args.precision))
+    start_time = time.time()
+    total = 0
+    batches = extractor.iter_partitions() if args.partitioned else extractor.iter_batches()
+    for batch in batches:
+        total += len(batch)
+        print(f"  {total} features...")
+    elapsed = time.time() - start_time
+    print(f"Extracted {total} features in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} features/s)")
+    for row in extractor.http.timings.summary():
+        print(f"  {row['host']}: {row['requests']} requests, {row['ttfb'] * 1000:.0f} ms to first byte and "
+              f"{row['download'] * 1000:.0f} ms download on average, {row['bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+HIFLD Local Feature Store
+Keeps extracted layers on disk as Arrow IPC files keyed by the crosswalk's Open ID, so repeated
+analyses read local columnar data instead of downloading the layer from ArcGIS again.
+
+Each file holds one column per layer field (typed from the layer's field list) plus a WKB
+`geometry` column in WGS84. The layer URL, geometry type, object-ID field and the layer's
+editingInfo.lastEditDate are kept in the schema metadata, along with GeoParquet 'geo' metadata
+so export_parquet() produces a GeoParquet file. An optional Generalization simplifies and
+quantizes line/polygon geometry on the way in. Files are uncompressed and read back through a
+memory map, so opening a layer costs almost nothing and only the columns used are paged in.
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from esri_geometry import GEOMETRY_TYPE_NAMES, to_wkb
+from feature_extractor import (LayerExtractor, add_generalization_arguments, generalization_from_args,
+                               object_id_field, resolve_layer_url, spatial_filter_from_args)
+from generalize import Generalization
+from hifld_catalog import REPO_DIR, CatalogLayer, load_catalog
+
+FEATURE_STORE_DIR = os.path.join(REPO_DIR, '.cache', 'features')
+METADATA_KEY = b'hifld'
+GEOMETRY_COLUMN = 'geometry'
+
+ESRI_ARROW_TYPES = {
+    'esriFieldTypeOID': pa.int64(),
+    'esriFieldTypeBigInteger': pa.int64(),
+    'esriFieldTypeInteger': pa.int32(),
+    'esriFieldTypeSmallInteger': pa.int16(),
+    'esriFieldTypeDouble': pa.float64(),
+    'esriFieldTypeSingle': pa.float32(),
+    'esriFieldTypeDate': pa.timestamp('ms', tz='UTC')
+}
+# Field types with no attribute value in /query results
+SKIPPED_FIELD_TYPES = {'esriFieldTypeGeometry', 'esriFieldTypeBlob', 'esriFieldTypeRaster'}
+
+
+def layer_schema(layer_info: Dict[str, Any], metadata: Dict[str, Any]) -> pa.Schema:
+    """Arrow schema for a layer's ?f=json document: its attribute fields plus WKB geometry."""
+    fields = [
+        pa.field(field['name'], ESRI_ARROW_TYPES.get(field.get('type'), pa.string()))
+        for field in layer_info.get('fields', [])
+        if field.get('type') not in SKIPPED_FIELD_TYPES
+    ]
+    fields.append(pa.field(GEOMETRY_COLUMN, pa.binary()))
+
+    geo = {
+        'version': '1.0.0',
+        'primary_column': GEOMETRY_COLUMN,
+        'columns': {GEOMETRY_COLUMN: {
+            'encoding': 'WKB',
+            'geometry_types': GEOMETRY_TYPE_NAMES.get(layer_info.get('geometryType'), [])
+        }}
+    }
+    return pa.schema(fields, metadata={METADATA_KEY: json.dumps(metadata).encode('utf-8'),
+                                       b'geo': json.dumps(geo).encode('utf-8')})
+
+
+def _column(values: List[Any], arrow_type: pa.DataType) -> pa.Array:
+    if pa.types.is_string(arrow_type):
+        values = [None if value is None else str(value) for value in values]
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # e.g. a Double column delivered as strings by an older MapServer
+        return pa.array(values).cast(arrow_type, safe=False)
+
+
+def features_to_batch(features: Sequence[Dict[str, Any]], schema: pa.Schema,
+                      generalization: Optional[Generalization] = None) -> pa.RecordBatch:
+    """Convert Esri JSON features to a record batch with the given schema."""
+    columns = []
+    for field in schema:
+        if field.name == GEOMETRY_COLUMN:
+            geometries = [feature.get('geometry') for feature in features]
+            if generalization:
+                geometries = [generalization.apply(geometry) for geometry in geometries]
+            columns.append(pa.array([to_wkb(geometry) for geometry in geometries], type=pa.binary()))
+        else:
+            values = [(feature.get('attributes') or {}).get(field.name) for feature in features]
+            columns.append(_column(values, field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class FeatureStore:
+    """Directory of <open_id>.arrow files."""
+
+    def __init__(self, root: str = FEATURE_STORE_DIR):
+        self.root = root
+
+    def path(self, open_id: str) -> str:
+        return os.path.join(self.root, f"{open_id}.arrow")
+
+    def __contains__(self, open_id: str) -> bool:
+        return os.path.exists(self.path(open_id))
+
+    def open_ids(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-len('.arrow')] for name in os.listdir(self.root) if name.endswith('.arrow'))
+
+    def write(self, open_id: str, batches: Iterable[List[Dict[str, Any]]], layer_info: Dict[str, Any],
+              metadata: Optional[Dict[str, Any]] = None, generalization: Optional[Generalization] = None) -> str:
+        """Stream batches of Esri JSON features into the store, replacing any previous copy."""
+        metadata = dict(metadata or {})
+        metadata['generalization'] = generalization.to_dict() if generalization else None
+        metadata.update({
+            'open_id': open_id,
+            'geometry_type': layer_info.get('geometryType'),
+            'object_id_field': object_id_field(layer_info),
+            'last_edit_date': (layer_info.get('editingInfo') or {}).get('lastEditDate'),
+            'extracted_at': int(time.time() * 1000)
+        })
+        schema = layer_schema(layer_info, metadata)
+
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(open_id)
+        tmp_path = path + '.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            for features in batches:
+                if features:
+                    writer.write_batch(features_to_batch(features, schema, generalization))
+        os.replace(tmp_path, path)
+        return path
+
+    def write_table(self, open_id: str, table: pa.Table) -> str:
+        """Replace a stored layer with table (which keeps its schema metadata)."""
+        path = self.path(open_id)
+        tmp_path = path + '.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        return path
+
+    def extract(self, layer: CatalogLayer, partitioned: bool = False, **options: Any) -> str:
+        """Download a catalog layer into the store; options are passed to LayerExtractor."""
+        if not layer.open_id or not layer.service_url:
+            raise ValueError(f"{layer.name} has no Open ID or REST service")
+        extractor = LayerExtractor(resolve_layer_url(layer.service_url, options.get('http')), **options)
+        batches = extractor.iter_partitions() if partitioned else extractor.iter_batches()
+        spatial_filter = extractor.spatial_filter
+        return self.write(layer.open_id, batches, extractor.layer_info(),
+                          {'name': layer.name, 'layer_url': extractor.layer_url, 'where': extractor.where,
+                           'spatial_filter': spatial_filter.to_dict() if spatial_filter is not None else None},
+                          extractor.generalization)
+
+    def read(self, open_id: str, columns: Optional[Sequence[str]] = None) -> pa.Table:
+        """Memory-mapped Arrow table for a stored layer; buffers point straight into the file."""
+        source = pa.memory_map(self.path(open_id), 'r')
+        table = pa.ipc.open_file(source).read_all()
+        return table.select(list(columns)) if columns is not None else table
+
+    def metadata(self, open_id: str) -> Dict[str, Any]:
+        schema = pa.ipc.open_file(pa.memory_map(self.path(open_id), 'r')).schema
+        return json.loads(schema.metadata[METADATA_KEY])
+
+    def export_parquet(self, open_id: str, output: str, compression: str = 'zstd') -> str:
+        """Write a stored layer as GeoParquet (WKB geometry, 'geo' metadata)."""
+        pq.write_table(self.read(open_id), output, compression=compression)
+        return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download HIFLD layers into the local feature store")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    extract_parser = subparsers.add_parser('extract', help="download layers by Open ID or name search")
+    extract_parser.add_argument('layers', nargs='+', help="Open IDs or exact crosswalk layer names")
+    extract_parser.add_argument('--partitioned', action='store_true',
+                                help="fetch object-ID ranges in parallel (largest layers)")
+    extract_parser.add_argument('--workers', type=int, default=4)
+    extract_parser.add_argument('--bbox', default=None, metavar='XMIN,YMIN,XMAX,YMAX',
+                                help="only features intersecting this WGS84 box")
+    extract_parser.add_argument('--polygon', default=None, metavar='GEOJSON',
+                                help="only features intersecting the polygon(s) in this GeoJSON file")
+    add_generalization_arguments(extract_parser)
+    subparsers.add_parser('list', help="show stored layers")
+    export_parser = subparsers.add_parser('export', help="write a stored layer as GeoParquet")
+    export_parser.add_argument('open_id')
+    export_parser.add_argument('output')
+    parser.add_argument('--store', default=FEATURE_STORE_DIR, help="feature store directory")
+    args = parser.parse_args()
+
+    store = FeatureStore(args.store)
+    if args.command == 'list':
+        for open_id in store.open_ids():
+            metadata = store.metadata(open_id)
+            rows = store.read(open_id).num_rows
+            print(f"{open_id}  {rows:>9} features  {metadata.get('name')}")
+        return
+    if args.command == 'export':
+        print(f"GeoParquet written to: {store.export_parquet(args.open_id, args.output)}")
+        return
+
+    spatial_filter = spatial_filter_from_args(args.bbox, args.polygon)
+    generalization = generalization_from_args(args.generalize, args.zoom, args.tolerance, args.precision)
+    catalog = load_catalog()
+    for term in args.layers:
+        layer = catalog.find(term)
+        if layer is None:
+            print(f"❌ {catalog.no_match_message(term)}")
+            continue
+        start_time = time.time()
+        path = store.extract(layer, partitioned=args.partitioned, workers=args.workers,
+                             spatial_filter=spatial_filter, generalization=generalization)
+        print(f"{layer.name}: {store.read(layer.open_id).num_rows} features -> {path} "
+              f"({time.time() - start_time:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
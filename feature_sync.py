@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+HIFLD Feature Store Sync
+Brings stored layers up to date by transferring only what changed since they were extracted.
+
+For each stored layer the live ?f=json document is compared with the editingInfo.lastEditDate
+kept in the store; unchanged layers cost one request. Changed layers are patched:
+  - layers with an editFieldsInfo.editDateField fetch only rows edited after the stored date
+  - the live object-ID list (returnIdsOnly) is diffed against the stored IDs to find inserted and
+    deleted rows, which also covers layers without an edit-date field
+  - a layer whose edit date moved but whose ID set did not (edited in place, no edit-date field)
+    or whose field list changed is downloaded again in full
+Without an edit-date field, rows edited in place in the same period as inserts or deletes are not
+seen; `feature_store.py extract` re-downloads such a layer from scratch.
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from arcgis_http import ArcGISSession
+from feature_extractor import LayerExtractor, check_response
+from feature_store import FEATURE_STORE_DIR, METADATA_KEY, FeatureStore, features_to_batch, layer_schema
+from generalize import Generalization
+from spatial_filter import SpatialFilter
+
+
+def edit_date_where(where: str, field: str, since: int) -> str:
+    """Where clause for rows edited after the epoch-millisecond timestamp since (UTC)."""
+    # Truncating to whole seconds can only re-fetch a few extra rows, never miss one
+    moment = datetime.fromtimestamp(since / 1000, timezone.utc)
+    return f"({where}) AND {field} > timestamp '{moment:%Y-%m-%d %H:%M:%S}'"
+
+
+def sync_layer(store: FeatureStore, open_id: str, http: Optional[ArcGISSession] = None,
+               workers: int = 4) -> Dict[str, Any]:
+    """Update one stored layer in place; returns what was done and the row counts involved."""
+    http = http or ArcGISSession()
+    metadata = store.metadata(open_id)
+    result = {'open_id': open_id, 'name': metadata.get('name'), 'action': 'unchanged',
+              'added': 0, 'updated': 0, 'deleted': 0}
+
+    # Deliberately uncached: the edit date is the one value that must be live
+    info = check_response(http.get_json(f"{metadata['layer_url']}?f=json"))
+    live_edit = (info.get('editingInfo') or {}).get('lastEditDate')
+    stored_edit = metadata.get('last_edit_date')
+    if live_edit is not None and live_edit == stored_edit:
+        return result
+
+    where = metadata.get('where') or '1=1'
+    spatial_filter = SpatialFilter.from_dict(metadata['spatial_filter']) if metadata.get('spatial_filter') else None
+    generalization = Generalization.from_dict(metadata.get('generalization'))
+    extractor = LayerExtractor(metadata['layer_url'], http=http, where=where, workers=workers, layer_info=info,
+                               spatial_filter=spatial_filter, generalization=generalization)
+    table = store.read(open_id)
+    carried = {key: metadata.get(key) for key in ('name', 'layer_url', 'where', 'spatial_filter')}
+    if layer_schema(info, {}).names != table.schema.names:
+        store.write(open_id, extractor.iter_batches(), info, carried, generalization)
+        result['action'] = 'refreshed'
+        return result
+
+    oid_field = extractor.object_id_field
+    stored_ids = set(table.column(oid_field).to_pylist())
+    live_ids = set(extractor.object_ids())
+    inserted = live_ids - stored_ids
+    deleted = stored_ids - live_ids
+
+    features: List[Dict[str, Any]] = []
+    edit_field = (info.get('editFieldsInfo') or {}).get('editDateField')
+    if edit_field and stored_edit is not None:
+        edited = LayerExtractor(metadata['layer_url'], http=http, where=edit_date_where(where, edit_field, stored_edit),
+                                workers=workers, layer_info=info, spatial_filter=spatial_filter,
+                                generalization=generalization)
+        for batch in edited.iter_batches():
+            features.extend(batch)
+        fetched = {feature['attributes'][oid_field] for feature in features}
+        result['updated'] = len(fetched & stored_ids)
+        inserted -= fetched
+        result['added'] = len(fetched - stored_ids)
+    elif live_edit is not None and not inserted and not deleted:
+        store.write(open_id, extractor.iter_batches(), info, carried, generalization)
+        result['action'] = 'refreshed'
+        return result
+
+    for batch in extractor.features_by_ids(sorted(inserted)):
+        features.extend(batch)
+    result['added'] += len(inserted)
+    result['deleted'] = len(deleted)
+    if not features and not deleted and live_edit == stored_edit:
+        return result
+
+    if features or deleted:
+        replaced = pa.array(sorted(deleted | {feature['attributes'][oid_field] for feature in features}),
+                            type=table.schema.field(oid_field).type)
+        kept = table.filter(pc.invert(pc.is_in(table.column(oid_field), value_set=replaced)))
+        parts = [kept]
+        if features:
+            parts.append(pa.Table.from_batches([features_to_batch(features, table.schema, generalization)]))
+        table = pa.concat_tables(parts).sort_by(oid_field)
+        result['action'] = 'patched'
+
+    metadata.update({'last_edit_date': live_edit, 'synced_at': int(time.time() * 1000)})
+    schema_metadata = dict(table.schema.metadata)
+    schema_metadata[METADATA_KEY] = json.dumps(metadata).encode('utf-8')
+    store.write_table(open_id, table.replace_schema_metadata(schema_metadata))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update stored HIFLD layers with only what changed")
+    parser.add_argument('open_ids', nargs='*', help="layers to sync (default: every stored layer)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--store', default=FEATURE_STORE_DIR, help="feature store directory")
+    args = parser.parse_args()
+
+    store = FeatureStore(args.store)
+    http = ArcGISSession()
+    totals = {'unchanged': 0, 'patched': 0, 'refreshed': 0, 'failed': 0}
+    start_time = time.time()
+    for open_id in args.open_ids or store.open_ids():
+        try:
+            result = sync_layer(store, open_id, http, args.workers)
+        except Exception as e:
+            print(f"❌ {open_id}: {e}")
+            totals['failed'] += 1
+            continue
+        totals[result['action']] += 1
+        if result['action'] != 'unchanged':
+            print(f"{result['action']:>9}  {result['name']}: +{result['added']} ~{result['updated']} "
+                  f"-{result['deleted']}")
+
+    print(f"Synced in {time.time() - start_time:.1f}s: " + ", ".join(f"{count} {action}"
+                                                               for action, count in totals.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,79 @@ FEMA Layer Discovery Script
 This script tests all FEMA service endpoints to discover correct layer indices and data types.
 """
 
-import requests
+import argparse
+import asyncio
 import json
+import os
 import time
+from datetime import timedelta
 from urllib.parse import urljoin, urlparse
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+
+from arcgis_http import (ArcGISSession, AsyncArcGISSession, CircuitBreakers, HedgePolicy, HostRateLimiter,
+                         RequestTimings, RetryPolicy, collect_timings)
+from catalog_snapshot import SNAPSHOT_PATH, build_snapshot
+from host_latency import HostLatency
+from hifld_catalog import (TEST_RESULTS_JSON, crosswalk_services, group_by_service_root, parse_service_url,
+                           processed_layers)
+from layer_status import (build_results_document, http_status, load_previous_results, plan_incremental,
+                          status_from_body, status_from_error, status_from_service_layers)
+from response_cache import DEFAULT_TTL, ResponseCache
+
+# Services to test based on the problematic layers mentioned
+DEFAULT_SERVICES = [
+    {
+        'name': 'Medical Emergency Response (Fire/EMS/Law)',
+        'url': 'https://services2.arcgis.com/FiaPA4ga0iQKduv3/arcgis/rest/services/Structures_Medical_Emergency_Response_v1/FeatureServer'
+    },
+    {
+        'name': 'USA Schools',
+        'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Schools/FeatureServer'
+    },
+    {
+        'name': 'USA Prison Boundaries',
+        'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Prison_Boundaries/FeatureServer'
+    },
+    {
+        'name': 'USA Mobile Home Parks',
+        'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Mobile_Home_Parks/FeatureServer'
+    },
+    {
+        'name': 'USA Healthcare Facilities',
+        'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Healthcare_Facilities/FeatureServer'
+    }
+]
+
+# Sample query sent to every layer to see what kind of records it holds
+SAMPLE_QUERY_PARAMS = {
+    'where': '1=1',
+    'outFields': '*',
+    'returnGeometry': 'false',
+    'resultRecordCount': 3,
+    'f': 'json'
+}
 
 class FEMALayerTester:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'FEMA Layer Tester/1.0'
-        })
+    def __init__(self, limiter: Optional[HostRateLimiter] = None, cache: Optional[ResponseCache] = None,
+                 retry: Optional[RetryPolicy] = None, breakers: Optional[CircuitBreakers] = None,
+                 latency: Optional[HostLatency] = None, hedge: Optional[HedgePolicy] = None):
+        # Sync and async modes share the per-host token buckets, circuit breakers, latency
+        # histograms, request timings and the metadata cache
+        self.limiter = limiter or HostRateLimiter()
+        self.cache = cache
+        self.retry = retry or RetryPolicy()
+        self.breakers = breakers or CircuitBreakers()
+        self.latency = latency
+        self.hedge = hedge
+        self.timings = RequestTimings()
+        self.http = ArcGISSession(self.limiter, cache=cache, retry=self.retry, breakers=self.breakers,
+                                  latency=latency, hedge=hedge, timings=self.timings)
+        self.session = self.http.session
         self.results = {}
         
-    def test_service(self, service_url: str, service_name: str) -> Dict[str, Any]:
-        """Test a single service endpoint to discover its layers."""
+    def test_service(self, service_url: str, service_name: str,
+                     layer_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Test a single service endpoint to discover its layers (only layer_ids, if given)."""
         print(f"\n{'='*60}")
         print(f"Testing: {service_name}")
         print(f"URL: {service_url}")
@@ -30,27 +87,25 @@ class FEMALayerTester:
             'base_url': service_url,
             'layers': [],
             'error': None,
-            'response_time': 0
+            'response_time': 0,
+            'timings': []
         }
         
         try:
             start_time = time.time()
             
             # Test the base service info
-            info_url = service_url + "?f=json"
-            response = self.session.get(info_url, timeout=30)
-            response.raise_for_status()
-            
+            with collect_timings() as result['timings']:
+                service_info, definitions = self._service_info(service_url)
             result['response_time'] = time.time() - start_time
-            service_info = response.json()
             
             print(f"Service Type: {service_info.get('serviceDescription', 'Unknown')}")
             print(f"Copyright: {service_info.get('copyrightText', 'None')}")
             
             # Check if this service has layers
             if 'layers' in service_info:
-                layers = service_info['layers']
-                print(f"Found {len(layers)} layers:")
+                layers, missing = self._select_layers(service_info, layer_ids)
+                print(f"Found {len(service_info['layers'])} layers:")
                 
                 for layer in layers:
                     layer_id = layer.get('id')
@@ -60,8 +115,10 @@ class FEMALayerTester:
                     print(f"  Layer {layer_id}: {layer_name} (Type: {layer_type})")
                     
                     # Test this specific layer
-                    layer_result = self.test_layer(service_url, layer_id, layer_name)
+                    layer_result = self.test_layer(service_url, layer_id, layer_name,
+                                                   layer if definitions else None)
                     result['layers'].append(layer_result)
+                result['layers'].extend(self._missing_layer_result(layer_id) for layer_id in missing)
                     
             elif 'tables' in service_info:
                 # Some services might have tables instead of layers
@@ -84,17 +141,10 @@ class FEMALayerTester:
             
         return result
     
-    def test_layer(self, service_url: str, layer_id: int, layer_name: str) -> Dict[str, Any]:
-        """Test a specific layer to see what data it contains."""
-        layer_result = {
-            'id': layer_id,
-            'name': layer_name,
-            'feature_count': 0,
-            'sample_features': [],
-            'field_names': [],
-            'geometry_type': None,
-            'error': None
-        }
+    def test_layer(self, service_url: str, layer_id: int, layer_name: str,
+                   layer_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Test a specific layer to see what data it contains; layer_info skips fetching its definition."""
+        layer_result = self._new_layer_result(layer_id, layer_name)
         
         try:
             # Build layer URL
@@ -102,50 +152,17 @@ class FEMALayerTester:
             
             # Get layer info
             info_url = f"{layer_url}?f=json"
-            response = self.session.get(info_url, timeout=30)
-            response.raise_for_status()
-            layer_info = response.json()
-            
-            # Get field information
-            if 'fields' in layer_info:
-                layer_result['field_names'] = [field.get('name') for field in layer_info['fields']]
+            with collect_timings() as layer_result['timings']:
+                if layer_info is None:
+                    layer_info = self.http.get_json(info_url, cache=True)
                 
-            # Get geometry type
-            layer_result['geometry_type'] = layer_info.get('geometryType', 'Unknown')
-            
-            print(f"    Fields: {', '.join(layer_result['field_names'][:10])}{'...' if len(layer_result['field_names']) > 10 else ''}")
-            print(f"    Geometry: {layer_result['geometry_type']}")
-            
-            # Try to get a few sample features
-            query_url = f"{layer_url}/query"
-            params = {
-                'where': '1=1',
-                'outFields': '*',
-                'returnGeometry': 'false',
-                'resultRecordCount': 3,
-                'f': 'json'
-            }
-            
-            response = self.session.get(query_url, params=params, timeout=30)
-            response.raise_for_status()
-            query_result = response.json()
-            
-            if 'features' in query_result:
-                features = query_result['features']
-                layer_result['feature_count'] = len(features)
+                self._apply_layer_info(layer_result, layer_info)
                 
-                # Extract sample data
-                for feature in features[:3]:
-                    attributes = feature.get('attributes', {})
-                    # Get a few key attributes for identification
-                    sample_data = {}
-                    for key, value in list(attributes.items())[:5]:  # First 5 attributes
-                        sample_data[key] = value
-                    layer_result['sample_features'].append(sample_data)
-                
-                print(f"    Sample features: {layer_result['feature_count']}")
-                for i, sample in enumerate(layer_result['sample_features']):
-                    print(f"      Feature {i+1}: {dict(list(sample.items())[:3])}")
+                # Try to get a few sample features
+                query_url = f"{layer_url}/query"
+                query_result = self.http.get_json(query_url, params=SAMPLE_QUERY_PARAMS)
+            
+            self._apply_sample_query(layer_result, query_result)
                     
         except Exception as e:
             layer_result['error'] = str(e)
@@ -153,40 +170,299 @@ class FEMALayerTester:
             
         return layer_result
     
-    def run_tests(self):
+    @staticmethod
+    def _layers_url(service_url: str) -> Optional[str]:
+        """The /layers?f=json URL of a MapServer/FeatureServer root, else None."""
+        parsed = parse_service_url(service_url)
+        if parsed is None or not parsed.bulk or parsed.layer_id is not None:
+            return None
+        return f"{service_url}/layers?f=json"
+    
+    def _service_info(self, service_url: str):
+        """(service document, whether its layers are full definitions).
+        
+        A MapServer/FeatureServer root lists every layer's definition in one /layers call, so its
+        layers need no info request of their own; other URLs (and servers without /layers) get ?f=json.
+        """
+        layers_url = self._layers_url(service_url)
+        if layers_url:
+            try:
+                service_info = self.http.get_json(layers_url, cache=True)
+                if 'layers' in service_info:
+                    return service_info, True
+            except Exception as e:
+                if http_status(e) not in (400, 404):
+                    raise
+        return self.http.get_json(service_url + "?f=json", cache=True), False
+    
+    async def _service_info_async(self, session, service_url: str):
+        layers_url = self._layers_url(service_url)
+        if layers_url:
+            try:
+                service_info = await session.get_json(layers_url, cache=True)
+                if 'layers' in service_info:
+                    return service_info, True
+            except Exception as e:
+                if http_status(e) not in (400, 404):
+                    raise
+        return await session.get_json(service_url + "?f=json", cache=True), False
+    
+    @staticmethod
+    def _select_layers(service_info: Dict[str, Any], layer_ids: Optional[List[int]]):
+        """The layers (or tables) named by layer_ids, all layers when None, and the ids the service lacks."""
+        if layer_ids is None:
+            return service_info['layers'], []
+        layers = service_info['layers'] + (service_info.get('tables') or [])
+        listed = {layer.get('id') for layer in layers}
+        return ([layer for layer in layers if layer.get('id') in layer_ids],
+                [layer_id for layer_id in layer_ids if layer_id not in listed])
+    
+    def _missing_layer_result(self, layer_id: int) -> Dict[str, Any]:
+        layer_result = self._new_layer_result(layer_id, 'Unknown')
+        layer_result['error'] = f"Layer {layer_id} not found in service"
+        print(f"    ERROR testing layer {layer_id}: {layer_result['error']}")
+        return layer_result
+    
+    def _new_layer_result(self, layer_id: int, layer_name: str) -> Dict[str, Any]:
+        return {
+            'id': layer_id,
+            'name': layer_name,
+            'feature_count': 0,
+            'sample_features': [],
+            'field_names': [],
+            'geometry_type': None,
+            'error': None,
+            # One entry per HTTP request (cache hits make none); see arcgis_http.RequestTimings
+            'timings': []
+        }
+    
+    def _apply_layer_info(self, layer_result: Dict[str, Any], layer_info: Dict[str, Any]):
+        """Copy field names and geometry type from a layer's ?f=json document."""
+        # Get field information
+        if 'fields' in layer_info:
+            layer_result['field_names'] = [field.get('name') for field in layer_info['fields']]
+            
+        # Get geometry type
+        layer_result['geometry_type'] = layer_info.get('geometryType', 'Unknown')
+        
+        print(f"    Fields: {', '.join(layer_result['field_names'][:10])}{'...' if len(layer_result['field_names']) > 10 else ''}")
+        print(f"    Geometry: {layer_result['geometry_type']}")
+    
+    def _apply_sample_query(self, layer_result: Dict[str, Any], query_result: Dict[str, Any]):
+        """Record the sample features returned by SAMPLE_QUERY_PARAMS."""
+        if 'features' in query_result:
+            features = query_result['features']
+            layer_result['feature_count'] = len(features)
+            
+            # Extract sample data
+            for feature in features[:3]:
+                attributes = feature.get('attributes', {})
+                # Get a few key attributes for identification
+                sample_data = {}
+                for key, value in list(attributes.items())[:5]:  # First 5 attributes
+                    sample_data[key] = value
+                layer_result['sample_features'].append(sample_data)
+            
+            print(f"    Sample features: {layer_result['feature_count']}")
+            for i, sample in enumerate(layer_result['sample_features']):
+                print(f"      Feature {i+1}: {dict(list(sample.items())[:3])}")
+    
+    def run_tests(self, services: Optional[List[Dict[str, str]]] = None):
         """Run tests on all problematic services."""
-        # Services to test based on the problematic layers mentioned
-        services_to_test = [
-            {
-                'name': 'Medical Emergency Response (Fire/EMS/Law)',
-                'url': 'https://services2.arcgis.com/FiaPA4ga0iQKduv3/arcgis/rest/services/Structures_Medical_Emergency_Response_v1/FeatureServer'
-            },
-            {
-                'name': 'USA Schools',
-                'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Schools/FeatureServer'
-            },
-            {
-                'name': 'USA Prison Boundaries',
-                'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Prison_Boundaries/FeatureServer'
-            },
-            {
-                'name': 'USA Mobile Home Parks',
-                'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Mobile_Home_Parks/FeatureServer'
-            },
-            {
-                'name': 'USA Healthcare Facilities',
-                'url': 'https://services.arcgis.com/P3ePLMYs2RVChkJx/arcgis/rest/services/USA_Healthcare_Facilities/FeatureServer'
-            }
-        ]
+        services_to_test = services if services is not None else DEFAULT_SERVICES
         
         # Test each service
         for service in services_to_test:
-            result = self.test_service(service['url'], service['name'])
+            result = self.test_service(service['url'], service['name'], service.get('layer_ids'))
             self.results[service['name']] = result
-            time.sleep(1)  # Be polite to the servers
             
         return self.results
     
+    def run_tests_async(self, services: Optional[List[Dict[str, str]]] = None,
+                        concurrency: int = 32, per_host: int = 6):
+        """Run the same tests concurrently; fills self.results with the same shape as run_tests."""
+        services_to_test = services if services is not None else DEFAULT_SERVICES
+        asyncio.run(self._run_tests_async(services_to_test, concurrency, per_host))
+        return self.results
+    
+    async def _run_tests_async(self, services: List[Dict[str, str]], concurrency: int, per_host: int):
+        headers = dict(self.session.headers)
+        async with AsyncArcGISSession(self.limiter, concurrency=concurrency, per_host=per_host,
+                                      headers=headers, cache=self.cache, retry=self.retry,
+                                      breakers=self.breakers, latency=self.latency,
+                                      hedge=self.hedge, timings=self.timings) as session:
+            results = await asyncio.gather(*[
+                self.test_service_async(session, service['url'], service['name'], service.get('layer_ids'))
+                for service in services
+            ])
+        
+        for service, result in zip(services, results):
+            self.results[service['name']] = result
+    
+    async def test_service_async(self, session, service_url: str, service_name: str,
+                                 layer_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Async counterpart of test_service; sublayers are probed in parallel."""
+        result = {
+            'service_name': service_name,
+            'base_url': service_url,
+            'layers': [],
+            'error': None,
+            'response_time': 0,
+            'timings': []
+        }
+        
+        try:
+            start_time = time.time()
+            with collect_timings() as result['timings']:
+                service_info, definitions = await self._service_info_async(session, service_url)
+            result['response_time'] = time.time() - start_time
+            
+            print(f"Tested: {service_name} ({result['response_time']:.2f}s)")
+            
+            if 'layers' in service_info:
+                layers, missing = self._select_layers(service_info, layer_ids)
+                result['layers'] = list(await asyncio.gather(*[
+                    self.test_layer_async(session, service_url, layer.get('id'), layer.get('name', 'Unknown'),
+                                          layer if definitions else None)
+                    for layer in layers
+                ]))
+                result['layers'].extend(self._missing_layer_result(layer_id) for layer_id in missing)
+            elif 'tables' in service_info:
+                # Tables are listed by test_service but never probed
+                pass
+            else:
+                layer_result = await self.test_layer_async(session, service_url, 0, service_name)
+                result['layers'].append(layer_result)
+                
+        except Exception as e:
+            result['error'] = str(e) or type(e).__name__
+            print(f"ERROR: {service_name}: {result['error']}")
+            
+        return result
+    
+    async def test_layer_async(self, session, service_url: str, layer_id: int, layer_name: str,
+                               layer_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Async counterpart of test_layer; layer info and sample query run in parallel."""
+        layer_result = self._new_layer_result(layer_id, layer_name)
+        layer_url = f"{service_url}/{layer_id}"
+        
+        async def known_info():
+            return layer_info
+        
+        with collect_timings() as layer_result['timings']:
+            layer_info, query_result = await asyncio.gather(
+                session.get_json(f"{layer_url}?f=json", cache=True) if layer_info is None else known_info(),
+                session.get_json(f"{layer_url}/query", params=SAMPLE_QUERY_PARAMS),
+                return_exceptions=True
+            )
+        
+        print(f"  Layer {layer_id}: {layer_name}")
+        try:
+            for outcome in (layer_info, query_result):
+                if isinstance(outcome, BaseException):
+                    raise outcome
+            self._apply_layer_info(layer_result, layer_info)
+            self._apply_sample_query(layer_result, query_result)
+        except Exception as e:
+            layer_result['error'] = str(e) or type(e).__name__
+            print(f"    ERROR testing layer {layer_id}: {layer_result['error']}")
+            
+        return layer_result
+    
+    def probe_layer_status(self, layer: Dict[str, Any]) -> Dict[str, Any]:
+        """Check one catalog layer's serviceUrl and return it with its testStatus filled in."""
+        url = layer['serviceUrl']
+        info_url = f"{url}&f=json" if '?' in url else f"{url}?f=json"
+        try:
+            return status_from_body(layer, self.http.get_json(info_url), url)
+        except Exception as e:
+            return status_from_error(layer, e)
+    
+    async def probe_layer_status_async(self, session, layer: Dict[str, Any]) -> Dict[str, Any]:
+        url = layer['serviceUrl']
+        info_url = f"{url}&f=json" if '?' in url else f"{url}?f=json"
+        try:
+            return status_from_body(layer, await session.get_json(info_url), url)
+        except Exception as e:
+            return status_from_error(layer, e)
+    
+    def probe_service_layers(self, root: str, members: List[Tuple[Dict[str, Any], Optional[int]]]
+                             ) -> List[Dict[str, Any]]:
+        """Statuses of catalog layers sharing a service root, from one /layers?f=json request."""
+        try:
+            body = self.http.get_json(f"{root}/layers?f=json")
+        except Exception as e:
+            if http_status(e) in (400, 404):
+                # No /layers endpoint on this server
+                return [self.probe_layer_status(layer) for layer, _ in members]
+            return [status_from_error(layer, e) for layer, _ in members]
+        return [status_from_service_layers(layer, layer_id, body) or self.probe_layer_status(layer)
+                for layer, layer_id in members]
+    
+    async def probe_service_layers_async(self, session, root: str,
+                                         members: List[Tuple[Dict[str, Any], Optional[int]]]) -> List[Dict[str, Any]]:
+        try:
+            body = await session.get_json(f"{root}/layers?f=json")
+        except Exception as e:
+            if http_status(e) in (400, 404):
+                return list(await asyncio.gather(*[self.probe_layer_status_async(session, layer)
+                                                   for layer, _ in members]))
+            return [status_from_error(layer, e) for layer, _ in members]
+        statuses = [status_from_service_layers(layer, layer_id, body) for layer, layer_id in members]
+        fallback = await asyncio.gather(*[self.probe_layer_status_async(session, layer)
+                                          for (layer, _), status in zip(members, statuses) if status is None])
+        fallback = iter(fallback)
+        return [status if status is not None else next(fallback) for status in statuses]
+    
+    def run_incremental(self, results_path: str = TEST_RESULTS_JSON, max_age: timedelta = timedelta(hours=24),
+                        use_async: bool = False, concurrency: int = 32, per_host: int = 6) -> Dict[str, Any]:
+        """Re-probe only new, changed, failed or stale layers and carry the rest forward.
+        
+        Reads and rewrites results_path in the layer-test-results.json format.
+        """
+        layers = processed_layers()
+        previous = load_previous_results(results_path)
+        to_probe, settled, reasons = plan_incremental(layers, previous, max_age)
+        
+        # Rows sharing a service root are answered by one /layers request; a lone row is cheaper
+        # to probe by its own URL than by downloading every sublayer definition of its service
+        groups, singles = group_by_service_root(to_probe, lambda layer: layer['serviceUrl'])
+        singles += [layer for members in groups.values() if len(members) == 1 for layer, _ in members]
+        groups = {root: members for root, members in groups.items() if len(members) > 1}
+        
+        print(f"Incremental run: probing {len(to_probe)} of {len(layers)} layers "
+              f"in {len(groups) + len(singles)} requests "
+              f"({', '.join(f'{k}: {v}' for k, v in sorted(reasons.items())) or 'nothing due'})")
+        
+        if use_async and to_probe:
+            probed = asyncio.run(self._probe_layers_async(groups, singles, concurrency, per_host))
+        else:
+            probed = [status for root, members in groups.items()
+                      for status in self.probe_service_layers(root, members)]
+            probed += [self.probe_layer_status(layer) for layer in singles]
+        
+        document = build_results_document(settled + probed)
+        document['incremental'] = {
+            'probed': len(probed),
+            'carried': len(settled),
+            'reasons': reasons
+        }
+        with open(results_path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        return document
+    
+    async def _probe_layers_async(self, groups: Dict[str, List[Tuple[Dict[str, Any], Optional[int]]]],
+                                  singles: List[Dict[str, Any]], concurrency: int, per_host: int):
+        headers = dict(self.session.headers)
+        async with AsyncArcGISSession(self.limiter, concurrency=concurrency, per_host=per_host,
+                                      headers=headers, cache=self.cache, retry=self.retry,
+                                      breakers=self.breakers, latency=self.latency,
+                                      hedge=self.hedge, timings=self.timings) as session:
+            grouped = await asyncio.gather(*[self.probe_service_layers_async(session, root, members)
+                                             for root, members in groups.items()])
+            probed = await asyncio.gather(*[self.probe_layer_status_async(session, layer) for layer in singles])
+            return [status for statuses in grouped for status in statuses] + probed
+    
     def generate_report(self) -> str:
         """Generate a detailed report of findings."""
         report = []
@@ -226,6 +502,27 @@ class FEMALayerTester:
                 
             report.append("-" * 30)
             report.append("")
+        
+        timings = self.timings.summary()
+        if timings:
+            def ms(seconds):
+                return f"{seconds * 1000:>7.0f}" if seconds is not None else f"{'-':>7}"
+            report.append("REQUEST TIMING BY HOST (mean ms per request)")
+            report.append(f"{'Host':<40} {'Requests':>8} {'DNS':>7} {'Connect':>7} {'TLS':>7} {'TTFB':>7} "
+                          f"{'Download':>8} {'KB':>8}")
+            for row in timings:
+                report.append(f"{row['host']:<40} {row['requests']:>8} {ms(row['dns'])} {ms(row['connect'])} "
+                              f"{ms(row['tls'])} {ms(row['ttfb'])} {ms(row['download']):>8} "
+                              f"{row['mean_bytes'] / 1024:>8.1f}")
+            report.append("")
+        
+        if self.latency is not None and self.latency.summary():
+            report.append("HOST LATENCY (learned across runs)")
+            report.append(f"{'Host':<40} {'Samples':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'Timeout':>8}")
+            for row in self.latency.summary():
+                report.append(f"{row['host']:<40} {row['samples']:>8.0f} {row['p50']:>7.2f}s {row['p95']:>7.2f}s "
+                              f"{row['p99']:>7.2f}s {row['timeout']:>7.1f}s")
+            report.append("")
             
         return "\n".join(report)
     
@@ -291,14 +588,90 @@ class FEMALayerTester:
                 
         return "Unknown Facility Type"
 
+def print_resilience_summary(tester: FEMALayerTester):
+    breakers = tester.breakers.stats
+    print(f"Retries: {tester.retry.retried}")
+    if breakers['opened']:
+        print(f"🚫 Circuit opened for {', '.join(breakers['opened'])} "
+              f"({breakers['rejected']} requests skipped)")
+    if tester.hedge is not None and tester.hedge.answered:
+        hedge = tester.hedge.stats
+        print(f"Hedged {hedge['hedged']} of {hedge['requests']} requests ({hedge['won']} answered first by the copy)")
+        print("Latency with hedging / first copy alone: " + "  ".join(
+            f"p{q} {hedge[f'p{q}']:.2f}s / {hedge[f'p{q}_unhedged']:.2f}s" for q in (50, 95, 99)))
+
 def main():
     """Main execution function."""
     print("FEMA Layer Discovery Tool")
     print("Testing service endpoints to discover correct layer configurations...")
     print()
     
-    tester = FEMALayerTester()
-    results = tester.run_tests()
+    parser = argparse.ArgumentParser(description="Test FEMA/HIFLD ArcGIS REST services")
+    parser.add_argument('--crosswalk', action='store_true',
+                        help="test every Open REST Service in the HIFLD crosswalk CSV")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="probe services concurrently (requires aiohttp)")
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help="maximum open requests in async mode")
+    parser.add_argument('--per-host', type=int, default=6,
+                        help="maximum open requests per host in async mode")
+    parser.add_argument('--rate', action='append', default=[], metavar='HOST=RPS[:BURST]',
+                        help="override the token-bucket rate for a host (repeatable)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always re-download service and layer metadata")
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL,
+                        help="seconds before cached metadata is revalidated")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="retries after a connection error, timeout, 429 or 5xx (with jittered backoff)")
+    parser.add_argument('--breaker-threshold', type=int, default=5,
+                        help="consecutive failures before a host is skipped for a minute (0 disables)")
+    parser.add_argument('--hedge', action='store_true',
+                        help="re-send requests still unanswered at their host's p95 latency; first answer wins")
+    parser.add_argument('--hedge-budget', type=float, default=0.05,
+                        help="extra requests hedging may add, as a fraction of all requests")
+    parser.add_argument('--incremental', action='store_true',
+                        help="update layer-test-results.json, re-probing only new, changed, failed or stale layers")
+    parser.add_argument('--max-age', type=float, default=24,
+                        help="hours after which a working layer is re-probed in incremental mode")
+    parser.add_argument('--results', default=TEST_RESULTS_JSON,
+                        help="layer test results file read and written by incremental mode")
+    args = parser.parse_args()
+    
+    services = crosswalk_services() if args.crosswalk else None
+    
+    limiter = HostRateLimiter()
+    for override in args.rate:
+        host, _, spec = override.partition('=')
+        rate, _, burst = spec.partition(':')
+        limiter.host_rates[host.lower()] = (float(rate), int(burst or max(1, float(rate))))
+    
+    cache = None if args.no_cache else ResponseCache(ttl=args.cache_ttl)
+    
+    latency = HostLatency()
+    hedge = HedgePolicy(args.hedge_budget) if args.hedge else None
+    tester = FEMALayerTester(limiter, cache, RetryPolicy(args.retries), CircuitBreakers(args.breaker_threshold),
+                             latency, hedge)
+    
+    if args.incremental:
+        document = tester.run_incremental(args.results, timedelta(hours=args.max_age), args.use_async,
+                                          args.concurrency, args.per_host)
+        latency.save()
+        stats = document['stats']
+        print(f"✅ Working: {stats['working']}  ❌ Failed: {stats['failed']}  🔒 Restricted: {stats['restricted']}  "
+              f"⏱️ Timeout: {stats['timeout']}  🚫 Unreachable: {stats['unreachable']}")
+        print(f"Results saved to: {args.results}")
+        print_resilience_summary(tester)
+        if args.results == TEST_RESULTS_JSON and os.path.exists(SNAPSHOT_PATH):
+            # Keep the binary catalog in step with the statuses we just wrote
+            build_snapshot()
+            print(f"Catalog snapshot refreshed: {SNAPSHOT_PATH}")
+        return
+    
+    if args.use_async:
+        results = tester.run_tests_async(services, concurrency=args.concurrency, per_host=args.per_host)
+    else:
+        results = tester.run_tests(services)
+    latency.save()
     
     # Generate and save report
     report = tester.generate_report()
@@ -315,6 +688,11 @@ def main():
     print("="*60)
     print(f"Report saved to: fema_layer_report.txt")
     print(f"TypeScript fixes saved to: fema_layer_fixes.ts")
+    if cache is not None:
+        stats = cache.stats
+        print(f"Metadata cache: {stats['hits']} hits, {stats['revalidated']} revalidated (304), "
+              f"{stats['misses']} downloaded")
+    print_resilience_summary(tester)
     print("\nSUMMARY:")
     
     for service_name, result in results.items():
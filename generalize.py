@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Geometry Generalization
+Optional ingest stage that makes line and polygon layers smaller before they are stored or exported.
+
+Two steps, both configurable per zoom level or use case through Generalization:
+  - server side: maxAllowableOffset / geometryPrecision are added to /query so ArcGIS returns
+    fewer vertices with fewer digits
+  - locally: vectorized Douglas-Peucker simplification, then snapping coordinates to an integer
+    grid (multiples of 10**-precision degrees) and dropping the repeated vertices that leaves
+
+Tolerances are in degrees because features are requested in WGS84.
+"""
+
+import math
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Named settings; 'analysis' keeps ~1 m detail, the zoom-based ones match one screen pixel
+PROFILES = {
+    'full': {},
+    'analysis': {'tolerance': 1e-5, 'precision': 6},
+    'regional': {'zoom': 10},
+    'national': {'zoom': 5}
+}
+
+
+def degrees_per_pixel(zoom: float) -> float:
+    """Width of one 256-px web map tile pixel at the equator, in degrees."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def simplify(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker: keep the vertices needed to stay within tolerance of the original line.
+
+    Runs one level of the recursion at a time over the whole line: every vertex is measured against
+    the segment between its neighbouring kept vertices in a single NumPy pass, and the farthest
+    out-of-tolerance vertex of each segment is kept. The Python loop runs once per level.
+    """
+    n = len(coords)
+    if n < 3 or tolerance <= 0:
+        return coords
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    index = np.arange(n)
+    while True:
+        kept = np.flatnonzero(keep)
+        segment = np.searchsorted(kept, index, side='right') - 1
+        segment[-1] = len(kept) - 2
+        a = coords[kept[segment]]
+        b = coords[kept[segment + 1]]
+        ab = b - a
+        length = np.hypot(ab[:, 0], ab[:, 1])
+        offset = coords - a
+        cross = np.abs(ab[:, 0] * offset[:, 1] - ab[:, 1] * offset[:, 0])
+        # Zero-length segments (a closed ring's start/end) measure straight to the point
+        distances = np.where(length > 0, cross / np.where(length > 0, length, 1), np.hypot(offset[:, 0], offset[:, 1]))
+        distances[keep] = -1.0
+
+        segment_max = np.maximum.reduceat(distances, kept[:-1])
+        split = (distances > tolerance) & (distances == segment_max[segment])
+        if not split.any():
+            break
+        # One vertex per segment, even when two tie for farthest
+        candidates = np.flatnonzero(split)
+        _, first = np.unique(segment[candidates], return_index=True)
+        keep[candidates[first]] = True
+    return coords[keep]
+
+
+def quantize(coords: np.ndarray, precision: int) -> np.ndarray:
+    """Snap to a grid of 10**-precision and drop consecutive duplicate vertices."""
+    scale = 10.0 ** precision
+    snapped = np.round(coords * scale) / scale
+    if len(snapped) < 2:
+        return snapped
+    changed = np.any(snapped[1:] != snapped[:-1], axis=1)
+    return snapped[np.concatenate(([True], changed))]
+
+
+class Generalization:
+    """Tolerance (degrees) and precision (decimal places) for one zoom level or use case."""
+
+    def __init__(self, tolerance: Optional[float] = None, precision: Optional[int] = None):
+        self.tolerance = tolerance
+        self.precision = precision
+
+    @classmethod
+    def for_zoom(cls, zoom: float) -> 'Generalization':
+        tolerance = degrees_per_pixel(zoom)
+        # Enough decimals that rounding moves a vertex by well under a pixel
+        return cls(tolerance, max(0, math.ceil(-math.log10(tolerance)) + 1))
+
+    @classmethod
+    def profile(cls, name: str) -> 'Generalization':
+        settings = PROFILES[name]
+        if 'zoom' in settings:
+            return cls.for_zoom(settings['zoom'])
+        return cls(settings.get('tolerance'), settings.get('precision'))
+
+    def __bool__(self) -> bool:
+        return self.tolerance is not None or self.precision is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'tolerance': self.tolerance, 'precision': self.precision}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> Optional['Generalization']:
+        return cls(data.get('tolerance'), data.get('precision')) if data else None
+
+    def query_params(self) -> Dict[str, Any]:
+        """maxAllowableOffset / geometryPrecision for /query."""
+        params = {}
+        if self.tolerance is not None:
+            params['maxAllowableOffset'] = self.tolerance
+        if self.precision is not None:
+            params['geometryPrecision'] = self.precision
+        return params
+
+    def _part(self, part: List[List[float]], closed: bool) -> List[List[float]]:
+        coords = np.asarray(part, dtype=np.float64)[:, :2]
+        out = coords
+        if self.tolerance:
+            out = simplify(out, self.tolerance)
+        if self.precision is not None:
+            out = quantize(out, self.precision)
+        minimum = 4 if closed else 2
+        if len(out) < minimum:
+            # Collapsed below a valid ring/line: keep the input rather than lose the feature
+            return part
+        return out.tolist()
+
+    def apply(self, geometry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """A generalized copy of an Esri JSON geometry (points are only rounded)."""
+        if not geometry or not self:
+            return geometry
+        if 'x' in geometry:
+            if self.precision is None or geometry['x'] is None:
+                return geometry
+            return {**geometry, 'x': round(geometry['x'], self.precision), 'y': round(geometry['y'], self.precision)}
+        if geometry.get('points'):
+            if self.precision is None:
+                return geometry
+            return {**geometry, 'points': quantize(np.asarray(geometry['points'], dtype=np.float64)[:, :2],
+                                                   self.precision).tolist()}
+        if geometry.get('paths'):
+            return {**geometry, 'paths': [self._part(path, False) for path in geometry['paths']]}
+        if geometry.get('rings'):
+            return {**geometry, 'rings': [self._part(ring, True) for ring in geometry['rings']]}
+        return geometry
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+HIFLD Crosswalk Catalog
+Shared loader for the HIFLD Open crosswalk CSV used by the layer tester and prototypes.
+
+load_catalog() keeps the crosswalk as __slots__ records with interned strings and a per-row
+flag bitmask (DUA / GII / has URL). It only needs the standard library; pandas is imported
+on demand by Catalog.to_dataframe() for the notebook prototypes.
+
+Many rows point at sublayers of one MapServer/FeatureServer. parse_service_url() and
+group_by_service_root() map them onto their service root, so each service is discovered once.
+"""
+
+import csv
+import os
+import re
+import sys
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CROSSWALK_CSV = os.path.join(REPO_DIR, 'public', 'HIFLD_Open_Crosswalk_Geoplatform.csv')
+TEST_RESULTS_JSON = os.path.join(REPO_DIR, 'public', 'layer-test-results.json')
+
+# Categories for grouping; keep in sync with scripts/process-data.js
+CATEGORIES = {
+    'Emergency Services': ['fire', 'ems', 'emergency', 'eoc', 'police', 'law enforcement', '911'],
+    'Healthcare': ['hospital', 'medical', 'health', 'nursing', 'veterans', 'clinic'],
+    'Education': ['school', 'college', 'university', 'education', 'campus'],
+    'Energy': ['power', 'electric', 'energy', 'transmission', 'gas', 'oil', 'petroleum', 'pipeline', 'refinery', 'lng', 'fuel', 'hydrocarbon'],
+    'Transportation': ['airport', 'port', 'rail', 'road', 'bridge', 'tunnel', 'transit'],
+    'Communications': ['tower', 'antenna', 'cellular', 'broadcast', 'microwave', 'radio', 'telecommunications', 'paging', 'broadband'],
+    'Government': ['federal', 'state', 'military', 'dod', 'coast guard', 'uscg', 'government'],
+    'Critical Facilities': ['prison', 'detention', 'child care', 'mobile home'],
+    'Maritime': ['maritime', 'marine', 'vessel', 'waterway', 'navigation', 'dgps'],
+    'Utilities': ['water', 'sewer', 'waste', 'utility'],
+    'Boundaries': ['border', 'boundary', 'zone', 'district', 'region', 'area', 'territory']
+}
+
+
+# Service types whose root answers /layers?f=json with every sublayer definition
+# Closest search matches listed when a layer name doesn't match exactly
+SUGGESTIONS = 5
+BULK_SERVICE_TYPES = {'mapserver': 'MapServer', 'featureserver': 'FeatureServer'}
+_SERVICE_URL = re.compile(r'^(?P<prefix>.+?/rest/services/.+?/)(?P<type>[a-z]+server)(?:/(?P<layer>\d+))?$', re.I)
+
+
+class ServiceUrl(NamedTuple):
+    root: str
+    service_type: str
+    layer_id: Optional[int]
+
+    @property
+    def bulk(self) -> bool:
+        return self.service_type in BULK_SERVICE_TYPES.values()
+
+
+def normalize_service_url(url: str) -> str:
+    """url without query, fragment, doubled or trailing slashes, with lowercase scheme and host."""
+    # Some rows end in a non-breaking space that went through Latin-1 ('Â\xa0'), or what's left of one
+    parts = urlsplit(re.sub('\u00c2(?=\\s|$)', '', url.strip()).strip())
+    path = re.sub(r'/{2,}', '/', parts.path).rstrip('/')
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, '', ''))
+
+
+def parse_service_url(url: str) -> Optional[ServiceUrl]:
+    """Service root, type and sublayer id of an ArcGIS REST URL, or None if it isn't one."""
+    match = _SERVICE_URL.match(normalize_service_url(url))
+    if match is None:
+        return None
+    service_type = BULK_SERVICE_TYPES.get(match['type'].lower(), match['type'])
+    layer_id = int(match['layer']) if match['layer'] is not None else None
+    return ServiceUrl(match['prefix'] + service_type, service_type, layer_id)
+
+
+def group_by_service_root(items: List[Any], url_of: Callable[[Any], str]
+                          ) -> Tuple[Dict[str, List[Tuple[Any, Optional[int]]]], List[Any]]:
+    """Split items into {root: [(item, sublayer id or None)]} for MapServer/FeatureServer URLs, and the rest.
+
+    Roots are compared case-insensitively, as ArcGIS REST paths are; each group is keyed by the
+    first spelling seen.
+    """
+    groups: Dict[str, List[Tuple[Any, Optional[int]]]] = {}
+    roots: Dict[str, str] = {}
+    others = []
+    for item in items:
+        parsed = parse_service_url(url_of(item))
+        if parsed is None or not parsed.bulk:
+            others.append(item)
+            continue
+        root = roots.setdefault(parsed.root.lower(), parsed.root)
+        groups.setdefault(root, []).append((item, parsed.layer_id))
+    return groups, others
+
+
+def load_crosswalk(csv_path: str = CROSSWALK_CSV) -> List[Dict[str, str]]:
+    """Read the crosswalk CSV into a list of row dicts, skipping rows without a layer name."""
+    # The export carries a UTF-8 BOM, so 'Status' would otherwise come back as '﻿Status'
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        return [row for row in csv.DictReader(f) if (row.get('Layer Name') or '').strip()]
+
+
+def crosswalk_services(rows=None) -> List[Dict[str, Any]]:
+    """Return {'name', 'url', 'layer_ids'} entries for the rows with an Open REST Service, one per service.
+
+    Rows naming sublayers of the same MapServer/FeatureServer share one entry for the service root, whose
+    layer_ids lists those sublayers (None when a row names the whole service, or the URL isn't a service).
+    """
+    if rows is None:
+        rows = load_catalog()
+    rows = [row for row in rows if (row.get('Open REST Service') or '').strip()]
+
+    groups, others = group_by_service_root(rows, lambda row: row.get('Open REST Service'))
+    services = []
+    for root, members in groups.items():
+        layer_ids = [layer_id for _, layer_id in members]
+        services.append({
+            'name': members[0][0]['Layer Name'].strip(),
+            'url': root,
+            'layer_ids': None if None in layer_ids else sorted(set(layer_ids))
+        })
+
+    seen = set()
+    for row in others:
+        url = normalize_service_url(row.get('Open REST Service'))
+        if url.lower() in seen:
+            continue
+        seen.add(url.lower())
+        services.append({
+            'name': row['Layer Name'].strip(),
+            'url': url,
+            'layer_ids': None
+        })
+
+    return services
+
+
+def categorize_layer(layer_name: str) -> str:
+    lower_name = layer_name.lower()
+    for category, keywords in CATEGORIES.items():
+        for keyword in keywords:
+            if keyword in lower_name:
+                return category
+    return 'Other'
+
+
+def processed_layers(rows: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, object]]:
+    """Convert crosswalk rows to the layer records written by scripts/process-data.js."""
+    if rows is None:
+        rows = load_crosswalk()
+
+    layers = []
+    for index, row in enumerate(rows):
+        layer_name = row.get('Layer Name') or ''
+        service_url = (row.get('Open REST Service') or '').strip()
+        layers.append({
+            'id': index + 1,
+            'name': layer_name,
+            'category': categorize_layer(layer_name),
+            'serviceUrl': service_url or None,
+            'status': row.get('Status') or 'Active',
+            'agency': row.get('Agency') or '',
+            'requiresDUA': row.get('DUA Required') == 'Yes',
+            'requiresGII': row.get('GII Access Required') == 'Yes',
+            'testStatus': 'untested',
+            'lastTested': None
+        })
+
+    return layers
+
+
+# Per-row flag bits kept in CatalogLayer.flags and Catalog.flags
+FLAG_DUA = 1
+FLAG_GII = 2
+FLAG_HAS_URL = 4
+
+# Crosswalk column -> CatalogLayer attribute ('DUA Required' / 'GII Access Required' live in flags)
+COLUMN_ATTRS = {
+    'Status': 'status',
+    'Layer Name': 'name',
+    'Old Hosting Location': 'old_location',
+    'New Hosting Location': 'new_location',
+    'Deprecation Justification': 'justification',
+    'Agency': 'agency',
+    'External Landing Page': 'landing_page',
+    'Open REST Service': 'service_url',
+    'Old Secure ID': 'old_secure_id',
+    'New ID': 'new_id',
+    'Open ID': 'open_id',
+    'category': 'category'
+}
+FLAG_COLUMNS = {
+    'DUA Required': FLAG_DUA,
+    'GII Access Required': FLAG_GII
+}
+# Columns with few distinct values, shared through sys.intern
+INTERNED_ATTRS = ('status', 'new_location', 'justification', 'agency', 'old_secure_id', 'new_id', 'category')
+
+
+class CatalogLayer:
+    """One crosswalk row. Supports row['Layer Name'] / row.get(...) like a DataFrame row."""
+
+    __slots__ = ('id', 'flags', 'test_status', 'last_tested') + tuple(COLUMN_ATTRS.values())
+
+    def __init__(self, layer_id: int, row: Dict[str, str]):
+        self.id = layer_id
+        self.test_status = None
+        self.last_tested = None
+        for column, attr in COLUMN_ATTRS.items():
+            value = (row.get(column) or '').strip() or None
+            if value is not None and attr in INTERNED_ATTRS:
+                value = sys.intern(value)
+            setattr(self, attr, value)
+        self.category = sys.intern(categorize_layer(self.name or ''))
+
+        flags = FLAG_HAS_URL if self.service_url else 0
+        for column, flag in FLAG_COLUMNS.items():
+            if (row.get(column) or '').strip() == 'Yes':
+                flags |= flag
+        self.flags = flags
+
+    @classmethod
+    def from_values(cls, layer_id: int, values: Dict[str, Optional[str]], flags: int,
+                    test_status: Optional[str] = None, last_tested: Optional[str] = None) -> 'CatalogLayer':
+        """Rebuild a record from already-normalized attribute values (see catalog_snapshot.py)."""
+        layer = cls.__new__(cls)
+        layer.id = layer_id
+        layer.flags = flags
+        layer.test_status = test_status
+        layer.last_tested = last_tested
+        for attr in COLUMN_ATTRS.values():
+            setattr(layer, attr, values.get(attr))
+        return layer
+
+    @property
+    def requires_dua(self) -> bool:
+        return bool(self.flags & FLAG_DUA)
+
+    @property
+    def requires_gii(self) -> bool:
+        return bool(self.flags & FLAG_GII)
+
+    @property
+    def has_url(self) -> bool:
+        return bool(self.flags & FLAG_HAS_URL)
+
+    def __getitem__(self, column: str) -> Any:
+        if column in FLAG_COLUMNS:
+            return 'Yes' if self.flags & FLAG_COLUMNS[column] else 'No'
+        return getattr(self, COLUMN_ATTRS[column])
+
+    def get(self, column: str, default: Any = None) -> Any:
+        if column not in COLUMN_ATTRS and column not in FLAG_COLUMNS:
+            return default
+        value = self[column]
+        return default if value is None else value
+
+    def __repr__(self) -> str:
+        return f"CatalogLayer({self.id}, {self.name!r})"
+
+
+class Catalog:
+    """The crosswalk as a list of CatalogLayer records plus a bytearray of their flags."""
+
+    def __init__(self, layers: List[CatalogLayer]):
+        self.layers = layers
+        self.flags = bytearray(layer.flags for layer in layers)
+        self._search_index = None
+
+    def __len__(self) -> int:
+        return len(self.layers)
+
+    def __iter__(self) -> Iterator[CatalogLayer]:
+        return iter(self.layers)
+
+    def __getitem__(self, position: int) -> CatalogLayer:
+        return self.layers[position]
+
+    def positions_with(self, flag: int, present: bool = True) -> List[int]:
+        """Row positions whose flags have (or, with present=False, lack) every bit in flag."""
+        return [i for i, flags in enumerate(self.flags) if ((flags & flag) == flag) == present]
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            from layer_search import LayerSearchIndex
+            self._search_index = LayerSearchIndex(self.layers)
+        return self._search_index
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[CatalogLayer]:
+        """Layers matching query, best first."""
+        return [self.layers[i] for i in self.search_index.rank(query, limit)]
+
+    def find(self, term: str) -> Optional[CatalogLayer]:
+        """The layer whose Open ID, or name ignoring case, is exactly term."""
+        lowered = term.lower()
+        for layer in self.layers:
+            if layer.open_id == term or (layer.name and layer.name.lower() == lowered):
+                return layer
+        return None
+
+    def no_match_message(self, term: str, limit: int = SUGGESTIONS) -> str:
+        """Why term names no layer, listing the closest search matches rather than guessing one."""
+        matches = self.search(term, limit=limit)
+        if not matches:
+            return f"No crosswalk layer matches {term!r}"
+        return f"No crosswalk layer is named {term!r}; closest matches:\n" + \
+            '\n'.join(f"  {match.name} ({match.open_id})" for match in matches)
+
+    def to_dataframe(self):
+        """The catalog as a pandas DataFrame with the crosswalk's column names."""
+        import pandas as pd
+        columns = [column for column in COLUMN_ATTRS if column != 'category']
+        data = {column: [layer[column] for layer in self.layers] for column in columns}
+        for column in FLAG_COLUMNS:
+            data[column] = [layer[column] for layer in self.layers]
+        data['category'] = [layer.category for layer in self.layers]
+        return pd.DataFrame(data)
+
+
+_catalogs: Dict[str, Catalog] = {}
+
+
+def load_catalog(csv_path: str = CROSSWALK_CSV, use_snapshot: bool = True) -> Catalog:
+    """Load (once per process) the crosswalk as a compact Catalog.
+
+    For the default crosswalk a fresh binary snapshot (catalog_snapshot.py) is preferred, which also
+    carries each layer's latest test status; a missing or stale snapshot falls back to the CSV.
+    """
+    if csv_path not in _catalogs:
+        catalog = None
+        if use_snapshot and csv_path == CROSSWALK_CSV:
+            from catalog_snapshot import load_fresh_snapshot
+            snapshot = load_fresh_snapshot()
+            if snapshot is not None:
+                catalog = snapshot.to_catalog()
+                snapshot.close()
+        if catalog is None:
+            rows = load_crosswalk(csv_path)
+            catalog = Catalog([CatalogLayer(i + 1, row) for i, row in enumerate(rows)])
+        _catalogs[csv_path] = catalog
+    return _catalogs[csv_path]
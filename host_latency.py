@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Per-host response latency, remembered across runs.
+Each host keeps an HDR-style histogram (log-spaced buckets about 4% wide, 1 ms to 10 minutes) in
+.cache/host-latency.json. Old samples decay as new ones arrive, so the percentiles follow how a host
+behaves now. Request timeouts are derived from each host's p99, so fast hosts fail fast and slow
+MapServers get the time they usually need. Timed-out requests count at no more than the p99, so a
+stalling host does not push its own timeout up.
+"""
+
+import json
+import math
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from hifld_catalog import REPO_DIR
+
+DEFAULT_LATENCY_PATH = os.path.join(REPO_DIR, '.cache', 'host-latency.json')
+# Bucket i covers latencies up to GROWTH ** i milliseconds
+GROWTH = 1.04
+MAX_MS = 600_000
+# Once a host has this many (decayed) samples, all counts are halved
+WINDOW = 2000
+# Below this many samples the caller's default timeout is used
+MIN_SAMPLES = 20
+# timeout = p99 * TIMEOUT_MARGIN + TIMEOUT_SLACK, clamped to [MIN_TIMEOUT, MAX_TIMEOUT]
+TIMEOUT_MARGIN = 1.5
+TIMEOUT_SLACK = 1.0
+MIN_TIMEOUT = 2.0
+MAX_TIMEOUT = 120.0
+
+
+def adaptive_timeout(p99: float) -> float:
+    return min(MAX_TIMEOUT, max(MIN_TIMEOUT, p99 * TIMEOUT_MARGIN + TIMEOUT_SLACK))
+
+
+class LatencyHistogram:
+    """Log-bucketed latency counts; quantiles are accurate to one bucket width."""
+
+    def __init__(self, counts: Optional[Dict[int, float]] = None):
+        self.counts: Dict[int, float] = counts or {}
+        self.total = sum(self.counts.values())
+
+    def record(self, seconds: float):
+        ms = min(max(seconds * 1000, 1.0), MAX_MS)
+        bucket = math.ceil(math.log(ms, GROWTH))
+        self.counts[bucket] = self.counts.get(bucket, 0.0) + 1
+        self.total += 1
+        if self.total > WINDOW:
+            self.counts = {b: count / 2 for b, count in self.counts.items() if count >= 0.02}
+            self.total = sum(self.counts.values())
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency in seconds below which a fraction q of the samples fall."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0.0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return GROWTH ** bucket / 1000
+        return GROWTH ** max(self.counts) / 1000
+
+
+class HostLatency:
+    """Latency histograms for every host, loaded from and saved to one JSON file."""
+
+    def __init__(self, path: str = DEFAULT_LATENCY_PATH):
+        self.path = path
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                hosts = json.load(f).get('hosts', {})
+        except (OSError, ValueError):
+            hosts = {}
+        for host, entry in hosts.items():
+            self.histograms[host] = LatencyHistogram(
+                {int(bucket): count for bucket, count in entry.get('buckets', {}).items()})
+
+    def record(self, host: str, seconds: float):
+        with self._lock:
+            if host not in self.histograms:
+                self.histograms[host] = LatencyHistogram()
+            self.histograms[host].record(seconds)
+
+    def record_timeout(self, host: str, seconds: float):
+        """Count a request that timed out after seconds, capped at the host's p99.
+
+        Recording the full wait would raise the p99, and with it the next timeout, every time a
+        host stalls, until timeouts reach MAX_TIMEOUT. Until the host has a p99, timeouts are not
+        recorded.
+        """
+        percentiles = self.percentiles(host)
+        if percentiles:
+            self.record(host, min(seconds, percentiles['p99']))
+
+    def percentiles(self, host: str) -> Optional[Dict[str, float]]:
+        histogram = self.histograms.get(host)
+        if histogram is None or histogram.total < MIN_SAMPLES:
+            return None
+        with self._lock:
+            return {'samples': histogram.total, 'p50': histogram.quantile(0.50),
+                    'p95': histogram.quantile(0.95), 'p99': histogram.quantile(0.99)}
+
+    def timeout(self, host: str, default: float) -> float:
+        """Seconds to wait for host: its p99 plus a margin, or default until enough is known."""
+        percentiles = self.percentiles(host)
+        return adaptive_timeout(percentiles['p99']) if percentiles else default
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Learned percentiles per host, slowest p99 first."""
+        rows = []
+        for host in list(self.histograms):
+            percentiles = self.percentiles(host)
+            if percentiles:
+                rows.append({'host': host, **percentiles, 'timeout': adaptive_timeout(percentiles['p99'])})
+        return sorted(rows, key=lambda row: -row['p99'])
+
+    def save(self):
+        # The derived timeout is stored too, so scripts/test-layers.js can use it without the histogram
+        with self._lock:
+            hosts = {}
+            for host, histogram in self.histograms.items():
+                entry = {'buckets': {str(b): round(c, 3) for b, c in sorted(histogram.counts.items())}}
+                if histogram.total >= MIN_SAMPLES:
+                    entry['timeout'] = round(adaptive_timeout(histogram.quantile(0.99)), 2)
+                hosts[host] = entry
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'growth': GROWTH, 'hosts': hosts}, f)
+        os.replace(tmp_path, self.path)
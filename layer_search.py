@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+HIFLD Layer Search
+Inverted index over the crosswalk's Layer Name, Agency and category, built once so each query
+only touches the postings of the terms it matches instead of scanning every row.
+
+Query syntax: terms are prefix-matched and ANDed ("fire sta"); "or" separates alternatives
+("hospital or clinic"); an explicit "and" is accepted and ignored.
+
+rank() is the relevance-ordered alternative: BM25 over weighted name/agency/category/justification
+fields, with misspelled terms resolved through a symmetric-delete index so edit distances are only
+computed for a handful of candidate terms rather than for every row. It lists rows matching any
+term; ranked_search() keeps search()'s matches and orders them by that score instead.
+"""
+
+import math
+import re
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from hifld_catalog import categorize_layer
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+INDEXED_FIELDS = ('Layer Name', 'Agency', 'category')
+
+# BM25 field weights: a hit in the layer name counts three times a hit in the agency
+RANKED_FIELDS = {
+    'Layer Name': 3.0,
+    'Agency': 1.0,
+    'category': 1.0,
+    'Deprecation Justification': 0.5
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Weight given to a query term that only matched as a prefix or through a typo correction
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+
+
+def tokenize(text: Any) -> List[str]:
+    if not isinstance(text, str):
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def stem(token: str) -> str:
+    """Fold plurals so 'hospital' and 'Hospitals' rank as the same term."""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def deletes(term: str) -> Set[str]:
+    """The term plus every variant with one character removed."""
+    return {term} | {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, giving up (returning limit + 1) once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def max_typos(term: str) -> int:
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 7 else 2
+
+
+class LayerSearchIndex:
+    """Term -> sorted row positions, plus a sorted vocabulary for prefix expansion."""
+
+    def __init__(self, records: Sequence[Mapping[str, Any]], fields: Sequence[str] = INDEXED_FIELDS,
+                 ranked_fields: Mapping[str, float] = RANKED_FIELDS):
+        self.size = len(records)
+        postings: Dict[str, Set[int]] = {}
+        # term -> {row: field-weighted term frequency}, for BM25
+        self.term_freqs: Dict[str, Dict[int, float]] = {}
+        self.doc_lengths: List[float] = []
+
+        for position, record in enumerate(records):
+            length = 0.0
+            for field in set(fields) | set(ranked_fields):
+                value = record.get(field)
+                if value is None and field == 'category':
+                    value = categorize_layer(record.get('Layer Name') or '')
+                tokens = tokenize(value)
+                if field in fields:
+                    for token in tokens:
+                        postings.setdefault(token, set()).add(position)
+                weight = ranked_fields.get(field)
+                if weight:
+                    length += weight * len(tokens)
+                    for token in map(stem, tokens):
+                        freqs = self.term_freqs.setdefault(token, {})
+                        freqs[position] = freqs.get(position, 0.0) + weight
+            self.doc_lengths.append(length)
+
+        self.postings: Dict[str, List[int]] = {term: sorted(rows) for term, rows in postings.items()}
+        self.vocabulary: List[str] = sorted(self.postings)
+        self.ranked_vocabulary: List[str] = sorted(self.term_freqs)
+        self.average_length = (sum(self.doc_lengths) / self.size) if self.size else 0.0
+        self.idf = {
+            term: math.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            for term, rows in self.term_freqs.items()
+        }
+
+        # Symmetric-delete index: single-character deletions of every term -> terms
+        self.delete_index: Dict[str, List[str]] = {}
+        for term in self.term_freqs:
+            if max_typos(term):
+                for variant in deletes(term):
+                    self.delete_index.setdefault(variant, []).append(term)
+
+    @classmethod
+    def from_dataframe(cls, df, fields: Sequence[str] = INDEXED_FIELDS) -> 'LayerSearchIndex':
+        """Index a crosswalk DataFrame; positions line up with df.iloc."""
+        return cls(df.to_dict('records'), fields)
+
+    def expand(self, prefix: str) -> List[str]:
+        """All indexed terms starting with prefix."""
+        start = bisect_left(self.vocabulary, prefix)
+        end = start
+        while end < len(self.vocabulary) and self.vocabulary[end].startswith(prefix):
+            end += 1
+        return self.vocabulary[start:end]
+
+    def lookup(self, prefix: str) -> Set[int]:
+        """Rows containing any term that starts with prefix."""
+        terms = self.expand(prefix)
+        if len(terms) == 1:
+            return set(self.postings[terms[0]])
+        rows: Set[int] = set()
+        for term in terms:
+            rows.update(self.postings[term])
+        return rows
+
+    def _match_all(self, terms: Iterable[str]) -> Set[int]:
+        # Intersect smallest posting sets first so the working set only shrinks
+        candidate_sets = sorted((self.lookup(term) for term in terms), key=len)
+        if not candidate_sets:
+            return set()
+        rows = candidate_sets[0]
+        for other in candidate_sets[1:]:
+            if not rows:
+                break
+            rows = rows & other
+        return rows
+
+    def search(self, query: str, mode: Optional[str] = None) -> List[int]:
+        """Row positions matching query, in catalog order.
+
+        mode='and' or mode='or' applies that operator to every term and ignores "or" keywords.
+        """
+        tokens = tokenize(query)
+        if mode == 'or':
+            groups = [[token] for token in tokens if token not in ('and', 'or')]
+        elif mode == 'and':
+            groups = [[token for token in tokens if token not in ('and', 'or')]]
+        else:
+            groups = [[]]
+            for token in tokens:
+                if token == 'or':
+                    groups.append([])
+                elif token != 'and':
+                    groups[-1].append(token)
+
+        rows: Set[int] = set()
+        for group in groups:
+            if group:
+                rows |= self._match_all(group)
+        return sorted(rows)
+
+    def corrections(self, token: str) -> Dict[str, int]:
+        """Indexed terms within max_typos(token) edits of token, with their distances."""
+        limit = max_typos(token)
+        if not limit:
+            return {}
+        # Sharing a single-deletion variant finds every one-edit typo and the common two-edit
+        # ones (a dropped or doubled letter plus one more slip); two substitutions are missed
+        candidates: Set[str] = set()
+        for variant in deletes(token):
+            candidates.update(self.delete_index.get(variant, ()))
+        found = {}
+        for term in candidates:
+            distance = edit_distance(token, term, limit)
+            if distance <= limit:
+                found[term] = distance
+        return found
+
+    def expand_ranked(self, token: str) -> Dict[str, float]:
+        """Weighted indexed terms a query token stands for: exact, prefix, then typo matches."""
+        expansions: Dict[str, float] = {}
+        if token in self.term_freqs:
+            expansions[token] = 1.0
+        if len(token) >= 3:
+            start = bisect_left(self.ranked_vocabulary, token)
+            for term in self.ranked_vocabulary[start:]:
+                if not term.startswith(token):
+                    break
+                expansions.setdefault(term, PREFIX_WEIGHT)
+        if not expansions:
+            for term, distance in self.corrections(token).items():
+                expansions[term] = FUZZY_WEIGHT / distance
+        return expansions
+
+    def rank_scored(self, query: str, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(row position, BM25 score) pairs for query, best first."""
+        scores: Dict[int, float] = {}
+        for token in tokenize(query):
+            if token in ('and', 'or'):
+                continue
+            token = stem(token)
+            # A row scores once per query token, through its best-matching expansion
+            best: Dict[int, float] = {}
+            for term, weight in self.expand_ranked(token).items():
+                idf = self.idf[term]
+                for position, tf in self.term_freqs[term].items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[position] / self.average_length)
+                    score = weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    if score > best.get(position, 0.0):
+                        best[position] = score
+            for position, score in best.items():
+                scores[position] = scores.get(position, 0.0) + score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def rank(self, query: str, limit: Optional[int] = None) -> List[int]:
+        """Row positions for query ordered by relevance; use with df.iloc like search()."""
+        return [position for position, _ in self.rank_scored(query, limit)]
+
+    def ranked_search(self, query: str, limit: Optional[int] = None) -> List[int]:
+        """search()'s matches (every term must match) ordered by relevance, best first.
+
+        Only when nothing matches, e.g. because a term is misspelled, does it fall back to rank(),
+        where rows matching any term are listed.
+        """
+        matches = self.search(query)
+        if not matches:
+            return self.rank(query, limit)
+        scores = dict(self.rank_scored(query))
+        ranked = sorted(matches, key=lambda position: (-scores.get(position, 0.0), position))
+        return ranked[:limit] if limit else ranked
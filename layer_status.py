@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Layer Status Helpers
+Per-layer availability checks in the format of public/layer-test-results.json, plus the planning
+used by the tester's incremental mode to decide which layers actually need a new probe.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Statuses that are always re-probed on the next incremental run
+RETRY_STATUSES = {'failed', 'timeout', 'unreachable', 'auth_required', 'untested'}
+
+# Fields written by a probe and carried forward when a layer is skipped
+TEST_FIELDS = ('testStatus', 'testError', 'testNote', 'testMetadata', 'lastTested')
+
+# ArcGIS error codes meaning "token required / not authorized"
+AUTH_ERROR_CODES = {401, 403, 498, 499}
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def iso_timestamp(moment: datetime) -> str:
+    """Format like JavaScript's Date.toISOString(), which the web app already parses."""
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def static_status(layer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Status decided from the catalog alone, matching scripts/test-layers.js; None if a probe is needed."""
+    if not layer.get('serviceUrl'):
+        return {**layer, 'testStatus': 'no_url', 'testError': 'No service URL provided'}
+    if layer.get('requiresDUA') or layer.get('requiresGII'):
+        return {**layer, 'testStatus': 'restricted', 'testError': 'Requires authentication'}
+    return None
+
+
+def load_previous_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """Previous per-layer results keyed by layer name (names are unique in the crosswalk)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        document = json.load(f)
+    return {layer['name']: layer for layer in document.get('results', [])}
+
+
+def needs_probe(layer: Dict[str, Any], previous: Optional[Dict[str, Any]],
+                max_age: timedelta, now: datetime) -> Optional[str]:
+    """Return why a layer must be re-probed, or None if its previous result can be carried forward."""
+    if previous is None:
+        return 'new'
+    if previous.get('serviceUrl') != layer.get('serviceUrl'):
+        return 'url_changed'
+    if previous.get('testStatus') in RETRY_STATUSES:
+        return previous['testStatus']
+    last_tested = parse_timestamp(previous.get('lastTested'))
+    if last_tested is None or now - last_tested > max_age:
+        return 'stale'
+    return None
+
+
+def plan_incremental(layers: List[Dict[str, Any]], previous: Dict[str, Dict[str, Any]],
+                     max_age: timedelta, now: Optional[datetime] = None
+                     ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, int]]:
+    """Split catalog layers into (to_probe, settled, reasons).
+
+    settled holds final records: static no_url/restricted statuses plus carried-forward results,
+    which keep the current catalog fields (id, category, ...) and the previous test fields.
+    """
+    now = now or utc_now()
+    to_probe, settled, reasons = [], [], {}
+
+    for layer in layers:
+        fixed = static_status(layer)
+        if fixed is not None:
+            settled.append(fixed)
+            continue
+
+        prev = previous.get(layer['name'])
+        reason = needs_probe(layer, prev, max_age, now)
+        if reason is None:
+            carried = dict(layer)
+            carried.update({field: prev[field] for field in TEST_FIELDS if field in prev})
+            settled.append(carried)
+        else:
+            reasons[reason] = reasons.get(reason, 0) + 1
+            to_probe.append(layer)
+
+    return to_probe, settled, reasons
+
+
+def status_from_body(layer: Dict[str, Any], body: Any, url: str) -> Dict[str, Any]:
+    tested = iso_timestamp(utc_now())
+    if isinstance(body, dict) and isinstance(body.get('error'), dict):
+        code = body['error'].get('code')
+        if code in AUTH_ERROR_CODES:
+            return {**layer, 'testStatus': 'restricted', 'testError': 'Authentication required',
+                    'lastTested': tested}
+        return {**layer, 'testStatus': 'failed', 'testError': body['error'].get('message') or f"Error {code}",
+                'lastTested': tested}
+    return {**layer, 'testStatus': 'working',
+            'testMetadata': {'responseType': 'object' if isinstance(body, (dict, list)) else 'string',
+                             'hasData': bool(body), 'url': url},
+            'lastTested': tested}
+
+
+def status_from_service_layers(layer: Dict[str, Any], layer_id: Optional[int], body: Any) -> Optional[Dict[str, Any]]:
+    """Status of a catalog layer from its service root's /layers?f=json document.
+    
+    layer_id is the sublayer the row's serviceUrl names (None for the service itself). Returns None when
+    the document can't tell, e.g. a server too old to have /layers; the row is then probed on its own.
+    """
+    url = layer['serviceUrl']
+    if isinstance(body, dict) and isinstance(body.get('error'), dict):
+        return status_from_body(layer, body, url) if body['error'].get('code') in AUTH_ERROR_CODES else None
+    if not isinstance(body, dict) or 'layers' not in body:
+        return None
+    if layer_id is None:
+        return status_from_body(layer, body, url)
+    for definition in body['layers'] + (body.get('tables') or []):
+        if definition.get('id') == layer_id:
+            return status_from_body(layer, definition, url)
+    return {**layer, 'testStatus': 'failed', 'testError': f"Layer {layer_id} not found in service",
+            'lastTested': iso_timestamp(utc_now())}
+
+
+def http_status(error: BaseException) -> Optional[int]:
+    """HTTP status carried by a requests or aiohttp exception, if any."""
+    return getattr(getattr(error, 'response', None), 'status_code', None) or getattr(error, 'status', None)
+
+
+def status_from_error(layer: Dict[str, Any], error: BaseException) -> Dict[str, Any]:
+    """Map a requests/aiohttp exception onto the testStatus values used by the web app."""
+    status = http_status(error)
+    if status in (401, 403):
+        test_status, message = 'restricted', 'Authentication required'
+    elif isinstance(error, (requests.Timeout, asyncio.TimeoutError)):
+        test_status, message = 'timeout', 'Request timeout'
+    elif isinstance(error, requests.ConnectionError) or (
+            aiohttp is not None and isinstance(error, aiohttp.ClientConnectionError)):
+        test_status, message = 'unreachable', 'Service unreachable'
+    else:
+        test_status, message = 'failed', str(error) or type(error).__name__
+    return {**layer, 'testStatus': test_status, 'testError': message, 'lastTested': iso_timestamp(utc_now())}
+
+
+def build_results_document(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Assemble the layer-test-results.json document (results, categorized, stats, testDate)."""
+    results = sorted(results, key=lambda layer: layer['id'])
+    categorized: Dict[str, List[Dict[str, Any]]] = {}
+    for layer in results:
+        categorized.setdefault(layer['category'], []).append(layer)
+
+    stats = {'total': len(results)}
+    for status in ('working', 'failed', 'restricted', 'no_url', 'timeout', 'unreachable', 'auth_required'):
+        stats[status] = sum(1 for layer in results if layer.get('testStatus') == status)
+
+    return {
+        'results': results,
+        'categorized': categorized,
+        'stats': stats,
+        'testDate': iso_timestamp(utc_now())
+    }
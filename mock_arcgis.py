@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+ArcGIS REST Mock Server
+Local stand-in for the ArcGIS services that fema_layer_tester.py and feature_extractor.py call. It
+replays recorded responses, so throughput can be benchmarked and regressions caught without live
+endpoints.
+
+A fixture directory holds:
+  responses.jsonl   recorded ?f=json, /query and returnIdsOnly responses, matched on host, path
+                    and parameters
+  services.json     the services that were recorded (used by `bench`)
+  features/         optional feature store of whole layers; /query requests with no recorded
+                    response are answered from it (paging, objectIds, BETWEEN ranges, returnIdsOnly)
+
+The mock answers http://<mock>/<original host>/<original path>. With ARCGIS_MOCK_URL set, every
+ArcGISSession and AsyncArcGISSession sends its requests there. Latency, error rate, page size limits
+and per-host 429 throttling are configurable, and randomness is seeded so runs repeat.
+
+    python3 mock_arcgis.py record fixtures/fema --features     # DEFAULT_SERVICES, recorded live
+    python3 mock_arcgis.py serve fixtures/fema --latency 80 --rate 10
+    ARCGIS_MOCK_URL=http://127.0.0.1:8765 python3 fema_layer_tester.py --no-cache
+    python3 mock_arcgis.py bench fixtures/fema --latency 50 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+
+try:
+    from aiohttp import web
+except ImportError:  # checked in create_app()
+    web = None
+
+from arcgis_http import MOCK_URL_ENV, ArcGISSession, HostRateLimiter, TokenBucket
+from feature_extractor import LayerExtractor
+from feature_store import FeatureStore
+from hifld_catalog import crosswalk_services
+from response_cache import cache_key
+from spatial_filter import TILE_DEGREES, SpatialFilter
+from tile_server import QueryError, StoredLayer, arcgis_error, query_layer
+
+DEFAULT_PORT = 8765
+RESPONSES_FILE = 'responses.jsonl'
+SERVICES_FILE = 'services.json'
+FEATURES_DIR = 'features'
+# Parameters that never change what ArcGIS returns
+IGNORED_PARAMS = {'token'}
+
+
+def split_url(url: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str]]:
+    """('host/path', parameters) for a request, merging the URL's query string into params."""
+    parsed = urlparse(url)
+    merged = dict(parse_qsl(parsed.query, keep_blank_values=True))
+    for name, value in (params or {}).items():
+        merged[name] = str(value).lower() if isinstance(value, bool) else str(value)
+    for name in IGNORED_PARAMS:
+        merged.pop(name, None)
+    return f"{parsed.netloc.lower()}{parsed.path}".rstrip('/'), merged
+
+
+def layer_key(layer_url: str) -> str:
+    """Feature store id for a recorded layer URL."""
+    base, _ = split_url(layer_url)
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()[:16]
+
+
+class MockConfig:
+    """Faults and limits the mock applies to every request."""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 error_status: int = 500, rate: Optional[float] = None, burst: Optional[int] = None,
+                 max_records: Optional[int] = None, pagination: bool = True, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate or 1))
+        self.max_records = max_records
+        self.pagination = pagination
+        self.seed = seed
+
+
+class Fixtures:
+    """Recorded responses plus the optional feature store behind synthesized /query answers."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.responses: Dict[str, Dict[str, Any]] = {}
+        path = os.path.join(root, RESPONSES_FILE)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.responses[cache_key(record['url'], record['params'])] = record
+        self.store = FeatureStore(os.path.join(root, FEATURES_DIR))
+        self._layers: Dict[str, StoredLayer] = {}
+
+    def services(self) -> List[Dict[str, str]]:
+        path = os.path.join(self.root, SERVICES_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def layer(self, layer_url: str) -> Optional[StoredLayer]:
+        open_id = layer_key(layer_url)
+        if open_id not in self.store:
+            return None
+        if open_id not in self._layers:
+            self._layers[open_id] = StoredLayer(self.store, open_id)
+        return self._layers[open_id]
+
+    def save(self, responses: Dict[str, Dict[str, Any]], services: List[Dict[str, str]]):
+        """Merge newly recorded responses and services into the fixture files."""
+        os.makedirs(self.root, exist_ok=True)
+        self.responses.update(responses)
+        with open(os.path.join(self.root, RESPONSES_FILE), 'w', encoding='utf-8') as f:
+            for key in sorted(self.responses):
+                f.write(json.dumps(self.responses[key], separators=(',', ':'), sort_keys=True) + '\n')
+        known = {service['url']: service for service in self.services()}
+        known.update({service['url']: service for service in services})
+        with open(os.path.join(self.root, SERVICES_FILE), 'w', encoding='utf-8') as f:
+            json.dump(list(known.values()), f, indent=2)
+
+
+class RecordingSession(ArcGISSession):
+    """ArcGISSession that keeps every JSON response it receives, keyed the way the mock looks them up."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.responses: Dict[str, Dict[str, Any]] = {}
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None, cache: bool = False) -> Dict[str, Any]:
+        data = super().get_json(url, params, timeout)
+        base, merged = split_url(url, params)
+        self.responses[cache_key(base, merged)] = {'url': base, 'params': merged, 'body': data}
+        return data
+
+
+# --- Server ---------------------------------------------------------------------------------
+
+class MockArcGIS:
+    """Request handler applying the configured faults before answering from the fixtures."""
+
+    def __init__(self, fixtures: Fixtures, config: MockConfig):
+        self.fixtures = fixtures
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.stats = {'requests': 0, 'recorded': 0, 'synthesized': 0, 'throttled': 0, 'errors': 0,
+                      'unmatched': 0}
+        self.unmatched: List[str] = []
+
+    def _layer_document(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the page size and pagination overrides to a layer's ?f=json document."""
+        if 'maxRecordCount' not in document:
+            return document
+        document = dict(document)
+        if self.config.max_records:
+            document['maxRecordCount'] = min(document.get('maxRecordCount') or self.config.max_records,
+                                             self.config.max_records)
+        if not self.config.pagination:
+            capabilities = dict(document.get('advancedQueryCapabilities') or {})
+            capabilities['supportsPagination'] = False
+            document['advancedQueryCapabilities'] = capabilities
+        return document
+
+    def answer(self, base: str, params: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        record = self.fixtures.responses.get(cache_key(base, params))
+        if record is not None:
+            self.stats['recorded'] += 1
+            return self._layer_document(record['body'])
+
+        if base.endswith('/query'):
+            layer = self.fixtures.layer(base[:-len('/query')])
+            if layer is None:
+                return None
+            self.stats['synthesized'] += 1
+            if not self.config.pagination and params.get('resultOffset'):
+                return arcgis_error("Pagination is not supported.")
+            try:
+                document, _ = query_layer(layer, {**params, 'f': 'json'},
+                                          self.config.max_records or layer.layer_info()['maxRecordCount'])
+            except QueryError as e:
+                return arcgis_error(str(e))
+            return document
+
+        layer = self.fixtures.layer(base)
+        if layer is None:
+            return None
+        self.stats['synthesized'] += 1
+        return self._layer_document(layer.layer_info())
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        host = request.match_info['host'].lower()
+        params = {name: value for name, value in request.query.items() if name not in IGNORED_PARAMS}
+        if request.method == 'POST':
+            params.update({name: str(value) for name, value in (await request.post()).items()
+                           if name not in IGNORED_PARAMS})
+        base = f"{host}/{request.match_info['path']}".rstrip('/')
+
+        if self.config.rate:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.config.rate, self.config.burst)
+            wait = self.buckets[host].try_acquire()
+            if wait:
+                self.stats['throttled'] += 1
+                return web.json_response(arcgis_error("Too many requests.", 429), status=429,
+                                         headers={'Retry-After': str(max(1, math.ceil(wait)))})
+
+        latency = self.config.latency_ms + self.random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+        if self.config.error_rate and self.random.random() < self.config.error_rate:
+            self.stats['errors'] += 1
+            return web.json_response(arcgis_error("Injected failure.", self.config.error_status),
+                                     status=self.config.error_status)
+
+        document = self.answer(base, params)
+        if document is None:
+            self.stats['unmatched'] += 1
+            if len(self.unmatched) < 100:
+                self.unmatched.append(f"{base}?{'&'.join(f'{k}={v}' for k, v in sorted(params.items()))}")
+            return web.json_response(arcgis_error(f"No fixture for {base}", 404), status=404)
+        # ArcGIS answers f=json with text/plain; the clients never check
+        return web.Response(text=json.dumps(document, separators=(',', ':')), content_type='text/plain')
+
+    async def stats_handler(self, request):
+        return web.json_response({**self.stats, 'unmatched_urls': self.unmatched})
+
+
+def create_app(fixtures: Fixtures, config: Optional[MockConfig] = None):
+    if web is None:
+        raise RuntimeError("mock_arcgis.py requires aiohttp (pip install aiohttp)")
+    mock = MockArcGIS(fixtures, config or MockConfig())
+    app = web.Application()
+    app['mock'] = mock
+    app.router.add_get('/_mock/stats', mock.stats_handler)
+    app.router.add_route('*', '/{host}/{path:.*}', mock.handle)
+    return app
+
+
+class MockServer:
+    """Runs the mock on a background thread: `with MockServer(fixtures, config) as base_url:`."""
+
+    def __init__(self, fixtures: Fixtures, config: Optional[MockConfig] = None, host: str = '127.0.0.1',
+                 port: int = 0):
+        self.app = create_app(fixtures, config)
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def mock(self) -> MockArcGIS:
+        return self.app['mock']
+
+    def __enter__(self) -> str:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        runner = web.AppRunner(self.app, access_log=None)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.SockSite(runner, sock).start())
+        self.runner = runner
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return f"http://{self.host}:{self.port}"
+
+    def __exit__(self, *exc_info):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+
+# --- record / bench ---------------------------------------------------------------------------
+
+def record(fixtures_dir: str, services: List[Dict[str, str]], features: bool = False) -> Dict[str, int]:
+    """Run the tester against live services, saving every response (and optionally whole layers)."""
+    from fema_layer_tester import FEMALayerTester
+
+    fixtures = Fixtures(fixtures_dir)
+    tester = FEMALayerTester()
+    recorder = RecordingSession(tester.limiter)
+    tester.http = recorder
+    results = tester.run_tests(services)
+
+    stored = 0
+    if features:
+        for result in results.values():
+            for layer in result['layers']:
+                if layer['error']:
+                    continue
+                layer_url = f"{result['base_url'].rstrip('/')}/{layer['id']}"
+                extractor = LayerExtractor(layer_url, http=ArcGISSession(tester.limiter))
+                fixtures.store.write(layer_key(layer_url), extractor.iter_batches(), extractor.layer_info(),
+                                     {'name': layer['name'], 'layer_url': layer_url})
+                stored += 1
+    fixtures.save(recorder.responses, services)
+    return {'responses': len(recorder.responses), 'layers': stored}
+
+
+def bench(fixtures_dir: str, config: MockConfig, concurrency: int = 32, per_host: int = 6):
+    """Time the tester (sync and async) and the extractor against the mock."""
+    from fema_layer_tester import FEMALayerTester
+
+    fixtures = Fixtures(fixtures_dir)
+    services = fixtures.services()
+    layers = [(open_id, metadata.get('name') or open_id, metadata.get('layer_url'))
+              for open_id, metadata in ((open_id, fixtures.store.metadata(open_id))
+                                        for open_id in fixtures.store.open_ids())]
+    server = MockServer(fixtures, config)
+    previous = os.environ.get(MOCK_URL_ENV)
+    with server as base_url:
+        os.environ[MOCK_URL_ENV] = base_url
+        try:
+            def run(label, work):
+                before = dict(server.mock.stats)
+                start_time = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    try:
+                        outcome = work()
+                    except Exception as e:
+                        # Once retries are exhausted, an injected failure or 429 ends the run
+                        outcome = f"❌ {type(e).__name__}: {str(e)[:60]}"
+                elapsed = time.perf_counter() - start_time
+                requests = server.mock.stats['requests'] - before['requests']
+                throttled = server.mock.stats['throttled'] - before['throttled']
+                print(f"{label:<24} {elapsed:7.2f}s  {requests:6} requests  {requests / elapsed:8.1f} req/s  "
+                      f"{throttled:4} throttled  {outcome}")
+
+            def tiled_outcome(open_id, layer_url):
+                # A 2x2-tile bbox whose tiles meet at the layer's center, so each of them holds features;
+                # one worker makes any tile lost between batches show up as a short count
+                stored = StoredLayer(fixtures.store, open_id)
+                extent = stored.extent()
+                x, y = (extent['xmin'] + extent['xmax']) / 2, (extent['ymin'] + extent['ymax']) / 2
+                spatial_filter = SpatialFilter.from_bbox(x - TILE_DEGREES, y - TILE_DEGREES,
+                                                         x + TILE_DEGREES, y + TILE_DEGREES)
+                extractor = LayerExtractor(layer_url, spatial_filter=spatial_filter, workers=1)
+                count = sum(len(b) for b in extractor.iter_batches())
+                expected = int((~np.isnan(stored.bounds[:, 0])).sum())
+                if count != expected:
+                    return f"❌ {count} features, expected {expected}"
+                return f"{count} features"
+
+            def tester_outcome(results):
+                layers = [layer for result in results.values() for layer in result['layers']]
+                failed = sum(bool(result['error']) for result in results.values()) + \
+                    sum(bool(layer['error']) for layer in layers)
+                return f"{len(layers)} layers, {failed} errors"
+
+            if services:
+                run("tester (sync)", lambda: tester_outcome(FEMALayerTester(HostRateLimiter()).run_tests(services)))
+                run("tester (async)", lambda: tester_outcome(FEMALayerTester(HostRateLimiter()).run_tests_async(
+                    services, concurrency=concurrency, per_host=per_host)))
+            for open_id, name, layer_url in layers:
+                run(f"extract {name[:16]}",
+                    lambda: f"{sum(len(b) for b in LayerExtractor(layer_url).iter_batches())} features")
+                run(f"extract {name[:16]} (ranges)",
+                    lambda: f"{sum(len(b) for b in LayerExtractor(layer_url).iter_partitions())} features")
+                run(f"extract {name[:16]} (tiled)", lambda: tiled_outcome(open_id, layer_url))
+        finally:
+            if previous is None:
+                os.environ.pop(MOCK_URL_ENV, None)
+            else:
+                os.environ[MOCK_URL_ENV] = previous
+    if server.mock.unmatched:
+        print(f"❌ {len(server.mock.unmatched)} requests had no fixture, e.g. {server.mock.unmatched[0]}")
+
+
+def _add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=0, help="added latency per request (ms)")
+    parser.add_argument('--jitter', type=float, default=0, help="uniform +/- jitter on the latency (ms)")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument('--rate', type=float, default=None, help="requests per second per host before 429s")
+    parser.add_argument('--burst', type=int, default=None, help="token bucket size for --rate")
+    parser.add_argument('--max-records', type=int, default=None, help="cap maxRecordCount / page size")
+    parser.add_argument('--no-pagination', action='store_true', help="report supportsPagination false")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def _config(args) -> MockConfig:
+    return MockConfig(args.latency, args.jitter, args.error_rate, args.error_status, args.rate, args.burst,
+                      args.max_records, not args.no_pagination, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock ArcGIS REST server backed by recorded fixtures")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help="record live responses into a fixture directory")
+    record_parser.add_argument('fixtures')
+    record_parser.add_argument('--url', action='append', default=[], help="service URL to record (repeatable)")
+    record_parser.add_argument('--crosswalk', action='store_true', help="every Open REST Service in the crosswalk")
+    record_parser.add_argument('--features', action='store_true', help="also store every layer's features")
+    serve_parser = subparsers.add_parser('serve', help="serve a fixture directory")
+    serve_parser.add_argument('fixtures')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    _add_fault_arguments(serve_parser)
+    bench_parser = subparsers.add_parser('bench', help="time the tester and extractor against the mock")
+    bench_parser.add_argument('fixtures')
+    bench_parser.add_argument('--concurrency', type=int, default=32)
+    bench_parser.add_argument('--per-host', type=int, default=6)
+    _add_fault_arguments(bench_parser)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        from fema_layer_tester import DEFAULT_SERVICES
+        if args.url:
+            services = [{'name': url, 'url': url} for url in args.url]
+        else:
+            services = crosswalk_services() if args.crosswalk else DEFAULT_SERVICES
+        counts = record(args.fixtures, services, args.features)
+        print(f"Recorded {counts['responses']} responses and {counts['layers']} layers into {args.fixtures}")
+        return
+
+    if web is None:
+        print("❌ mock_arcgis.py requires aiohttp (pip install aiohttp)")
+        return
+    if args.command == 'bench':
+        bench(args.fixtures, _config(args), args.concurrency, args.per_host)
+        return
+
+    fixtures = Fixtures(args.fixtures)
+    print(f"Serving {len(fixtures.responses)} recorded responses and {len(fixtures.store.open_ids())} layers")
+    print(f"  export {MOCK_URL_ENV}=http://{args.host}:{args.port}")
+    web.run_app(create_app(fixtures, _config(args)), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Batch Proximity Analysis
+Answers "for these N locations, the nearest feature of each of these layers" in one call, over
+layers kept in the local feature store (feature_store.py).
+
+Candidates are ranked a block of query points at a time so no block holds more than chunk_cells
+values: points are unit vectors, so a single matrix product (BLAS) gives the cosine of every angular
+distance, and the k largest per row are the k nearest. Only those k are then measured with the
+vectorized haversine formula, which is what is reported. Large jobs are split by query point
+across a process pool; each worker memory-maps the layers once and keeps them for later blocks.
+
+    python3 proximity.py shelters.csv "Hospitals" "Fire and Emergency Medical Service (EMS) Stations" --output nearest.csv
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from feature_store import FEATURE_STORE_DIR, FeatureStore
+from hifld_catalog import load_catalog
+from spatial_index import geometry_bounds, haversine_km
+
+# Values held in memory per block (8 bytes each): 4M = 32 MB
+DEFAULT_CHUNK_CELLS = 4_000_000
+# Below this many point-to-feature distances a process pool costs more than it saves
+PARALLEL_THRESHOLD = 50_000_000
+
+
+class ProximityResult(NamedTuple):
+    """Matrices indexed [query point, layer, rank]; missing neighbours are inf / -1."""
+    layers: List[str]
+    open_ids: List[str]
+    distance_km: np.ndarray
+    object_ids: np.ndarray
+
+
+LayerPoints = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+_layer_points: Dict[Tuple[str, str], LayerPoints] = {}
+
+
+def unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """[N, 3] points on the unit sphere; their dot products fall as great-circle distance grows."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def layer_points(store_root: str, open_id: str) -> LayerPoints:
+    """(lat, lon, object ids, unit vectors) of a stored layer's features, loaded once per process."""
+    key = (store_root, open_id)
+    if key not in _layer_points:
+        store = FeatureStore(store_root)
+        table = store.read(open_id)
+        positions, bounds = geometry_bounds(table.column('geometry'))
+        oid_field = store.metadata(open_id).get('object_id_field')
+        if oid_field in table.column_names:
+            ids = np.asarray(table.column(oid_field).to_numpy(zero_copy_only=False))[positions]
+        else:
+            ids = positions
+        # Lines and polygons are measured from the centre of their bounding box
+        lat = (bounds[:, 1] + bounds[:, 3]) / 2
+        lon = (bounds[:, 0] + bounds[:, 2]) / 2
+        _layer_points[key] = (lat, lon, ids.astype(np.int64), unit_vectors(lat, lon))
+    return _layer_points[key]
+
+
+def resolve_layers(layers: Sequence[str], store: FeatureStore) -> Tuple[List[str], List[str]]:
+    """Map crosswalk layer names (or Open IDs) to (names, open_ids) of stored layers.
+
+    Names must match exactly (ignoring case); anything else raises ValueError listing the closest
+    catalog matches rather than guessing which layer was meant.
+    """
+    catalog = load_catalog()
+    names, open_ids = [], []
+    for term in layers:
+        layer = catalog.find(term)
+        if layer is None:
+            raise ValueError(catalog.no_match_message(term))
+        if layer.open_id not in store:
+            raise ValueError(f"{layer.name} is not in the feature store; "
+                             f"run: python3 feature_store.py extract {layer.open_id}")
+        names.append(layer.name)
+        open_ids.append(layer.open_id)
+    return names, open_ids
+
+
+def _nearest_block(store_root: str, open_ids: Sequence[str], lat: np.ndarray, lon: np.ndarray,
+                   k: int, chunk_cells: int) -> Tuple[np.ndarray, np.ndarray]:
+    distance_km = np.full((len(lat), len(open_ids), k), np.inf)
+    object_ids = np.full((len(lat), len(open_ids), k), -1, dtype=np.int64)
+    query_vectors = unit_vectors(lat, lon)
+    for j, open_id in enumerate(open_ids):
+        layer_lat, layer_lon, ids, vectors = layer_points(store_root, open_id)
+        n = len(ids)
+        kk = min(k, n)
+        if not kk:
+            continue
+        step = max(1, chunk_cells // n)
+        for start in range(0, len(lat), step):
+            block = slice(start, start + step)
+            similarity = query_vectors[block] @ vectors.T
+            if kk < n:
+                nearest = np.argpartition(-similarity, kk - 1, axis=1)[:, :kk]
+            else:
+                nearest = np.broadcast_to(np.arange(n), similarity.shape)
+            distances = haversine_km(lat[block, None], lon[block, None], layer_lat[nearest], layer_lon[nearest])
+            order = np.argsort(distances, axis=1, kind='stable')
+            distance_km[block, j, :kk] = np.take_along_axis(distances, order, axis=1)
+            object_ids[block, j, :kk] = ids[np.take_along_axis(nearest, order, axis=1)]
+    return distance_km, object_ids
+
+
+def batch_nearest(points, layers: Sequence[str], k: int = 1, max_km: Optional[float] = None,
+                  store: Optional[FeatureStore] = None, processes: Optional[int] = None,
+                  chunk_cells: int = DEFAULT_CHUNK_CELLS) -> ProximityResult:
+    """The k nearest features of each layer for every (lat, lon) row of points.
+
+    layers are exact crosswalk layer names (ignoring case) or Open IDs of stored layers; anything
+    else raises ValueError listing the closest matches. Neighbours farther than max_km are reported
+    as inf / -1.
+    """
+    store = store or FeatureStore()
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    lat, lon = points[:, 0].copy(), points[:, 1].copy()
+    names, open_ids = resolve_layers(layers, store)
+
+    total = len(lat) * sum(len(layer_points(store.root, open_id)[2]) for open_id in open_ids)
+    processes = processes or os.cpu_count() or 1
+    if processes > 1 and total > PARALLEL_THRESHOLD:
+        bounds = np.linspace(0, len(lat), processes * 4 + 1).astype(int)
+        blocks = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_nearest_block, store.root, open_ids, lat[block], lon[block], k, chunk_cells)
+                       for block in blocks]
+            parts = [future.result() for future in futures]
+        distance_km = np.concatenate([part[0] for part in parts])
+        object_ids = np.concatenate([part[1] for part in parts])
+    else:
+        distance_km, object_ids = _nearest_block(store.root, open_ids, lat, lon, k, chunk_cells)
+
+    if max_km is not None:
+        too_far = distance_km > max_km
+        distance_km[too_far] = np.inf
+        object_ids[too_far] = -1
+    return ProximityResult(names, open_ids, distance_km, object_ids)
+
+
+def read_points(csv_path: str) -> Tuple[List[Dict[str, str]], np.ndarray]:
+    """Rows of a CSV with lat/latitude and lon/lng/longitude columns, plus their (lat, lon) array."""
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        return rows, np.empty((0, 2))
+    columns = {name.lower(): name for name in rows[0]}
+    lat_column = next((columns[c] for c in ('lat', 'latitude', 'y') if c in columns), None)
+    lon_column = next((columns[c] for c in ('lon', 'lng', 'longitude', 'x') if c in columns), None)
+    if lat_column is None or lon_column is None:
+        raise ValueError(f"{csv_path} needs latitude and longitude columns")
+    return rows, np.array([[float(row[lat_column]), float(row[lon_column])] for row in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nearest features of several stored layers for many locations")
+    parser.add_argument('points', help="CSV with latitude/longitude columns")
+    parser.add_argument('layers', nargs='+', help="exact crosswalk layer names or Open IDs (must be in the feature store)")
+    parser.add_argument('--k', type=int, default=1, help="neighbours per layer")
+    parser.add_argument('--max-km', type=float, default=None, help="ignore features farther than this")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--store', default=FEATURE_STORE_DIR, help="feature store directory")
+    parser.add_argument('--output', default=None, help="CSV to write (default: print a summary)")
+    args = parser.parse_args()
+
+    rows, points = read_points(args.points)
+    start_time = time.time()
+    try:
+        result = batch_nearest(points, args.layers, args.k, args.max_km, FeatureStore(args.store), args.processes)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    print(f"{len(points)} locations x {len(result.layers)} layers in {time.time() - start_time:.2f}s")
+
+    if args.output:
+        columns = list(rows[0]) if rows else []
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            header = list(columns)
+            for name in result.layers:
+                for rank in range(args.k):
+                    suffix = f" {rank + 1}" if args.k > 1 else ''
+                    header += [f"{name}{suffix} id", f"{name}{suffix} km"]
+            writer.writerow(header)
+            for i, row in enumerate(rows):
+                values = [row[column] for column in columns]
+                for j in range(len(result.layers)):
+                    for rank in range(args.k):
+                        distance = result.distance_km[i, j, rank]
+                        found = np.isfinite(distance)
+                        values += [int(result.object_ids[i, j, rank]) if found else '',
+                                   f"{distance:.3f}" if found else '']
+                writer.writerow(values)
+        print(f"Results saved to: {args.output}")
+        return
+
+    for j, name in enumerate(result.layers):
+        nearest = result.distance_km[:, j, 0]
+        found = nearest[np.isfinite(nearest)]
+        if len(found):
+            print(f"{name}: median {np.median(found):.2f} km, max {found.max():.2f} km to the nearest feature")
+        else:
+            print(f"{name}: no features within range")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 # Import statements
 import ipywidgets as widgets
 from IPython.display import display, clear_output
+import os
+import sys
 
 # Create widgets
 search_input = widgets.Text(placeholder='Enter search term', description='Search:')
@@ -15,6 +17,13 @@ save_area = widgets.Output()
 current_map = None
 added_layers = []
 
+# Shared search index (layer_search.py lives in the repository root)
+script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+sys.path.insert(0, os.path.dirname(script_dir))
+from layer_search import LayerSearchIndex
+
+search_index = LayerSearchIndex.from_dataframe(df)
+
 # Search function
 def on_search_click(b):
     with output_area:
@@ -23,7 +32,7 @@ def on_search_click(b):
         if not query:
             print("Enter a search term")
             return
-        results = df[df['Layer Name'].str.lower().str.contains(query, na=False)]
+        results = df.iloc[search_index.ranked_search(query)]
         print(f"Found {len(results)} layers:\n")
         for i, (_, row) in enumerate(results.head(10).iterrows()):
             if pd.notna(row['Open REST Service']):
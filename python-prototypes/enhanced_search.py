@@ -1,6 +1,8 @@
 import ipywidgets as widgets
 from IPython.display import display, clear_output
 from datetime import datetime
+import os
+import sys
 
 # Create widgets
 search_input = widgets.Text(
@@ -34,11 +36,16 @@ current_results = None
 current_map = None
 added_layers = []
 
+# Shared search index (layer_search.py lives in the repository root)
+script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+sys.path.insert(0, os.path.dirname(script_dir))
+from layer_search import LayerSearchIndex
+
+search_index = LayerSearchIndex.from_dataframe(df)
+
 def search_layers(query):
     """Search for layers matching the query"""
-    query = query.lower()
-    mask = df['Layer Name'].str.contains(query, case=False, na=False) | df['Agency'].str.contains(query, case=False, na=False)
-    return df[mask]
+    return df.iloc[search_index.ranked_search(query)]
 
 def on_search_click(b):
     """Handle search button click"""
@@ -8,12 +8,20 @@ import pandas as pd
 from arcgis.gis import GIS
 import ipywidgets as widgets
 from IPython.display import display, clear_output
+import os
+import sys
 
 print("=== HIFLD Interactive Search Tool ===")
 print("Loading data...")
 
 # Load HIFLD data
-df = pd.read_csv('HIFLD_Open_Crosswalk_Geoplatform.csv')
+# Shared catalog (hifld_catalog.py lives in the repository root)
+script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+sys.path.insert(0, os.path.dirname(script_dir))
+from hifld_catalog import load_catalog
+
+catalog = load_catalog()
+df = catalog.to_dataframe()
 print(f"Loaded {len(df)} infrastructure layers")
 
 # Connect to ArcGIS
@@ -56,11 +64,12 @@ save_area = widgets.Output()
 current_map = None
 added_layers = []
 
+# Shared search index, built once by the catalog
+search_index = catalog.search_index
+
 def search_layers(query):
     """Search for layers matching the query"""
-    query = query.lower()
-    mask = df['Layer Name'].str.lower().str.contains(query, na=False)
-    return df[mask]
+    return df.iloc[search_index.ranked_search(query)]
 
 def on_search_click(b):
     """Handle search button click"""
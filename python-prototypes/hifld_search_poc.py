@@ -6,10 +6,17 @@ from arcgis.gis import GIS
 from arcgis.mapping import WebMap
 from IPython.display import display
 import ipywidgets as widgets
+import os
+import sys
 
 # 1. Load HIFLD data
 print("Loading HIFLD layer data...")
-df = pd.read_csv('HIFLD_Open_Crosswalk_Geoplatform.csv')
+# Shared catalog (hifld_catalog.py lives in the repository root)
+script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+sys.path.insert(0, os.path.dirname(script_dir))
+from hifld_catalog import load_catalog
+catalog = load_catalog()
+df = catalog.to_dataframe()
 print(f"Loaded {len(df)} layers")
 
 # 2. Connect to ArcGIS
@@ -18,11 +25,12 @@ gis = GIS()  # Will prompt for login if needed
 print("Connected!")
 
 # 3. Simple search function
+# Shared search index, built once by the catalog
+search_index = catalog.search_index
+
 def search_layers(search_term):
     """Simple keyword search in layer names"""
-    search_term = search_term.lower()
-    results = df[df['Layer Name'].str.lower().str.contains(search_term, na=False)]
-    return results
+    return df.iloc[search_index.ranked_search(search_term)]
 
 # 4. Create interactive widgets
 search_box = widgets.Text(
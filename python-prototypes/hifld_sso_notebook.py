@@ -9,6 +9,7 @@ from arcgis.gis import GIS
 import ipywidgets as widgets
 from IPython.display import display, clear_output
 import os
+import sys
 
 print("=== HIFLD Interactive Search Tool ===")
 print("For Red Cross SSO Authentication")
@@ -16,20 +17,17 @@ print("=" * 50)
 
 # Load HIFLD data
 print("\n📂 Loading HIFLD data...")
+# Shared catalog (hifld_catalog.py lives in the repository root)
 script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
-csv_path = os.path.join(script_dir, 'HIFLD_Open_Crosswalk_Geoplatform.csv')
+sys.path.insert(0, os.path.dirname(script_dir))
+from hifld_catalog import CROSSWALK_CSV, load_catalog
 
 try:
-    df = pd.read_csv(csv_path)
+    catalog = load_catalog()
+    df = catalog.to_dataframe()
     print(f"✅ Loaded {len(df)} infrastructure layers")
 except FileNotFoundError:
-    # Try just the filename if full path fails
-    try:
-        df = pd.read_csv('HIFLD_Open_Crosswalk_Geoplatform.csv')
-        print(f"✅ Loaded {len(df)} infrastructure layers")
-    except:
-        print("❌ Error: HIFLD_Open_Crosswalk_Geoplatform.csv not found!")
-        print("Make sure the CSV file is in your current directory")
+    print(f"❌ Error: {CROSSWALK_CSV} not found!")
 
 # Authentication
 print("\n🔐 Connecting to Red Cross ArcGIS...")
@@ -88,11 +86,12 @@ current_map = None
 added_layers = []
 last_results = None
 
+# Shared search index, built once by the catalog
+search_index = catalog.search_index
+
 def search_layers(query):
     """Search for layers matching the query"""
-    query = query.lower()
-    mask = df['Layer Name'].str.lower().str.contains(query, na=False)
-    return df[mask]
+    return df.iloc[search_index.ranked_search(query)]
 
 def on_search_click(b):
     """Handle search button click"""
@@ -17,15 +17,17 @@ print("=" * 50)
 print("\n📂 Loading HIFLD data...")
 import os
 
-# Get the directory where this script is located
+# Shared catalog (hifld_catalog.py lives in the repository root)
 script_dir = os.path.dirname(os.path.abspath(__file__))
-csv_path = os.path.join(script_dir, 'HIFLD_Open_Crosswalk_Geoplatform.csv')
+sys.path.insert(0, os.path.dirname(script_dir))
+from hifld_catalog import CROSSWALK_CSV, load_catalog
 
 try:
-    df = pd.read_csv(csv_path)
+    catalog = load_catalog()
+    df = catalog.to_dataframe()
     print(f"✅ Loaded {len(df)} infrastructure layers")
 except FileNotFoundError:
-    print(f"❌ Error: CSV file not found at: {csv_path}")
+    print(f"❌ Error: CSV file not found at: {CROSSWALK_CSV}")
     print(f"Current directory: {os.getcwd()}")
     sys.exit(1)
 
@@ -85,11 +87,12 @@ except Exception as e:
         sys.exit(1)
 
 # Search functionality
+# Shared search index, built once by the catalog
+search_index = catalog.search_index
+
 def search_layers(query):
     """Search for layers by keyword"""
-    query = query.lower()
-    results = df[df['Layer Name'].str.lower().str.contains(query, na=False)]
-    return results
+    return df.iloc[search_index.ranked_search(query)]
 
 def display_results(results):
     """Display search results"""
@@ -3,8 +3,6 @@
 HIFLD Search Tool - Terminal Version with Username/Password
 """
 
-import pandas as pd
-from arcgis.gis import GIS
 import getpass
 import sys
 import os
@@ -15,58 +13,69 @@ print("=" * 50)
 # Load HIFLD data
 print("\n📂 Loading HIFLD data...")
 
-# Get the directory where this script is located
+# Shared catalog (hifld_catalog.py lives in the repository root); the arcgis
+# package is only imported once a map is actually requested
 script_dir = os.path.dirname(os.path.abspath(__file__))
-csv_path = os.path.join(script_dir, 'HIFLD_Open_Crosswalk_Geoplatform.csv')
+sys.path.insert(0, os.path.dirname(script_dir))
+from hifld_catalog import CROSSWALK_CSV, load_catalog
 
 try:
-    df = pd.read_csv(csv_path)
-    print(f"✅ Loaded {len(df)} infrastructure layers")
+    catalog = load_catalog()
+    print(f"✅ Loaded {len(catalog)} infrastructure layers")
 except FileNotFoundError:
-    print(f"❌ Error: CSV file not found at: {csv_path}")
+    print(f"❌ Error: CSV file not found at: {CROSSWALK_CSV}")
     sys.exit(1)
 
-# Authentication
-print("\n🔐 ArcGIS Online Authentication")
-print("-" * 50)
-
 # Organization URL
 org_url = "https://arc-nhq-gis.maps.arcgis.com"
-print(f"Organization: {org_url}")
-
-# Get credentials
-username = input("\nUsername: ").strip()
-password = getpass.getpass("Password: ")
-
-print("\n🔄 Authenticating...")
+gis = None
 
-try:
-    gis = GIS(org_url, username, password)
-    print("✅ Authentication successful!")
+def get_gis():
+    """Authenticate with ArcGIS Online on first use"""
+    global gis
+    if gis is not None:
+        return gis
+    
+    from arcgis.gis import GIS
+    
+    # Authentication
+    print("\n🔐 ArcGIS Online Authentication")
+    print("-" * 50)
+    print(f"Organization: {org_url}")
     
-    # Note: If 2FA is enabled, you may see a prompt here for your code
+    # Get credentials
+    username = input("\nUsername: ").strip()
+    password = getpass.getpass("Password: ")
+    
+    print("\n🔄 Authenticating...")
     
     try:
-        user = gis.users.me
-        if user:
-            print(f"👤 Logged in as: {user.username}")
-            print(f"📧 Email: {user.email}")
-    except:
-        print("✅ Connected (user info not available)")
+        gis = GIS(org_url, username, password)
+        print("✅ Authentication successful!")
         
-except Exception as e:
-    print(f"\n❌ Authentication failed: {e}")
-    if "token" in str(e).lower():
-        print("\n📱 If you have 2FA enabled, you should have been prompted for a code.")
-        print("Make sure to enter the code from your authenticator app.")
-    sys.exit(1)
+        # Note: If 2FA is enabled, you may see a prompt here for your code
+        
+        try:
+            user = gis.users.me
+            if user:
+                print(f"👤 Logged in as: {user.username}")
+                print(f"📧 Email: {user.email}")
+        except:
+            print("✅ Connected (user info not available)")
+            
+    except Exception as e:
+        print(f"\n❌ Authentication failed: {e}")
+        if "token" in str(e).lower():
+            print("\n📱 If you have 2FA enabled, you should have been prompted for a code.")
+            print("Make sure to enter the code from your authenticator app.")
+        raise
+    
+    return gis
 
 # Search functionality
 def search_layers(query):
     """Search for layers by keyword"""
-    query = query.lower()
-    results = df[df['Layer Name'].str.lower().str.contains(query, na=False)]
-    return results
+    return [catalog[i] for i in catalog.search_index.ranked_search(query)]
 
 def display_results(results):
     """Display search results"""
@@ -77,11 +86,11 @@ def display_results(results):
     print(f"\nFound {len(results)} layers:")
     print("-" * 80)
     
-    for i, (_, row) in enumerate(results.head(20).iterrows(), 1):
+    for i, row in enumerate(results[:20], 1):
         print(f"\n{i}. {row['Layer Name']}")
         print(f"   Agency: {row['Agency']}")
         
-        if pd.notna(row['Open REST Service']):
+        if row.has_url:
             print(f"   ✅ Map service available")
             print(f"   URL: {row['Open REST Service']}")
         else:
@@ -92,7 +101,7 @@ def create_map_with_layers(layer_indices, search_results):
     print("\n🗺️  Creating map...")
     
     # Create map widget
-    map_widget = gis.map('USA')
+    map_widget = get_gis().map('USA')
     map_widget.zoom = 4
     
     added_count = 0
@@ -103,11 +112,11 @@ def create_map_with_layers(layer_indices, search_results):
             print(f"❌ Invalid selection: {idx}")
             continue
             
-        row = search_results.iloc[idx - 1]
+        row = search_results[idx - 1]
         layer_name = row['Layer Name']
         service_url = row['Open REST Service']
         
-        if pd.isna(service_url):
+        if not row.has_url:
             print(f"❌ No map service for: {layer_name}")
             failed_count += 1
             continue
@@ -125,7 +134,7 @@ def create_map_with_layers(layer_indices, search_results):
     print(f"\n📊 Summary: {added_count} layers added, {failed_count} failed")
     print("\n💡 To view the map, you'll need to run this in a Jupyter notebook")
     
-    return map_widget, [search_results.iloc[idx-1] for idx in layer_indices if 1 <= idx <= len(search_results)]
+    return map_widget, [search_results[idx-1] for idx in layer_indices if 1 <= idx <= len(search_results)]
 
 # Main interactive loop
 def main():
@@ -164,7 +173,7 @@ def main():
                 try:
                     idx = int(command[5:])
                     if 1 <= idx <= len(last_results):
-                        row = last_results.iloc[idx - 1]
+                        row = last_results[idx - 1]
                         print(f"\n📋 Layer Details:")
                         print(f"Name: {row['Layer Name']}")
                         print(f"Agency: {row['Agency']}")
@@ -191,8 +200,8 @@ def main():
                     
                     for idx in indices:
                         if 1 <= idx <= len(last_results):
-                            row = last_results.iloc[idx - 1]
-                            if pd.notna(row['Open REST Service']):
+                            row = last_results[idx - 1]
+                            if row.has_url:
                                 print(f"\n{row['Layer Name']}:")
                                 print(f"{row['Open REST Service']}")
                             else:
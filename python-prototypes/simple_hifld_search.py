@@ -3,17 +3,26 @@
 
 import pandas as pd
 from arcgis.gis import GIS
+import os
+import sys
 
 # Load data
-df = pd.read_csv('HIFLD_Open_Crosswalk_Geoplatform.csv')
+# Shared catalog (hifld_catalog.py lives in the repository root)
+script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+sys.path.insert(0, os.path.dirname(script_dir))
+from hifld_catalog import load_catalog
+catalog = load_catalog()
+df = catalog.to_dataframe()
 gis = GIS()
 
+# Shared search index, built once by the catalog
+search_index = catalog.search_index
+
 # Simple search
 def search_and_display(keyword):
     """Search layers and display first result on map"""
     # Search
-    keyword = keyword.lower()
-    matches = df[df['Layer Name'].str.lower().str.contains(keyword, na=False)]
+    matches = df.iloc[search_index.ranked_search(keyword)]
     
     print(f"Found {len(matches)} layers containing '{keyword}':\n")
     
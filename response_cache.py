@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Persistent HTTP response cache for ArcGIS REST metadata.
+Entries live in a single SQLite file keyed by URL + query parameters. Fresh entries are served
+without a request, stale ones are revalidated with If-None-Match / If-Modified-Since, and the
+least recently used entries are evicted once the file grows past its size budget.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from hifld_catalog import REPO_DIR
+
+DEFAULT_CACHE_PATH = os.path.join(REPO_DIR, '.cache', 'arcgis-responses.sqlite')
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class CacheEntry(NamedTuple):
+    key: str
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def cache_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Stable key for a GET: the URL plus its parameters in sorted order."""
+    query = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return hashlib.sha256(f"{url}?{query}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response store with TTLs, conditional revalidation and LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)')
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+        body, etag, last_modified, expires_at = row
+        return CacheEntry(key, zlib.decompress(body), etag, last_modified, expires_at)
+
+    def store(self, key: str, url: str, body: bytes, etag: Optional[str] = None,
+              last_modified: Optional[str] = None, ttl: Optional[float] = None):
+        now = time.time()
+        compressed = zlib.compress(body)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, compressed, etag, last_modified, now,
+                 now + (self.ttl if ttl is None else ttl), now, len(compressed))
+            )
+            self._evict()
+
+    def refresh(self, key: str, ttl: Optional[float] = None):
+        """Extend an entry's lifetime after the server answered 304 Not Modified."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?',
+                (now + (self.ttl if ttl is None else ttl), now, key)
+            )
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._db.execute('SELECT key, size FROM responses ORDER BY last_access'):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany('DELETE FROM responses WHERE key = ?', doomed)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
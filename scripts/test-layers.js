@@ -6,6 +6,15 @@ const axios = require('axios')
 const dataPath = path.join(__dirname, '..', 'public', 'processed-layers.json')
 const data = JSON.parse(fs.readFileSync(dataPath, 'utf8'))
 
+// Per-host timeouts learned by the Python tester (host_latency.py); 10 seconds for unknown hosts
+const latencyPath = path.join(__dirname, '..', '.cache', 'host-latency.json')
+const hostLatency = fs.existsSync(latencyPath) ? JSON.parse(fs.readFileSync(latencyPath, 'utf8')).hosts : {}
+
+function timeoutFor(url) {
+  const learned = hostLatency[new URL(url).host.toLowerCase()]
+  return learned && learned.timeout ? learned.timeout * 1000 : 10000
+}
+
 async function testLayer(layer) {
   if (!layer.serviceUrl) {
     return {
@@ -37,7 +46,7 @@ async function testLayer(layer) {
     for (const testUrl of urls) {
       try {
         const response = await axios.get(testUrl, {
-          timeout: 10000, // Increased timeout to 10 seconds
+          timeout: timeoutFor(testUrl),
           headers: {
             'Accept': '*/*',
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
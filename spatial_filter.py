@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Spatial Filters for Extraction
+A bounding box or polygon in WGS84 that LayerExtractor pushes into /query as geometry/spatialRel,
+so only the features of a state or incident area are downloaded.
+
+Polygons with many vertices or a large extent are split into a grid of tiles: tiles wholly inside
+the polygon become plain envelope queries, tiles on its border are queried with the polygon clipped
+to the tile, and tiles outside it are skipped. Tiles can then run concurrently and each request
+carries a small geometry.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from esri_geometry import ring_area
+from spatial_index import point_in_polygon
+
+SPATIAL_REL_INTERSECTS = 'esriSpatialRelIntersects'
+# Tile filters with more vertices than this, or wider/taller than TILE_DEGREES
+MAX_QUERY_VERTICES = 500
+TILE_DEGREES = 2.0
+
+Ring = List[List[float]]
+
+
+def clip_ring(ring: Sequence[Sequence[float]], xmin: float, ymin: float, xmax: float, ymax: float) -> Ring:
+    """Sutherland-Hodgman clip of a closed ring to a rectangle; returns a closed ring or []."""
+    def clip(points: Ring, inside, intersect) -> Ring:
+        output: Ring = []
+        for i, current in enumerate(points):
+            previous = points[i - 1]
+            if inside(current):
+                if not inside(previous):
+                    output.append(intersect(previous, current))
+                output.append(current)
+            elif inside(previous):
+                output.append(intersect(previous, current))
+        return output
+
+    def at_x(x):
+        return lambda a, b: [x, a[1] + (b[1] - a[1]) * (x - a[0]) / (b[0] - a[0])]
+
+    def at_y(y):
+        return lambda a, b: [a[0] + (b[0] - a[0]) * (y - a[1]) / (b[1] - a[1]), y]
+
+    points = [list(p[:2]) for p in ring[:-1]]
+    for inside, intersect in ((lambda p: p[0] >= xmin, at_x(xmin)), (lambda p: p[0] <= xmax, at_x(xmax)),
+                              (lambda p: p[1] >= ymin, at_y(ymin)), (lambda p: p[1] <= ymax, at_y(ymax))):
+        points = clip(points, inside, intersect)
+        if not points:
+            return []
+    return points + [points[0]] if len(points) >= 3 else []
+
+
+def geojson_rings(geometry: Dict[str, Any]) -> List[Ring]:
+    """Esri-ordered rings (clockwise outer, counter-clockwise holes) from a GeoJSON (Multi)Polygon or Feature."""
+    if geometry.get('type') == 'Feature':
+        geometry = geometry['geometry']
+    elif geometry.get('type') == 'FeatureCollection':
+        return [ring for feature in geometry['features'] for ring in geojson_rings(feature)]
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    rings = []
+    for polygon in polygons:
+        for i, ring in enumerate(polygon):
+            ring = [list(p[:2]) for p in ring]
+            outer = i == 0
+            if (ring_area(ring) < 0) != outer:
+                ring.reverse()
+            rings.append(ring)
+    return rings
+
+
+class SpatialFilter:
+    """Polygon rings (or an envelope) in lon/lat, plus the spatial relationship to test."""
+
+    def __init__(self, rings: Sequence[Sequence[Sequence[float]]], spatial_rel: str = SPATIAL_REL_INTERSECTS,
+                 envelope: Optional[Tuple[float, float, float, float]] = None, tileable: bool = True):
+        self.rings = [[list(p[:2]) for p in ring] for ring in rings]
+        self.spatial_rel = spatial_rel
+        self.envelope = envelope
+        self.tileable = tileable
+
+    @classmethod
+    def from_bbox(cls, xmin: float, ymin: float, xmax: float, ymax: float, **options: Any) -> 'SpatialFilter':
+        ring = [[xmin, ymin], [xmin, ymax], [xmax, ymax], [xmax, ymin], [xmin, ymin]]
+        return cls([ring], envelope=(xmin, ymin, xmax, ymax), **options)
+
+    @classmethod
+    def from_geojson(cls, geometry: Dict[str, Any], **options: Any) -> 'SpatialFilter':
+        return cls(geojson_rings(geometry), **options)
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        if self.envelope is not None:
+            return self.envelope
+        coords = np.array([p for ring in self.rings for p in ring])
+        return (*coords.min(axis=0), *coords.max(axis=0))
+
+    @property
+    def vertex_count(self) -> int:
+        return sum(len(ring) for ring in self.rings)
+
+    def params(self) -> Dict[str, Any]:
+        """The geometry, geometryType, inSR and spatialRel /query parameters."""
+        if self.envelope is not None:
+            xmin, ymin, xmax, ymax = self.envelope
+            geometry, geometry_type = f"{xmin},{ymin},{xmax},{ymax}", 'esriGeometryEnvelope'
+        else:
+            geometry = json.dumps({'rings': self.rings}, separators=(',', ':'))
+            geometry_type = 'esriGeometryPolygon'
+        return {'geometry': geometry, 'geometryType': geometry_type, 'inSR': 4326, 'spatialRel': self.spatial_rel}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly form, kept in feature store metadata so syncs use the same filter."""
+        return {'rings': self.rings, 'spatial_rel': self.spatial_rel, 'envelope': self.envelope}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpatialFilter':
+        envelope = tuple(data['envelope']) if data.get('envelope') else None
+        return cls(data['rings'], data.get('spatial_rel', SPATIAL_REL_INTERSECTS), envelope)
+
+    def should_tile(self, tile_degrees: float = TILE_DEGREES) -> bool:
+        if not self.tileable:
+            return False
+        xmin, ymin, xmax, ymax = self.bounds
+        return self.vertex_count > MAX_QUERY_VERTICES or max(xmax - xmin, ymax - ymin) > tile_degrees
+
+    def tiles(self, tile_degrees: float = TILE_DEGREES) -> List['SpatialFilter']:
+        """Untileable filters covering this one: envelopes inside it, clipped polygons on its border."""
+        xmin, ymin, xmax, ymax = self.bounds
+        columns = max(1, int(np.ceil((xmax - xmin) / tile_degrees)))
+        rows = max(1, int(np.ceil((ymax - ymin) / tile_degrees)))
+        xs = np.linspace(xmin, xmax, columns + 1)
+        ys = np.linspace(ymin, ymax, rows + 1)
+
+        vertices = np.array([p for ring in self.rings for p in ring])
+        tiles = []
+        for x0, x1 in zip(xs[:-1], xs[1:]):
+            for y0, y1 in zip(ys[:-1], ys[1:]):
+                box = (float(x0), float(y0), float(x1), float(y1))
+                if self.envelope is not None:
+                    tiles.append(SpatialFilter.from_bbox(*box, spatial_rel=self.spatial_rel, tileable=False))
+                    continue
+                corners_inside = point_in_polygon(np.array([x0, x0, x1, x1]), np.array([y0, y1, y0, y1]), self.rings)
+                vertex_inside = np.any((vertices[:, 0] > x0) & (vertices[:, 0] < x1)
+                                       & (vertices[:, 1] > y0) & (vertices[:, 1] < y1))
+                # A notch crossing the tile without a vertex in it is missed, so this can only
+                # over-select, never drop features
+                if corners_inside.all() and not vertex_inside:
+                    tiles.append(SpatialFilter.from_bbox(*box, spatial_rel=self.spatial_rel, tileable=False))
+                    continue
+                clipped = [ring for ring in (clip_ring(r, *box) for r in self.rings) if ring]
+                if any(ring_area(ring) < 0 for ring in clipped):
+                    tiles.append(SpatialFilter(clipped, self.spatial_rel, tileable=False))
+        return tiles
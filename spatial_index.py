@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Spatial Index for Stored Layers
+NumPy grid index over the features of a layer in the local feature store, for "what is within
+X km of this point / inside this polygon / nearest to here" questions.
+
+Every feature is reduced to a representative point (points as-is, lines and polygons by the centre
+of their bounding box), binned into square grid cells and sorted by cell id. A query only touches
+the cells overlapping its search box; the candidates are then filtered exactly with vectorized
+haversine or point-in-polygon tests. Memory is O(features): empty cells cost nothing.
+
+`python3 spatial_index.py bench` compares the index with brute-force distance computation.
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from esri_geometry import wkb_to_geojson
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+# Same constant as webMercatorToWGS84 in ExportGeoJSONButton.tsx
+WEB_MERCATOR_EXTENT = 20037508.34
+# Target average number of features per occupied cell when choosing a cell size
+POINTS_PER_CELL = 16
+
+POINT_WKB_SIZE = 21
+
+
+def web_mercator_to_wgs84(x, y) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized port of webMercatorToWGS84 from ExportGeoJSONButton.tsx; returns (lon, lat)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    lon = x / WEB_MERCATOR_EXTENT * 180
+    lat = np.degrees(2 * np.arctan(np.exp(y / WEB_MERCATOR_EXTENT * np.pi))) - 90
+    return lon, lat
+
+
+def wgs84_to_web_mercator(lon, lat) -> Tuple[np.ndarray, np.ndarray]:
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    x = lon * WEB_MERCATOR_EXTENT / 180
+    y = np.log(np.tan((90 + lat) * np.pi / 360)) / np.pi * WEB_MERCATOR_EXTENT
+    return x, y
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km; arguments in degrees and broadcast against each other."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _positions(coordinates) -> List[Sequence[float]]:
+    """Flatten GeoJSON coordinates of any nesting depth into a list of [x, y]."""
+    if not isinstance(coordinates[0], list):
+        return [coordinates]
+    return [position for part in coordinates for position in _positions(part)]
+
+
+def geometry_bounds(column) -> Tuple[np.ndarray, np.ndarray]:
+    """(positions, bounds[N, 4] as minx, miny, maxx, maxy) for the non-null WKB values of an Arrow column."""
+    import pyarrow as pa
+    array = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    valid = ~np.asarray(array.is_null().to_numpy(zero_copy_only=False))
+    positions = np.flatnonzero(valid)
+
+    offsets = np.frombuffer(array.buffers()[1], dtype=np.int32)[array.offset:array.offset + len(array) + 1]
+    lengths = np.diff(offsets)[positions]
+    if len(positions) and (lengths == POINT_WKB_SIZE).all():
+        # Point layer: read x/y straight out of the WKB buffer instead of decoding row by row
+        data = np.frombuffer(array.buffers()[2], dtype=np.uint8)
+        starts = offsets[positions]
+        rows = data[starts[:, None] + np.arange(POINT_WKB_SIZE)]
+        xy = rows[:, 5:].copy().view('<f8')
+        return positions, np.hstack([xy, xy])
+
+    bounds = np.empty((len(positions), 4))
+    for i, position in enumerate(positions):
+        xy = np.asarray(_positions(wkb_to_geojson(array[int(position)].as_py())['coordinates']))
+        bounds[i] = (*xy.min(axis=0), *xy.max(axis=0))
+    return positions, bounds
+
+
+def point_in_polygon(lon: np.ndarray, lat: np.ndarray, rings: Sequence[Sequence[Sequence[float]]]) -> np.ndarray:
+    """Even-odd ray casting over every ring at once, so holes are excluded."""
+    inside = np.zeros(len(lon), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)
+        for (x1, y1), (x2, y2) in zip(ring[:-1, :2], ring[1:, :2]):
+            if y1 == y2:
+                continue
+            crosses = (y1 > lat) != (y2 > lat)
+            x_cross = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (lon < x_cross)
+    return inside
+
+
+class GridIndex:
+    """Representative points sorted by grid cell; query methods return row positions in the source table."""
+
+    def __init__(self, lon: np.ndarray, lat: np.ndarray, positions: Optional[np.ndarray] = None,
+                 bounds: Optional[np.ndarray] = None, cell_size: Optional[float] = None):
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        if positions is None:
+            positions = np.arange(len(lon))
+        self.size = len(lon)
+        self.min_lon = float(lon.min()) if self.size else 0.0
+        self.min_lat = float(lat.min()) if self.size else 0.0
+        if cell_size is None:
+            cell_size = 1.0
+            if self.size:
+                # Size cells from the central 98% so a few outliers (Guam, Alaska) don't coarsen the grid
+                (lon_lo, lon_hi), (lat_lo, lat_hi) = np.percentile(lon, [1, 99]), np.percentile(lat, [1, 99])
+                area = max((lon_hi - lon_lo) * (lat_hi - lat_lo), 1e-6)
+                cell_size = max(np.sqrt(area * POINTS_PER_CELL / self.size), 1e-4)
+        self.cell_size = float(cell_size)
+        self.columns = int((lon.max() - self.min_lon) // self.cell_size) + 1 if self.size else 1
+
+        cells = self._cells(lon, lat)
+        order = np.argsort(cells, kind='stable')
+        self.cells = cells[order]
+        self.lon = lon[order]
+        self.lat = lat[order]
+        self.positions = np.asarray(positions)[order]
+        # Half-extent of the widest / tallest feature, so box queries also catch features whose
+        # centre lies outside the box but whose extent overlaps it
+        self.bounds = None if bounds is None else np.asarray(bounds)[order]
+        if self.bounds is not None and self.size:
+            self.margin = (float(np.max(self.bounds[:, 2] - self.bounds[:, 0])) / 2,
+                           float(np.max(self.bounds[:, 3] - self.bounds[:, 1])) / 2)
+        else:
+            self.margin = (0.0, 0.0)
+
+    @classmethod
+    def from_table(cls, table, geometry_column: str = 'geometry', cell_size: Optional[float] = None) -> 'GridIndex':
+        positions, bounds = geometry_bounds(table.column(geometry_column))
+        lon = (bounds[:, 0] + bounds[:, 2]) / 2
+        lat = (bounds[:, 1] + bounds[:, 3]) / 2
+        point_layer = bool(len(bounds)) and bool(np.all(bounds[:, :2] == bounds[:, 2:]))
+        return cls(lon, lat, positions, None if point_layer else bounds, cell_size)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _cells(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        ix = np.floor((lon - self.min_lon) / self.cell_size).astype(np.int64)
+        iy = np.floor((lat - self.min_lat) / self.cell_size).astype(np.int64)
+        return iy * self.columns + ix
+
+    def _candidates(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> np.ndarray:
+        """Sorted-array indices of every point in the cells overlapping the box."""
+        ix0 = max(int(np.floor((min_lon - self.min_lon) / self.cell_size)), 0)
+        ix1 = min(int(np.floor((max_lon - self.min_lon) / self.cell_size)), self.columns - 1)
+        iy0 = max(int(np.floor((min_lat - self.min_lat) / self.cell_size)), 0)
+        iy1 = int(np.floor((max_lat - self.min_lat) / self.cell_size))
+        if ix1 < ix0 or iy1 < iy0 or not self.size:
+            return np.empty(0, dtype=np.int64)
+        if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > self.size:
+            # Box spans more cells than there are points: scanning everything is cheaper
+            return np.arange(self.size)
+
+        # Each grid row of the box is one contiguous run of cell ids in the sorted array
+        rows = np.arange(iy0, iy1 + 1) * self.columns
+        starts = np.searchsorted(self.cells, rows + ix0, side='left')
+        ends = np.searchsorted(self.cells, rows + ix1, side='right')
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return np.arange(total) + offsets
+
+    def bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> np.ndarray:
+        """Positions of features whose point (or, for lines/polygons, bounding box) intersects the box."""
+        margin_x, margin_y = self.margin
+        idx = self._candidates(min_lon - margin_x, min_lat - margin_y, max_lon + margin_x, max_lat + margin_y)
+        if self.bounds is None:
+            keep = ((self.lon[idx] >= min_lon) & (self.lon[idx] <= max_lon)
+                    & (self.lat[idx] >= min_lat) & (self.lat[idx] <= max_lat))
+        else:
+            b = self.bounds[idx]
+            keep = (b[:, 0] <= max_lon) & (b[:, 2] >= min_lon) & (b[:, 1] <= max_lat) & (b[:, 3] >= min_lat)
+        return self.positions[idx[keep]]
+
+    def radius(self, lat: float, lon: float, km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(positions, distances in km) within km of the point, nearest first."""
+        dlat = km / KM_PER_DEGREE
+        cos_lat = np.cos(np.radians(min(abs(lat) + dlat, 90.0)))
+        dlon = 180.0 if cos_lat < 1e-9 else min(dlat / cos_lat, 180.0)
+        idx = self._candidates(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        # Circles crossing the antimeridian also cover the far edge of the map
+        if lon - dlon < -180:
+            idx = np.union1d(idx, self._candidates(lon - dlon + 360, lat - dlat, 180, lat + dlat))
+        if lon + dlon > 180:
+            idx = np.union1d(idx, self._candidates(-180, lat - dlat, lon + dlon - 360, lat + dlat))
+        distances = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        keep = distances <= km
+        idx, distances = idx[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return self.positions[idx[order]], distances[order]
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(positions, distances in km) of the k nearest features."""
+        k = min(k, self.size)
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # Every feature within the search radius is found, so once k turn up they are the k nearest
+        km = self.cell_size * KM_PER_DEGREE * np.sqrt(k / POINTS_PER_CELL + 1)
+        while km < np.pi * EARTH_RADIUS_KM:
+            positions, distances = self.radius(lat, lon, km)
+            if len(positions) >= k:
+                return positions[:k], distances[:k]
+            km *= 2
+        distances = haversine_km(lat, lon, self.lat, self.lon)
+        order = np.argsort(distances, kind='stable')[:k]
+        return self.positions[order], distances[order]
+
+    def within_polygon(self, rings: Sequence[Sequence[Sequence[float]]]) -> np.ndarray:
+        """Positions of features whose representative point lies inside the polygon (lon/lat rings)."""
+        coords = np.concatenate([np.asarray(ring, dtype=np.float64)[:, :2] for ring in rings])
+        idx = self._candidates(coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max())
+        return self.positions[idx[point_in_polygon(self.lon[idx], self.lat[idx], rings)]]
+
+
+_indexes: Dict[Tuple[str, float], GridIndex] = {}
+
+
+def layer_index(store, open_id: str) -> GridIndex:
+    """GridIndex for a stored layer, built once per process and rebuilt when the file changes."""
+    path = store.path(open_id)
+    key = (path, os.path.getmtime(path))
+    if key not in _indexes:
+        _indexes[key] = GridIndex.from_table(store.read(open_id, ['geometry']))
+    return _indexes[key]
+
+
+def benchmark(points: int = 1_000_000, queries: int = 200, km: float = 25.0, k: int = 5, seed: int = 0):
+    """Time grid queries against brute-force haversine on random CONUS points; results must match."""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-125, -66, points)
+    lat = rng.uniform(24, 50, points)
+    query_lon = rng.uniform(-120, -70, queries)
+    query_lat = rng.uniform(26, 48, queries)
+
+    start_time = time.perf_counter()
+    index = GridIndex(lon, lat)
+    build = time.perf_counter() - start_time
+    print(f"Built grid over {points:,} points in {build * 1000:.0f} ms "
+          f"(cell {index.cell_size:.3f}°)")
+
+    timings: Dict[str, List[float]] = {'radius': [0, 0], 'nearest': [0, 0]}
+    for qlat, qlon in zip(query_lat, query_lon):
+        start_time = time.perf_counter()
+        found, _ = index.radius(qlat, qlon, km)
+        timings['radius'][0] += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        brute = np.flatnonzero(haversine_km(qlat, qlon, lat, lon) <= km)
+        timings['radius'][1] += time.perf_counter() - start_time
+        assert np.array_equal(np.sort(found), brute), "radius query disagrees with brute force"
+
+        start_time = time.perf_counter()
+        _, distances = index.nearest(qlat, qlon, k)
+        timings['nearest'][0] += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        brute = np.sort(haversine_km(qlat, qlon, lat, lon))[:k]
+        timings['nearest'][1] += time.perf_counter() - start_time
+        assert np.allclose(distances, brute), "nearest query disagrees with brute force"
+
+    for name, (indexed, brute) in timings.items():
+        print(f"{name:>8}: {indexed / queries * 1000:8.3f} ms/query indexed, "
+              f"{brute / queries * 1000:8.3f} ms/query brute force ({brute / indexed:.0f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query stored layers by location")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    near_parser = subparsers.add_parser('near', help="features of a stored layer near a point")
+    near_parser.add_argument('open_id')
+    near_parser.add_argument('lat', type=float)
+    near_parser.add_argument('lon', type=float)
+    near_parser.add_argument('--km', type=float, default=10.0, help="search radius")
+    near_parser.add_argument('--nearest', type=int, default=0, help="return the k nearest instead")
+    bench_parser = subparsers.add_parser('bench', help="compare with brute-force distance computation")
+    bench_parser.add_argument('--points', type=int, default=1_000_000)
+    bench_parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.points, args.queries)
+        return
+
+    from feature_store import FeatureStore
+    store = FeatureStore()
+    index = layer_index(store, args.open_id)
+    if args.nearest:
+        positions, distances = index.nearest(args.lat, args.lon, args.nearest)
+    else:
+        positions, distances = index.radius(args.lat, args.lon, args.km)
+    table = store.read(args.open_id)
+    oid_field = store.metadata(args.open_id).get('object_id_field') or table.column_names[0]
+    object_ids = table.column(oid_field).take(positions).to_pylist()
+    for object_id, distance in zip(object_ids, distances):
+        print(f"{oid_field} {object_id}: {distance:.2f} km")
+    print(f"{len(positions)} features")
+
+
+if __name__ == "__main__":
+    main()
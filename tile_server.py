@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+"""
+Local Tile and Feature Server
+Small aiohttp server that mirrors stored HIFLD layers, so the map or a notebook keeps working (and
+stays fast) when the upstream ArcGIS services are slow or throttling.
+
+    /tiles/<open_id>/<z>/<x>/<y>.pbf              vector tiles from .cache/tiles/<open_id>.mbtiles
+    /tiles/<open_id>.json                         TileJSON for MapLibre / Mapbox GL sources
+    /tiles/<open_id>.mbtiles                      the whole archive
+    /features/<open_id>/FeatureServer[/0]         ArcGIS service and layer documents (?f=json)
+    /features/<open_id>/FeatureServer/0/query     ArcGIS-compatible /query over the feature store
+
+/query supports where (AND-ed comparisons, BETWEEN, IN, LIKE, IS NULL), objectIds, envelope or
+polygon geometry filters, outFields, returnGeometry, returnIdsOnly, returnCountOnly, resultOffset /
+resultRecordCount, outSR 4326 or 3857, maxAllowableOffset / geometryPrecision and f=json|geojson, so
+LayerExtractor, an ArcGIS JS FeatureLayer or arcgis.features.FeatureLayer can use it as-is.
+
+Responses are kept in a byte-bounded LRU with their gzip encoding computed once (tiles are stored
+gzipped already). Every response carries an ETag, answers If-None-Match with 304 and honours
+single-range Range requests.
+
+    python3 tile_server.py --port 8080
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    from aiohttp import web
+except ImportError:  # checked in create_app()
+    web = None
+
+from esri_geometry import wkb_to_esri
+from exporter import geojson_feature
+from feature_store import FEATURE_STORE_DIR, GEOMETRY_COLUMN, FeatureStore
+from generalize import Generalization
+from spatial_index import geometry_bounds, point_in_polygon, web_mercator_to_wgs84, wgs84_to_web_mercator
+from vector_tiles import TILES_DIR, MBTiles
+
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+MAX_RECORD_COUNT = 2000
+# Responses smaller than this are not worth gzipping
+MIN_GZIP_BYTES = 512
+TILE_MAX_AGE = 3600
+QUERY_MAX_AGE = 60
+WEB_MERCATOR_WKIDS = {3857, 102100, 102113, 900913}
+SPATIAL_REFERENCE = {'wkid': 4326, 'latestWkid': 4326}
+
+ESRI_FIELD_TYPES = [
+    (pa.types.is_int16, 'esriFieldTypeSmallInteger'),
+    (pa.types.is_integer, 'esriFieldTypeInteger'),
+    (pa.types.is_float32, 'esriFieldTypeSingle'),
+    (pa.types.is_floating, 'esriFieldTypeDouble'),
+    (pa.types.is_timestamp, 'esriFieldTypeDate')
+]
+
+
+class QueryError(ValueError):
+    """A /query request this server cannot answer; returned as an ArcGIS error document."""
+
+
+# --- Prepared responses and the LRU ------------------------------------------------------------
+
+class Prepared(NamedTuple):
+    body: Optional[bytes]
+    gzipped: Optional[bytes]
+    etag: str
+    content_type: str
+    max_age: int
+
+    @property
+    def size(self) -> int:
+        return len(self.body or b'') + len(self.gzipped or b'')
+
+
+def prepare(body: bytes, content_type: str, max_age: int) -> Prepared:
+    """Response with its ETag and (for larger bodies) gzip encoding computed once."""
+    gzipped = gzip.compress(body, 6) if len(body) >= MIN_GZIP_BYTES else None
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    return Prepared(body, gzipped, etag, content_type, max_age)
+
+
+def prepare_json(data: Any, max_age: int = QUERY_MAX_AGE) -> Prepared:
+    body = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return prepare(body, 'application/json; charset=utf-8', max_age)
+
+
+class LRUCache:
+    """Prepared responses, least recently used evicted first once max_bytes is exceeded."""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: 'OrderedDict[Tuple, Prepared]' = OrderedDict()
+        self.size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key: Tuple) -> Optional[Prepared]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry
+
+    def put(self, key: Tuple, entry: Prepared):
+        if entry.size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key).size
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.stats['evictions'] += 1
+
+
+def parse_range(header: str, length: int) -> Optional[Tuple[int, int]]:
+    """(start, end inclusive) for a single 'bytes=' range; None to send the whole body.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', header)
+    if not match or not any(match.groups()):
+        return None  # malformed or multi-range: ignoring Range is allowed
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, length - int(last)), length - 1
+    else:
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+    if start >= length or start > end:
+        raise ValueError(f"bytes */{length}")
+    return start, end
+
+
+def respond(request, entry: Prepared):
+    """Serve a prepared response with conditional GET, content negotiation and Range support."""
+    use_gzip = entry.gzipped is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+    # Each encoding is its own representation, so it gets its own strong ETag
+    etag = entry.etag[:-1] + '-gz"' if use_gzip else entry.etag
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f"public, max-age={entry.max_age}",
+        'Vary': 'Accept-Encoding',
+        'Accept-Ranges': 'bytes',
+        'Access-Control-Allow-Origin': '*',
+        'Content-Type': entry.content_type
+    }
+    if_none_match = request.headers.get('If-None-Match', '')
+    if (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+        return web.Response(status=304, headers={k: v for k, v in headers.items() if k != 'Content-Type'})
+
+    body = entry.gzipped if use_gzip else (entry.body if entry.body is not None else gzip.decompress(entry.gzipped))
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    range_header = request.headers.get('Range')
+    status = 200
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        try:
+            selected = parse_range(range_header, len(body))
+        except ValueError as e:
+            return web.Response(status=416, headers={'Content-Range': str(e), 'Access-Control-Allow-Origin': '*'})
+        if selected is not None:
+            start, end = selected
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(body)}"
+            body, status = body[start:end + 1], 206
+    return web.Response(body=body, status=status, headers=headers)
+
+
+# --- Stored layers --------------------------------------------------------------------------
+
+class StoredLayer:
+    """A memory-mapped stored layer plus the per-row arrays /query filters on."""
+
+    def __init__(self, store: FeatureStore, open_id: str):
+        self.open_id = open_id
+        self.mtime = os.path.getmtime(store.path(open_id))
+        self.table = store.read(open_id)
+        self.metadata = store.metadata(open_id)
+        self.oid_field = self.metadata.get('object_id_field')
+        if self.oid_field in self.table.column_names:
+            self.object_ids = np.asarray(self.table.column(self.oid_field).to_numpy(zero_copy_only=False))
+        else:
+            self.oid_field = 'OBJECTID'
+            self.object_ids = np.arange(1, self.table.num_rows + 1)
+        # Null geometries keep NaN bounds and never match a spatial filter
+        positions, bounds = geometry_bounds(self.table.column(GEOMETRY_COLUMN))
+        self.bounds = np.full((self.table.num_rows, 4), np.nan)
+        self.bounds[positions] = bounds
+        self.is_point = self.metadata.get('geometry_type') == 'esriGeometryPoint'
+
+    def fields(self) -> List[Dict[str, Any]]:
+        fields = []
+        for field in self.table.schema:
+            if field.name == GEOMETRY_COLUMN:
+                continue
+            esri_type = 'esriFieldTypeOID' if field.name == self.oid_field else next(
+                (name for test, name in ESRI_FIELD_TYPES if test(field.type)), 'esriFieldTypeString')
+            fields.append({'name': field.name, 'type': esri_type, 'alias': field.name})
+        if self.oid_field not in self.table.column_names:
+            fields.insert(0, {'name': self.oid_field, 'type': 'esriFieldTypeOID', 'alias': self.oid_field})
+        return fields
+
+    def extent(self) -> Dict[str, Any]:
+        if np.isnan(self.bounds).all():
+            return {'xmin': None, 'ymin': None, 'xmax': None, 'ymax': None, 'spatialReference': SPATIAL_REFERENCE}
+        return {'xmin': float(np.nanmin(self.bounds[:, 0])), 'ymin': float(np.nanmin(self.bounds[:, 1])),
+                'xmax': float(np.nanmax(self.bounds[:, 2])), 'ymax': float(np.nanmax(self.bounds[:, 3])),
+                'spatialReference': SPATIAL_REFERENCE}
+
+    def layer_info(self, max_record_count: int = MAX_RECORD_COUNT) -> Dict[str, Any]:
+        """The layer's ?f=json document, close enough to ArcGIS for LayerExtractor and the JS API."""
+        return {
+            'currentVersion': 11.1,
+            'id': 0,
+            'name': self.metadata.get('name') or self.open_id,
+            'type': 'Feature Layer',
+            'geometryType': self.metadata.get('geometry_type'),
+            'objectIdField': self.oid_field,
+            'fields': self.fields(),
+            'extent': self.extent(),
+            'maxRecordCount': max_record_count,
+            'capabilities': 'Query',
+            'supportedQueryFormats': 'JSON, geoJSON',
+            'advancedQueryCapabilities': {'supportsPagination': True, 'supportsQueryWithDistance': False},
+            'editingInfo': {'lastEditDate': self.metadata.get('last_edit_date')},
+            'hasZ': False,
+            'hasM': False
+        }
+
+
+# --- /query ---------------------------------------------------------------------------------
+
+_LITERAL = r"(?:'(?:[^']|'')*'|(?:timestamp|date)\s*'[^']*'|[-+]?\d+(?:\.\d*)?(?:e[-+]?\d+)?)"
+_CLAUSE = re.compile(rf"""
+    (?P<true>1\s*=\s*1)
+  | (?P<field>[a-z_]\w*)\s*(?:
+        (?P<op><>|!=|<=|>=|=|<|>)\s*(?P<value>{_LITERAL})
+      | (?P<not_between>not\s+)?between\s+(?P<low>{_LITERAL})\s+and\s+(?P<high>{_LITERAL})
+      | (?P<not_in>not\s+)?in\s*\((?P<values>(?:\s*{_LITERAL}\s*,?)*)\)
+      | (?P<not_like>not\s+)?like\s+(?P<pattern>'(?:[^']|'')*')
+      | is\s+(?P<not_null>not\s+)?null)
+""", re.IGNORECASE | re.VERBOSE)
+_OPEN = re.compile(r'[\s(]*')
+_CLOSE = re.compile(r'[\s)]*')
+_AND = re.compile(r'and\b', re.IGNORECASE)
+
+_COMPARISONS = {'=': pc.equal, '<>': pc.not_equal, '!=': pc.not_equal, '<': pc.less, '<=': pc.less_equal,
+                '>': pc.greater, '>=': pc.greater_equal}
+
+
+def _literal(text: str) -> Any:
+    text = text.strip()
+    if text.startswith("'"):
+        return text[1:-1].replace("''", "'")
+    if text[0].isalpha():  # timestamp '...' / date '...'
+        moment = datetime.fromisoformat(text[text.index("'") + 1:-1].strip())
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return float(text) if re.search(r'[.e]', text, re.IGNORECASE) else int(text)
+
+
+def _scalar(value: Any, arrow_type: pa.DataType) -> pa.Scalar:
+    if pa.types.is_timestamp(arrow_type) and isinstance(value, datetime):
+        return pa.scalar(value, type=arrow_type)
+    if pa.types.is_string(arrow_type):
+        return pa.scalar(str(value))
+    return pa.scalar(value)
+
+
+def where_mask(table: pa.Table, where: str) -> np.ndarray:
+    """Rows matching an ArcGIS where clause made of AND-ed simple conditions."""
+    columns = {name.lower(): name for name in table.column_names}
+    mask = np.ones(table.num_rows, dtype=bool)
+    position = 0
+    where = where or '1=1'
+    while True:
+        position = _OPEN.match(where, position).end()
+        match = _CLAUSE.match(where, position)
+        if not match:
+            raise QueryError(f"Unsupported where clause near: {where[position:position + 40]!r}")
+        if not match.group('true'):
+            name = columns.get(match.group('field').lower())
+            if name is None:
+                raise QueryError(f"Invalid field in where clause: {match.group('field')}")
+            column = table.column(name)
+            try:
+                if match.group('op'):
+                    value = _scalar(_literal(match.group('value')), column.type)
+                    condition = _COMPARISONS[match.group('op')](column, value)
+                elif match.group('low'):
+                    low = _scalar(_literal(match.group('low')), column.type)
+                    high = _scalar(_literal(match.group('high')), column.type)
+                    condition = pc.and_(pc.greater_equal(column, low), pc.less_equal(column, high))
+                    if match.group('not_between'):
+                        condition = pc.invert(condition)
+                elif match.group('values') is not None:
+                    values = [_literal(text) for text in re.findall(_LITERAL, match.group('values'), re.IGNORECASE)]
+                    condition = pc.is_in(column, value_set=pa.array(values).cast(column.type))
+                    if match.group('not_in'):
+                        condition = pc.invert(condition)
+                elif match.group('pattern'):
+                    condition = pc.match_like(column.cast(pa.string()), _literal(match.group('pattern')),
+                                              ignore_case=True)
+                    if match.group('not_like'):
+                        condition = pc.invert(condition)
+                else:
+                    condition = pc.is_valid(column) if match.group('not_null') else pc.is_null(column)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, ValueError) as e:
+                raise QueryError(f"Invalid value for {name}: {e}")
+            mask &= np.asarray(condition.fill_null(False).to_numpy(zero_copy_only=False), dtype=bool)
+        position = _CLOSE.match(where, match.end()).end()
+        if position == len(where):
+            return mask
+        connector = _AND.match(where, position)
+        if connector is None:
+            raise QueryError(f"Unsupported where clause near: {where[position:position + 40]!r}")
+        position = connector.end()
+
+
+def _wkid(value: Any) -> int:
+    if isinstance(value, dict):
+        value = value.get('latestWkid') or value.get('wkid')
+    return int(value) if value not in (None, '') else 4326
+
+
+def parse_geometry(params: Dict[str, str]) -> Tuple[Tuple[float, float, float, float], Optional[List]]:
+    """(WGS84 bounding box, WGS84 rings or None) for the geometry / inSR parameters."""
+    text = params['geometry'].strip()
+    in_sr = params.get('inSR')
+    rings = None
+    if text.startswith('{'):
+        geometry = json.loads(text)
+        in_sr = geometry.get('spatialReference') or in_sr
+        if 'xmin' in geometry:
+            coords = np.array([[geometry['xmin'], geometry['ymin']], [geometry['xmax'], geometry['ymax']]], dtype=float)
+        elif 'rings' in geometry:
+            rings = [np.asarray(ring, dtype=float)[:, :2] for ring in geometry['rings']]
+            coords = np.vstack(rings)
+        elif 'x' in geometry:
+            coords = np.array([[geometry['x'], geometry['y']]], dtype=float)
+        else:
+            raise QueryError("Unsupported geometry; use an envelope, polygon or point")
+    else:
+        try:
+            values = [float(value) for value in text.split(',')]
+        except ValueError:
+            raise QueryError(f"Invalid geometry: {text[:40]}")
+        if len(values) not in (2, 4):
+            raise QueryError(f"Invalid geometry: {text[:40]}")
+        coords = np.array(values, dtype=float).reshape(-1, 2)
+
+    wkid = _wkid(in_sr)
+    if wkid in WEB_MERCATOR_WKIDS:
+        def unproject(xy):
+            lon, lat = web_mercator_to_wgs84(xy[:, 0], xy[:, 1])
+            return np.column_stack([lon, lat])
+        coords = unproject(coords)
+        rings = [unproject(ring) for ring in rings] if rings else None
+    elif wkid != 4326:
+        raise QueryError(f"Unsupported inSR {wkid}; use 4326 or 3857")
+    bbox = (*coords.min(axis=0), *coords.max(axis=0))
+    return bbox, [ring.tolist() for ring in rings] if rings else None
+
+
+def _project_geometry(geometry: Dict[str, Any], project: Callable) -> Dict[str, Any]:
+    def points(coords):
+        xy = np.asarray(coords, dtype=np.float64)
+        x, y = project(xy[:, 0], xy[:, 1])
+        return np.column_stack([x, y]).tolist()
+
+    if 'x' in geometry:
+        x, y = project(geometry['x'], geometry['y'])
+        return {'x': float(x), 'y': float(y)}
+    if 'points' in geometry:
+        return {'points': points(geometry['points'])}
+    key = 'paths' if 'paths' in geometry else 'rings'
+    return {key: [points(part) for part in geometry[key]]}
+
+
+def _epoch_ms(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return value
+
+
+def _flag(params: Dict[str, str], name: str, default: bool = False) -> bool:
+    value = params.get(name)
+    return default if value in (None, '') else value.strip().lower() == 'true'
+
+
+def _number(params: Dict[str, str], name: str, kind: Callable = int, minimum: float = 0) -> Any:
+    """A numeric query parameter, or None when absent; bad values raise QueryError rather than a 500."""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = kind(value)
+    except ValueError:
+        raise QueryError(f"{name} must be {'an integer' if kind is int else 'a number'}, not {value[:40]!r}")
+    if not number >= minimum:
+        raise QueryError(f"{name} must be at least {minimum}")
+    return number
+
+
+def query_layer(layer: StoredLayer, params: Dict[str, str],
+                max_record_count: int = MAX_RECORD_COUNT) -> Tuple[Any, str]:
+    """(response document, 'json' or 'geojson') for ArcGIS /query parameters."""
+    table = layer.table
+    mask = where_mask(table, params.get('where', '1=1'))
+
+    if params.get('objectIds'):
+        try:
+            ids = [int(value) for value in params['objectIds'].split(',') if value.strip()]
+        except ValueError:
+            raise QueryError("objectIds must be a comma-separated list of integers")
+        mask &= np.isin(layer.object_ids, ids)
+
+    if params.get('geometry'):
+        spatial_rel = params.get('spatialRel') or 'esriSpatialRelIntersects'
+        if spatial_rel not in ('esriSpatialRelIntersects', 'esriSpatialRelEnvelopeIntersects'):
+            raise QueryError(f"Unsupported spatialRel {spatial_rel}")
+        (xmin, ymin, xmax, ymax), rings = parse_geometry(params)
+        bounds = layer.bounds
+        with np.errstate(invalid='ignore'):
+            mask &= (bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin) & (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin)
+        if rings and layer.is_point and spatial_rel == 'esriSpatialRelIntersects':
+            # Exact for points; lines and polygons are matched on their bounding boxes
+            candidates = np.flatnonzero(mask)
+            mask[candidates] = point_in_polygon(bounds[candidates, 0], bounds[candidates, 1], rings)
+
+    # Sorted by object ID so resultOffset paging is stable
+    positions = np.flatnonzero(mask)
+    positions = positions[np.argsort(layer.object_ids[positions], kind='stable')]
+    output_format = 'geojson' if params.get('f', 'json').lower() == 'geojson' else 'json'
+
+    if _flag(params, 'returnCountOnly'):
+        return ({'properties': {'count': len(positions)}} if output_format == 'geojson'
+                else {'count': len(positions)}), output_format
+    if _flag(params, 'returnIdsOnly'):
+        return {'objectIdFieldName': layer.oid_field,
+                'objectIds': layer.object_ids[positions].tolist()}, 'json'
+
+    offset = _number(params, 'resultOffset') or 0
+    limit = min(_number(params, 'resultRecordCount') or max_record_count, max_record_count)
+    page = positions[offset:offset + limit]
+    exceeded = offset + limit < len(positions)
+
+    out_fields = params.get('outFields') or '*'
+    names = {name.lower(): name for name in table.column_names if name != GEOMETRY_COLUMN}
+    if out_fields.strip() == '*':
+        selected = list(names.values())
+    else:
+        selected = [names[name.strip().lower()] for name in out_fields.split(',') if name.strip().lower() in names]
+    rows = table.select(selected).take(pa.array(page)).to_pylist() if selected else [{} for _ in page]
+    if layer.oid_field not in table.column_names:
+        for row, object_id in zip(rows, layer.object_ids[page].tolist()):
+            row[layer.oid_field] = object_id
+    geometries = (table.column(GEOMETRY_COLUMN).take(pa.array(page)).to_pylist()
+                  if _flag(params, 'returnGeometry', True) else None)
+
+    if output_format == 'geojson':
+        features = ','.join(geojson_feature(row, geometries[i] if geometries else None) for i, row in enumerate(rows))
+        return f'{{"type":"FeatureCollection","exceededTransferLimit":{json.dumps(exceeded)},' \
+               f'"features":[{features}]}}', output_format
+
+    out_wkid = _wkid(params.get('outSR'))
+    if out_wkid not in WEB_MERCATOR_WKIDS and out_wkid != 4326:
+        raise QueryError(f"Unsupported outSR {out_wkid}; use 4326 or 3857")
+    generalization = Generalization(_number(params, 'maxAllowableOffset', float),
+                                    _number(params, 'geometryPrecision'))
+    features = []
+    for i, row in enumerate(rows):
+        feature = {'attributes': {name: _epoch_ms(value) for name, value in row.items()}}
+        if geometries is not None:
+            geometry = wkb_to_esri(geometries[i])
+            if geometry is not None and out_wkid in WEB_MERCATOR_WKIDS:
+                geometry = _project_geometry(geometry, wgs84_to_web_mercator)
+            feature['geometry'] = generalization.apply(geometry)
+        features.append(feature)
+    return {
+        'objectIdFieldName': layer.oid_field,
+        'geometryType': layer.metadata.get('geometry_type'),
+        'spatialReference': {'wkid': 102100, 'latestWkid': 3857} if out_wkid in WEB_MERCATOR_WKIDS
+        else SPATIAL_REFERENCE,
+        'fields': [field for field in layer.fields() if field['name'] in selected or field['name'] not in names.values()],
+        'features': features,
+        'exceededTransferLimit': exceeded
+    }, 'json'
+
+
+def arcgis_error(message: str, code: int = 400) -> Dict[str, Any]:
+    return {'error': {'code': code, 'message': 'Unable to complete operation.', 'details': [message]}}
+
+
+# --- Server ---------------------------------------------------------------------------------
+
+class TileServer:
+    """Request handlers plus the open layers, archives and response cache they share."""
+
+    def __init__(self, store: FeatureStore, tiles_dir: str = TILES_DIR, cache_bytes: int = DEFAULT_CACHE_BYTES):
+        self.store = store
+        self.tiles_dir = tiles_dir
+        self.cache = LRUCache(cache_bytes)
+        self.layers: Dict[str, StoredLayer] = {}
+        self.archives: Dict[str, Tuple[float, MBTiles]] = {}
+        self.loading: Dict[str, asyncio.Future] = {}
+
+    def archive_path(self, open_id: str) -> str:
+        return os.path.join(self.tiles_dir, f"{open_id}.mbtiles")
+
+    def archive(self, open_id: str) -> Optional[MBTiles]:
+        """Open MBTiles archive, reopened when the file is rebuilt."""
+        path = self.archive_path(open_id)
+        if not re.fullmatch(r'[\w-]+', open_id) or not os.path.exists(path):
+            return None
+        mtime = os.path.getmtime(path)
+        current = self.archives.get(open_id)
+        if current is None or current[0] != mtime:
+            if current is not None:
+                current[1].close()
+            self.archives[open_id] = (mtime, MBTiles(path))
+        return self.archives[open_id][1]
+
+    async def layer(self, open_id: str) -> Optional[StoredLayer]:
+        """Stored layer, loaded once in a worker thread and reloaded when the file changes."""
+        if not re.fullmatch(r'[\w-]+', open_id) or open_id not in self.store:
+            return None
+        current = self.layers.get(open_id)
+        if current is not None and current.mtime == os.path.getmtime(self.store.path(open_id)):
+            return current
+        if open_id not in self.loading:
+            loop = asyncio.get_running_loop()
+            self.loading[open_id] = loop.run_in_executor(None, StoredLayer, self.store, open_id)
+        try:
+            self.layers[open_id] = await asyncio.shield(self.loading[open_id])
+        finally:
+            self.loading.pop(open_id, None)
+        return self.layers[open_id]
+
+    async def cached(self, request, key: Tuple, build: Callable[[], Optional[Prepared]]):
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = await asyncio.get_running_loop().run_in_executor(None, build)
+            if entry is None:
+                return web.Response(status=204, headers={'Access-Control-Allow-Origin': '*'})
+            self.cache.put(key, entry)
+        return respond(request, entry)
+
+    # Tiles
+
+    async def tile(self, request):
+        open_id = request.match_info['open_id']
+        z, x, y = (int(request.match_info[name]) for name in ('z', 'x', 'y'))
+        archive = self.archive(open_id)
+        if archive is None:
+            return web.json_response({'error': f"No tiles for {open_id}"}, status=404)
+        entry = self.cache.get(('tile', open_id, self.archives[open_id][0], z, x, y))
+        if entry is None:
+            data = archive.get(z, x, y)
+            if data is None:
+                # Empty tile: nothing there at this zoom, which MapLibre expects as 204
+                return web.Response(status=204, headers={'Access-Control-Allow-Origin': '*'})
+            etag = '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+            entry = Prepared(None, data, etag, 'application/vnd.mapbox-vector-tile', TILE_MAX_AGE)
+            self.cache.put(('tile', open_id, self.archives[open_id][0], z, x, y), entry)
+        return respond(request, entry)
+
+    async def tilejson(self, request):
+        open_id = request.match_info['open_id']
+        archive = self.archive(open_id)
+        if archive is None:
+            return web.json_response({'error': f"No tiles for {open_id}"}, status=404)
+        metadata = archive.metadata()
+        base = f"{request.scheme}://{request.host}"
+        document = {
+            'tilejson': '3.0.0',
+            'name': metadata.get('name'),
+            'scheme': 'xyz',
+            'tiles': [f"{base}/tiles/{open_id}/{{z}}/{{x}}/{{y}}.pbf"],
+            'minzoom': int(metadata.get('minzoom', 0)),
+            'maxzoom': int(metadata.get('maxzoom', 14)),
+            'bounds': [float(value) for value in metadata['bounds'].split(',')] if metadata.get('bounds') else None,
+            'vector_layers': json.loads(metadata.get('json') or '{}').get('vector_layers', [])
+        }
+        return respond(request, prepare_json(document, TILE_MAX_AGE))
+
+    async def mbtiles(self, request):
+        open_id = request.match_info['open_id']
+        if self.archive(open_id) is None:
+            return web.json_response({'error': f"No tiles for {open_id}"}, status=404)
+        # FileResponse handles Range, If-None-Match and If-Modified-Since itself
+        return web.FileResponse(self.archive_path(open_id), headers={'Access-Control-Allow-Origin': '*'})
+
+    # Features
+
+    async def service(self, request):
+        layer = await self.layer(request.match_info['open_id'])
+        if layer is None:
+            return respond(request, prepare_json(arcgis_error("Service not found", 404)))
+        document = {
+            'currentVersion': 11.1,
+            'serviceDescription': f"Local mirror of {layer.metadata.get('layer_url') or layer.open_id}",
+            'maxRecordCount': MAX_RECORD_COUNT,
+            'spatialReference': SPATIAL_REFERENCE,
+            'capabilities': 'Query',
+            'layers': [{'id': 0, 'name': layer.layer_info()['name'],
+                        'geometryType': layer.metadata.get('geometry_type')}],
+            'tables': []
+        }
+        return respond(request, prepare_json(document))
+
+    async def layer_document(self, request):
+        layer = await self.layer(request.match_info['open_id'])
+        if layer is None:
+            return respond(request, prepare_json(arcgis_error("Layer not found", 404)))
+        return await self.cached(request, ('info', layer.open_id, layer.mtime),
+                                 lambda: prepare_json(layer.layer_info()))
+
+    async def query(self, request):
+        layer = await self.layer(request.match_info['open_id'])
+        if layer is None:
+            return respond(request, prepare_json(arcgis_error("Layer not found", 404)))
+        params = dict(request.query)
+        if request.method == 'POST':
+            params.update(await request.post())
+        params = {name: str(value) for name, value in params.items()}
+
+        def build() -> Prepared:
+            try:
+                document, output_format = query_layer(layer, params)
+            except QueryError as e:
+                # ArcGIS reports errors with HTTP 200 and an error document
+                return prepare_json(arcgis_error(str(e)), 0)
+            if output_format == 'geojson':
+                body = document if isinstance(document, str) else json.dumps(document)
+                return prepare(body.encode('utf-8'), 'application/geo+json; charset=utf-8', QUERY_MAX_AGE)
+            return prepare_json(document)
+
+        key = ('query', layer.open_id, layer.mtime, tuple(sorted((k, v) for k, v in params.items() if k != 'token')))
+        return await self.cached(request, key, build)
+
+    async def stats(self, request):
+        return web.json_response({**self.cache.stats, 'entries': len(self.cache.entries), 'bytes': self.cache.size})
+
+
+def create_app(store: Optional[FeatureStore] = None, tiles_dir: str = TILES_DIR,
+               cache_bytes: int = DEFAULT_CACHE_BYTES):
+    if web is None:
+        raise RuntimeError("tile_server.py requires aiohttp (pip install aiohttp)")
+    server = TileServer(store or FeatureStore(), tiles_dir, cache_bytes)
+    app = web.Application()
+    app['server'] = server
+    app.router.add_get(r'/tiles/{open_id:[\w-]+}/{z:\d+}/{x:\d+}/{y:\d+}.pbf', server.tile)
+    app.router.add_get(r'/tiles/{open_id:[\w-]+}.json', server.tilejson)
+    app.router.add_get(r'/tiles/{open_id:[\w-]+}.mbtiles', server.mbtiles)
+    app.router.add_get(r'/features/{open_id:[\w-]+}/FeatureServer', server.service)
+    app.router.add_get(r'/features/{open_id:[\w-]+}/FeatureServer/0', server.layer_document)
+    app.router.add_route('*', r'/features/{open_id:[\w-]+}/FeatureServer/0/query', server.query)
+    app.router.add_get('/stats', server.stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stored layers as vector tiles and ArcGIS-style /query")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--store', default=FEATURE_STORE_DIR, help="feature store directory")
+    parser.add_argument('--tiles', default=TILES_DIR, help="directory of <open_id>.mbtiles archives")
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help="in-memory response cache size")
+    args = parser.parse_args()
+
+    try:
+        app = create_app(FeatureStore(args.store), args.tiles, args.cache_mb * 1024 * 1024)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+    base = f"http://{args.host}:{args.port}"
+    print(f"Serving {len(app['server'].store.open_ids())} stored layers")
+    print(f"  Feature layers: {base}/features/<open_id>/FeatureServer/0")
+    print(f"  Vector tiles:   {base}/tiles/<open_id>/{{z}}/{{x}}/{{y}}.pbf  (TileJSON: {base}/tiles/<open_id>.json)")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
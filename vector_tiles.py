@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Vector Tile Pipeline
+Pre-renders stored layers (feature_store.py) as Mapbox Vector Tiles into an MBTiles archive, so
+dense national layers can be drawn from local tiles instead of raw FeatureServer queries.
+
+For each zoom level, features are assigned to the tiles their (buffered) bounds touch. Every tile is
+then rendered on its own, in a process pool:
+  - project to the tile's 4096-unit grid
+  - clip to the tile plus a small buffer
+  - simplify lines and polygons with Douglas-Peucker at about a quarter of a pixel
+  - below the top zoom, keep one point per pixel
+The MVT protobuf is written directly, so nothing beyond NumPy is needed. Tiles are gzip-compressed,
+as the MBTiles spec expects for pbf.
+
+    python3 vector_tiles.py <open_id> --maxzoom 12        # writes .cache/tiles/<open_id>.mbtiles
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import struct
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+from esri_geometry import WKB_LINESTRING, WKB_POINT, WKB_POLYGON, ring_area
+from feature_store import FEATURE_STORE_DIR, GEOMETRY_COLUMN, FeatureStore
+from generalize import quantize, simplify
+from hifld_catalog import REPO_DIR
+from spatial_filter import clip_ring
+from spatial_index import geometry_bounds
+
+TILES_DIR = os.path.join(REPO_DIR, '.cache', 'tiles')
+EXTENT = 4096
+BUFFER = 64
+# Douglas-Peucker tolerance in tile units (16 units = one 256-px pixel)
+SIMPLIFY_TOLERANCE = 4.0
+PIXEL = EXTENT // 256
+# Tiles sent to a worker per task, and tasks in flight per worker; bounds memory on big layers
+TILE_CHUNK = 16
+TASKS_PER_WORKER = 4
+MAX_LATITUDE = 85.0511287798
+
+MVT_POINT, MVT_LINESTRING, MVT_POLYGON = 1, 2, 3
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+
+
+# --- Web Mercator tile math -------------------------------------------------------------------
+
+def mercator(lon, lat) -> Tuple[np.ndarray, np.ndarray]:
+    """Normalized Web Mercator: (0, 0) is the top-left of the world, (1, 1) the bottom-right."""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    return (lon + 180) / 360, (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2
+
+
+# --- MVT protobuf encoding ----------------------------------------------------------------------
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """Length-delimited field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(number: int, values: Sequence[int]) -> bytes:
+    return _field(number, b''.join(_varint(value) for value in values))
+
+
+def _value(value: Any) -> bytes:
+    if isinstance(value, bool):
+        return _varint(7 << 3) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _varint(5 << 3) + _varint(value)
+        return _varint(6 << 3) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _varint(3 << 3 | 1) + struct.pack('<d', value)
+    return _field(1, str(value).encode('utf-8'))
+
+
+class _GeometryEncoder:
+    """MVT command stream; the cursor carries over between parts of a feature."""
+
+    def __init__(self):
+        self.commands: List[int] = []
+        self.x = self.y = 0
+
+    def _moves(self, points: np.ndarray):
+        for px, py in points.tolist():
+            self.commands += [_zigzag(px - self.x), _zigzag(py - self.y)]
+            self.x, self.y = px, py
+
+    def points(self, points: np.ndarray):
+        self.commands.append(len(points) << 3 | MOVE_TO)
+        self._moves(points)
+
+    def line(self, points: np.ndarray, closed: bool = False):
+        self.commands.append(1 << 3 | MOVE_TO)
+        self._moves(points[:1])
+        self.commands.append((len(points) - 1) << 3 | LINE_TO)
+        self._moves(points[1:])
+        if closed:
+            self.commands.append(1 << 3 | CLOSE_PATH)
+
+
+class LayerEncoder:
+    """Accumulates features for one tile layer, sharing key and value tables."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.features: List[bytes] = []
+        self.keys: Dict[str, int] = {}
+        self.values: Dict[Tuple[type, Any], int] = {}
+
+    def add(self, geometry_type: int, commands: List[int], properties: Dict[str, Any],
+            feature_id: Optional[int] = None):
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if isinstance(value, datetime):
+                value = int(value.timestamp() * 1000)
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        feature = b''
+        if isinstance(feature_id, int) and feature_id >= 0:
+            feature += _varint(1 << 3) + _varint(feature_id)
+        feature += _packed(2, tags) + _varint(3 << 3) + _varint(geometry_type) + _packed(4, commands)
+        self.features.append(feature)
+
+    def encode(self) -> bytes:
+        layer = _varint(15 << 3) + _varint(2) + _field(1, self.name.encode('utf-8'))
+        layer += b''.join(_field(2, feature) for feature in self.features)
+        layer += b''.join(_field(3, key.encode('utf-8')) for key in self.keys)
+        layer += b''.join(_field(4, _value(value)) for _, value in self.values)
+        layer += _varint(5 << 3) + _varint(EXTENT)
+        return _field(3, layer)
+
+
+# --- Clipping and simplification in tile space -------------------------------------------------
+
+def clip_line(points: np.ndarray, low: float, high: float) -> List[np.ndarray]:
+    """Liang-Barsky clip of a polyline to the square [low, high]^2, split where it leaves.
+
+    Every segment is clipped in one NumPy pass; consecutive segments that stay inside are then
+    joined back into parts.
+    """
+    if len(points) < 2:
+        return []
+    if points.min() >= low and points.max() <= high:
+        return [points]
+    start, delta = points[:-1], points[1:] - points[:-1]
+    t0 = np.zeros(len(delta))
+    t1 = np.ones(len(delta))
+    kept = np.ones(len(delta), dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for axis in (0, 1):
+            for p, q in ((-delta[:, axis], start[:, axis] - low), (delta[:, axis], high - start[:, axis])):
+                kept &= (p != 0) | (q >= 0)
+                t = q / p
+                t0 = np.where(p < 0, np.maximum(t0, t), t0)
+                t1 = np.where(p > 0, np.minimum(t1, t), t1)
+    kept &= t0 <= t1
+    entry = start + t0[:, None] * delta
+    exit_ = start + t1[:, None] * delta
+
+    # A segment continues the previous part when both are kept and the line never left in between
+    joined = kept[1:] & kept[:-1] & (t1[:-1] == 1) & (t0[1:] == 0)
+    first = np.flatnonzero(kept & ~np.concatenate(([False], joined)))
+    last = np.flatnonzero(kept & ~np.concatenate((joined, [False])))
+    return [np.vstack([entry[i:i + 1], exit_[i:j + 1]]) for i, j in zip(first, last)]
+
+
+def read_wkb(wkb: bytes) -> Tuple[int, List[Any]]:
+    """(MVT geometry type, parts) from WKB written by esri_geometry.to_wkb.
+
+    Parts are coordinate arrays read straight from the buffer: a single array of points, a list of
+    lines, or a list of polygons each given as a list of rings.
+    """
+    def read(offset: int) -> Tuple[int, Any, int]:
+        wkb_type = int.from_bytes(wkb[offset + 1:offset + 5], 'little')
+        offset += 5
+        if wkb_type == WKB_POINT:
+            return MVT_POINT, np.frombuffer(wkb, '<f8', 2, offset).reshape(1, 2), offset + 16
+        count = int.from_bytes(wkb[offset:offset + 4], 'little')
+        offset += 4
+        if wkb_type == WKB_LINESTRING:
+            return MVT_LINESTRING, np.frombuffer(wkb, '<f8', count * 2, offset).reshape(count, 2), offset + count * 16
+        if wkb_type == WKB_POLYGON:
+            rings = []
+            for _ in range(count):
+                size = int.from_bytes(wkb[offset:offset + 4], 'little')
+                rings.append(np.frombuffer(wkb, '<f8', size * 2, offset + 4).reshape(size, 2))
+                offset += 4 + size * 16
+            return MVT_POLYGON, rings, offset
+        parts = []
+        for _ in range(count):
+            kind, part, offset = read(offset)
+            parts.append(part)
+        if kind == MVT_POINT:
+            return kind, np.vstack(parts) if parts else np.empty((0, 2)), offset
+        return kind, parts, offset
+
+    kind, parts, _ = read(0)
+    if kind == MVT_LINESTRING and isinstance(parts, np.ndarray):
+        parts = [parts]
+    elif kind == MVT_POLYGON and parts and isinstance(parts[0], np.ndarray):
+        parts = [parts]
+    return kind, parts
+
+
+def _tile_coords(coords: np.ndarray, z: int, x: int, y: int) -> np.ndarray:
+    mx, my = mercator(coords[:, 0], coords[:, 1])
+    n = 2 ** z
+    return np.column_stack([(mx * n - x) * EXTENT, (my * n - y) * EXTENT])
+
+
+def _finish(points: np.ndarray) -> np.ndarray:
+    return quantize(simplify(points, SIMPLIFY_TOLERANCE), 0).astype(np.int64)
+
+
+def render_geometry(wkb: bytes, z: int, x: int, y: int, encoder: _GeometryEncoder) -> Optional[int]:
+    """Add a WKB geometry to encoder in tile coordinates; returns its MVT type, or None if clipped away."""
+    low, high = -BUFFER, EXTENT + BUFFER
+    kind, parts = read_wkb(wkb)
+    found = False
+    if kind == MVT_POINT:
+        points = np.round(_tile_coords(parts, z, x, y)).astype(np.int64)
+        points = points[np.all((points >= low) & (points <= high), axis=1)]
+        if len(points):
+            encoder.points(points)
+            found = True
+
+    elif kind == MVT_LINESTRING:
+        for line in parts:
+            for part in clip_line(_tile_coords(line, z, x, y), low, high):
+                part = _finish(part)
+                if len(part) >= 2:
+                    encoder.line(part)
+                    found = True
+
+    else:
+        for rings in parts:
+            for i, ring in enumerate(rings):
+                ring = _tile_coords(ring, z, x, y)
+                if ring.min() < low or ring.max() > high:
+                    ring = np.asarray(clip_ring(ring.tolist(), low, low, high, high))
+                part = _finish(ring) if len(ring) else ring
+                if len(part) < 4:
+                    if i == 0:
+                        break  # outer ring gone: its holes go with it
+                    continue
+                # MVT wants exterior rings with positive area in tile (y-down) coordinates, holes negative
+                if (ring_area(part.tolist()) > 0) != (i == 0):
+                    part = part[::-1]
+                encoder.line(part[:-1], closed=True)
+                found = True
+    return kind if found else None
+
+
+# --- Tile rendering (runs in worker processes) ---------------------------------------------------
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(store_root: str, open_id: str, fields: Optional[Sequence[str]], max_zoom: int):
+    store = FeatureStore(store_root)
+    table = store.read(open_id)
+    metadata = store.metadata(open_id)
+    columns = [name for name in table.column_names if name != GEOMETRY_COLUMN]
+    _worker.update({
+        'table': table,
+        'fields': [name for name in columns if fields is None or name in fields],
+        'oid_field': metadata.get('object_id_field'),
+        'name': metadata.get('name') or open_id,
+        'max_zoom': max_zoom
+    })
+
+
+def render_tile(task: Tuple[int, int, int, np.ndarray]) -> Tuple[int, int, int, Optional[bytes]]:
+    """Encode and gzip one tile from the rows at positions."""
+    z, x, y, positions = task
+    table = _worker['table'].take(positions)
+    geometries = table.column(GEOMETRY_COLUMN).to_pylist()
+    properties = {name: table.column(name).to_pylist() for name in _worker['fields']}
+    object_ids = table.column(_worker['oid_field']).to_pylist() if _worker['oid_field'] in table.column_names \
+        else [None] * len(geometries)
+
+    layer = LayerEncoder(_worker['name'])
+    thin = z < _worker['max_zoom']
+    occupied = set()
+    for row, wkb in enumerate(geometries):
+        if wkb is None:
+            continue
+        encoder = _GeometryEncoder()
+        geometry_type = render_geometry(wkb, z, x, y, encoder)
+        if geometry_type is None:
+            continue
+        if thin and geometry_type == MVT_POINT:
+            # Below the top zoom, one point per pixel is all that can be seen
+            pixel = (encoder.x // PIXEL, encoder.y // PIXEL)
+            if pixel in occupied:
+                continue
+            occupied.add(pixel)
+        layer.add(geometry_type, encoder.commands, {name: values[row] for name, values in properties.items()},
+                  object_ids[row])
+    if not layer.features:
+        return z, x, y, None
+    return z, x, y, gzip.compress(layer.encode(), 6)
+
+
+def render_tiles(tasks: List[Tuple[int, int, int, np.ndarray]]) -> List[Tuple[int, int, int, Optional[bytes]]]:
+    return [render_tile(task) for task in tasks]
+
+
+def _render_bounded(pool: ProcessPoolExecutor, tasks: Iterator, window: int) -> Iterator:
+    """render_tile results in task order, with at most window chunks submitted but not yet consumed."""
+    chunks = iter(lambda: list(itertools.islice(tasks, TILE_CHUNK)), [])
+    pending = deque(pool.submit(render_tiles, chunk) for chunk in itertools.islice(chunks, window))
+    while pending:
+        results = pending.popleft().result()
+        for chunk in itertools.islice(chunks, 1):
+            pending.append(pool.submit(render_tiles, chunk))
+        yield from results
+
+
+def tile_tasks(bounds: np.ndarray, z: int) -> Iterator[Tuple[int, int, int, np.ndarray]]:
+    """(z, x, y, feature positions) for every tile the buffered feature bounds touch at zoom z."""
+    n = 2 ** z
+    pad = BUFFER / EXTENT
+    west, north = mercator(bounds[:, 0], bounds[:, 3])
+    east, south = mercator(bounds[:, 2], bounds[:, 1])
+    x0 = np.clip(np.floor(west * n - pad), 0, n - 1).astype(np.int64)
+    x1 = np.clip(np.floor(east * n + pad), 0, n - 1).astype(np.int64)
+    y0 = np.clip(np.floor(north * n - pad), 0, n - 1).astype(np.int64)
+    y1 = np.clip(np.floor(south * n + pad), 0, n - 1).astype(np.int64)
+
+    # Expand every feature into one (tile, feature) pair per tile of its range
+    widths = x1 - x0 + 1
+    counts = widths * (y1 - y0 + 1)
+    feature = np.repeat(np.arange(len(bounds)), counts)
+    offset = np.arange(len(feature)) - np.repeat(np.cumsum(counts) - counts, counts)
+    tx = x0[feature] + offset % widths[feature]
+    ty = y0[feature] + offset // widths[feature]
+
+    keys = ty * n + tx
+    order = np.argsort(keys, kind='stable')
+    keys, feature = keys[order], feature[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys))
+    for start, end in zip(starts, ends):
+        key = int(keys[start])
+        yield z, key % n, key // n, feature[start:end]
+
+
+# --- MBTiles ----------------------------------------------------------------------------------
+
+class MBTiles:
+    """MBTiles 1.3 archive: TMS-ordered tiles table plus name/value metadata."""
+
+    def __init__(self, path: str, create: bool = False):
+        self.path = path
+        if create:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if create:
+            self.conn.executescript("""
+                CREATE TABLE metadata (name TEXT, value TEXT);
+                CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+                CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+            """)
+
+    def put(self, z: int, x: int, y: int, data: bytes):
+        self.conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, 2 ** z - 1 - y, data))
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        row = self.conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2 ** z - 1 - y)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_metadata(self, metadata: Dict[str, Any]):
+        self.conn.execute("DELETE FROM metadata")
+        self.conn.executemany("INSERT INTO metadata VALUES (?, ?)",
+                              [(name, value if isinstance(value, str) else json.dumps(value))
+                               for name, value in metadata.items()])
+
+    def metadata(self) -> Dict[str, str]:
+        return dict(self.conn.execute("SELECT name, value FROM metadata"))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def _field_type(arrow_type) -> str:
+    """TileJSON vector_layers field type."""
+    if pa.types.is_boolean(arrow_type):
+        return 'Boolean'
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_timestamp(arrow_type):
+        return 'Number'
+    return 'String'
+
+
+def build_tiles(open_id: str, output: Optional[str] = None, min_zoom: int = 0, max_zoom: int = 12,
+                store: Optional[FeatureStore] = None, fields: Optional[Sequence[str]] = None,
+                processes: Optional[int] = None) -> Dict[str, int]:
+    """Render a stored layer to an MBTiles archive; returns tile and byte counts."""
+    store = store or FeatureStore()
+    output = output or os.path.join(TILES_DIR, f"{open_id}.mbtiles")
+    table = store.read(open_id, [GEOMETRY_COLUMN])
+    positions, bounds = geometry_bounds(table.column(GEOMETRY_COLUMN))
+    metadata = store.metadata(open_id)
+    name = metadata.get('name') or open_id
+
+    def tasks():
+        for z in range(min_zoom, max_zoom + 1):
+            for tz, tx, ty, features in tile_tasks(bounds, z):
+                yield tz, tx, ty, positions[features]
+
+    archive = MBTiles(output, create=True)
+    stats = {'tiles': 0, 'bytes': 0}
+    init_args = (store.root, open_id, fields, max_zoom)
+    processes = processes or os.cpu_count() or 1
+    if processes > 1:
+        pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=init_args)
+        results = _render_bounded(pool, tasks(), processes * TASKS_PER_WORKER)
+    else:
+        pool = None
+        _init_worker(*init_args)
+        results = map(render_tile, tasks())
+
+    try:
+        for z, x, y, data in results:
+            if data is None:
+                continue
+            archive.put(z, x, y, data)
+            stats['tiles'] += 1
+            stats['bytes'] += len(data)
+            if stats['tiles'] % 1000 == 0:
+                archive.commit()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    west, south = bounds[:, 0].min(), bounds[:, 1].min()
+    east, north = bounds[:, 2].max(), bounds[:, 3].max()
+    schema = store.read(open_id).schema
+    columns = {field.name: _field_type(field.type) for field in schema
+               if field.name != GEOMETRY_COLUMN and (fields is None or field.name in fields)}
+    archive.set_metadata({
+        'name': name,
+        'format': 'pbf',
+        'type': 'overlay',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': f"{west},{south},{east},{north}",
+        'center': f"{(west + east) / 2},{(south + north) / 2},{min_zoom}",
+        'json': {'vector_layers': [{'id': name, 'minzoom': min_zoom, 'maxzoom': max_zoom,
+                                    'fields': columns}]}
+    })
+    archive.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render a stored layer as vector tiles (MBTiles)")
+    parser.add_argument('open_id', help="Open ID of a layer in the feature store")
+    parser.add_argument('--output', default=None, help="MBTiles file (default: .cache/tiles/<open_id>.mbtiles)")
+    parser.add_argument('--minzoom', type=int, default=0)
+    parser.add_argument('--maxzoom', type=int, default=12)
+    parser.add_argument('--fields', default=None, help="comma-separated attributes to keep (default: all)")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--store', default=FEATURE_STORE_DIR, help="feature store directory")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    fields = args.fields.split(',') if args.fields else None
+    stats = build_tiles(args.open_id, args.output, args.minzoom, args.maxzoom, FeatureStore(args.store),
+                        fields, args.processes)
+    print(f"Rendered {stats['tiles']} tiles ({stats['bytes'] / 1e6:.1f} MB) in {time.time() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()